@@ -1,31 +1,188 @@
 
 # XX-Job 主程序入口
 
+import atexit
+import json
 import os
 import sys
 import webbrowser
 import threading
 import time
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 
 # 添加核心模块路径
 sys.path.append(os.path.join(os.path.dirname(__file__), 'core'))
 
-from core.storage import Storage
+from core import config, metrics
+from core.diagnostics import debug_enabled, get_logger, mask_secrets, setup_logging
+from core.storage import NodeLogs, Storage
 from core.api_client import ApiClient
+from core.async_client import AsyncApiClient
+from core.cluster import ClusterNode, ClusterStore, default_node_id
+from core.events import EventBus
+from core.host_guard import HostGuard, HostGuardServer
+from core.http_pool import SessionPool
 from core.logger import TaskLogger
+from core.response_cache import ResponseCache
+from core.log_writer import LogWriter
+from core.log_compactor import LogCompactor
 from core.scheduler import TaskScheduler
+from core.stream import check_streaming
+from core.worker_pool import WorkerPool
+
+# 配置运行日志
+setup_logging(config.LOG_LEVEL, config.LOG_FORMAT)
+app_log = get_logger('app')
+check_streaming(config.STREAM_BUFFER_MAX_BYTES)
 
 # 创建Flask应用
 app = Flask(__name__)
 app.config['JSON_AS_ASCII'] = False  # 确保JSON响应使用UTF-8编码
 
+# 按主机限流和熔断，所有调用链共用，多进程引擎的工作进程通过 HostGuardServer 共用主进程中的这一份
+host_guard = HostGuard(
+    rate=config.HOST_RATE_LIMIT,
+    burst=config.HOST_RATE_BURST,
+    max_wait=config.HOST_RATE_MAX_WAIT,
+    breaker=config.CIRCUIT_BREAKER_ENABLED,
+    window=config.CIRCUIT_WINDOW,
+    min_requests=config.CIRCUIT_MIN_REQUESTS,
+    failure_rate=config.CIRCUIT_FAILURE_RATE,
+    open_seconds=config.CIRCUIT_OPEN_SECONDS,
+    half_open_max=config.CIRCUIT_HALF_OPEN_MAX
+)
+
+# 开启缓存的 GET 步骤共用的响应缓存(多进程引擎的每个工作进程各有一份)
+response_cache = ResponseCache(
+    max_entries=config.RESPONSE_CACHE_MAX_ENTRIES,
+    max_bytes=config.RESPONSE_CACHE_MAX_BYTES,
+    default_ttl=config.RESPONSE_CACHE_TTL
+)
+
+# 可选的多进程执行引擎，工作进程以 fork 方式启动，需在创建其他后台线程之前启动
+worker_pool = None
+if config.EXECUTION_ENGINE == 'process':
+    host_guard_server = HostGuardServer(host_guard)
+    try:
+        worker_pool = WorkerPool(
+            config.WORKER_PROCESSES,
+            pool_options={
+                'pool_maxsize': config.HTTP_POOL_MAXSIZE,
+                'pool_block': config.HTTP_POOL_BLOCK,
+                'keep_alive': config.HTTP_KEEP_ALIVE,
+                'idle_timeout': config.HTTP_IDLE_TIMEOUT,
+                'max_hosts': config.HTTP_MAX_HOSTS
+            },
+            client_options={
+                'error_text_max': config.ERROR_TEXT_MAX_CHARS,
+                'stream_max_bytes': config.STREAM_MAX_RESPONSE_BYTES,
+                'stream_chunk_size': config.STREAM_CHUNK_SIZE,
+                'stream_buffer_max_bytes': config.STREAM_BUFFER_MAX_BYTES,
+                'host_guard': host_guard_server.client(),
+                'response_cache': response_cache
+            }
+        )
+        host_guard_server.start()
+    except RuntimeError as e:
+        app_log.warning('多进程执行引擎不可用，改用线程执行', extra={'fields': {'error': str(e)}})
+
+# 集群模式下每个节点的日志单独存放
+node_id = config.CLUSTER_NODE_ID or default_node_id()
+log_data_dir = os.path.join(config.DATA_DIR, 'nodes', node_id) if config.CLUSTER_ENABLED else None
+
 # 初始化核心组件
-storage = Storage()
-api_client = ApiClient()
-logger = TaskLogger(storage)
-scheduler = TaskScheduler(storage, api_client, logger)
+storage = Storage(
+    config.DATA_DIR,
+    log_segment_max_bytes=config.LOG_SEGMENT_MAX_BYTES,
+    log_fsync=config.LOG_FSYNC,
+    log_segment_max_age=config.LOG_SEGMENT_MAX_AGE,
+    blob_compress=config.LOG_BLOB_COMPRESS,
+    blob_orphan_grace=config.LOG_BLOB_ORPHAN_GRACE,
+    log_data_dir=log_data_dir,
+    shared_tasks=config.CLUSTER_ENABLED
+)
+# 集群模式下按 node 参数查看其他节点的日志
+node_logs = NodeLogs(config.DATA_DIR, node_id, storage) if config.CLUSTER_ENABLED else None
+api_client = ApiClient(SessionPool(
+    pool_maxsize=config.HTTP_POOL_MAXSIZE,
+    pool_block=config.HTTP_POOL_BLOCK,
+    keep_alive=config.HTTP_KEEP_ALIVE,
+    idle_timeout=config.HTTP_IDLE_TIMEOUT,
+    max_hosts=config.HTTP_MAX_HOSTS
+),
+    error_text_max=config.ERROR_TEXT_MAX_CHARS,
+    stream_max_bytes=config.STREAM_MAX_RESPONSE_BYTES,
+    stream_chunk_size=config.STREAM_CHUNK_SIZE,
+    stream_buffer_max_bytes=config.STREAM_BUFFER_MAX_BYTES,
+    host_guard=host_guard,
+    response_cache=response_cache
+)
+log_writer = LogWriter(
+    storage,
+    batch_size=config.LOG_BATCH_SIZE,
+    flush_interval=config.LOG_FLUSH_INTERVAL,
+    max_queue=config.LOG_QUEUE_SIZE,
+    backpressure=config.LOG_BACKPRESSURE
+)
+events = EventBus(config.EVENT_BUFFER_SIZE)
+logger = TaskLogger(storage, log_writer, inline_max_bytes=config.LOG_INLINE_MAX_BYTES, events=events)
+log_compactor = LogCompactor(
+    storage,
+    interval=config.LOG_COMPACT_INTERVAL,
+    max_age_days=config.LOG_RETENTION_DAYS,
+    max_per_task=config.LOG_RETENTION_PER_TASK,
+    max_bytes=config.LOG_RETENTION_MAX_BYTES,
+    compress=config.LOG_ARCHIVE_COMPRESS
+)
+
+# 可选的异步执行引擎
+async_client = None
+if config.EXECUTION_ENGINE == 'async':
+    try:
+        async_client = AsyncApiClient(
+            api_client,
+            max_concurrency=config.ASYNC_MAX_CONCURRENCY,
+            per_host_limit=config.ASYNC_PER_HOST_LIMIT
+        )
+    except RuntimeError as e:
+        app_log.warning('异步执行引擎不可用，改用线程执行', extra={'fields': {'error': str(e)}})
+
+# 可选的集群模式
+cluster = None
+if config.CLUSTER_ENABLED:
+    cluster = ClusterNode(
+        ClusterStore(
+            config.CLUSTER_DB or os.path.join(config.DATA_DIR, 'cluster.db'),
+            node_id,
+            lease_seconds=config.CLUSTER_LEASE_SECONDS
+        ),
+        heartbeat_interval=config.CLUSTER_HEARTBEAT_INTERVAL,
+        poll_interval=config.CLUSTER_POLL_INTERVAL,
+        max_pending=config.SCHEDULER_MAX_PENDING
+    )
+
+scheduler = TaskScheduler(
+    storage, api_client, logger,
+    max_workers=config.SCHEDULER_MAX_WORKERS,
+    max_pending=config.SCHEDULER_MAX_PENDING,
+    async_client=async_client,
+    cluster=cluster,
+    worker_pool=worker_pool,
+    events=events
+)
+
+def shutdown():
+    """退出时先断开推送连接并停止调度，再写完剩余日志"""
+    events.close()
+    scheduler.shutdown()
+    api_client.close()
+    log_compactor.close()
+    logger.close()
+    if node_logs is not None:
+        node_logs.close()
+
+atexit.register(shutdown)
 
 # 路由定义
 @app.route('/')
@@ -44,36 +201,56 @@ def logs():
     return render_template('logs.html')
 
 # API路由
+def log_storage():
+    """
+    请求参数 node 指定节点的日志存储
+
+    集群模式下每个节点只写自己的日志，不带 node 参数时为本节点；非集群模式忽略该参数。
+    节点不存在时返回 None。
+    """
+    if node_logs is None:
+        return storage
+    return node_logs.get(request.args.get('node'))
+
 @app.route('/api/stats')
 def get_stats():
-    """获取系统统计数据"""
+    """获取系统统计数据，集群模式下今日执行情况为 node 参数指定的节点(默认本节点)"""
+    log_source = log_storage()
+    if log_source is None:
+        return jsonify({'error': '节点不存在'}), 404
+
     tasks = storage.load_tasks()
     active_tasks = [task for task in tasks if task['status'] == 'active']
 
-    # 获取今日执行日志
+    # 从按天聚合的计数中获取今日执行情况
     today = datetime.now().strftime('%Y-%m-%d')
-    all_logs = storage.load_logs(limit=1000)
-    today_logs = [log for log in all_logs if log['timestamp'].startswith(today)]
+    today_counts = log_source.get_log_stats(today)
 
     # 计算成功率
-    success_count = len([log for log in today_logs if log['status'] == 'success'])
-    total_count = len([log for log in today_logs if log['status'] in ['success', 'failure']])
+    success_count = today_counts.get('success', 0)
+    total_count = success_count + today_counts.get('failure', 0)
     success_rate = f"{int(success_count / total_count * 100)}%" if total_count > 0 else "0%"
 
     return jsonify({
         'total_tasks': len(tasks),
         'active_tasks': len(active_tasks),
-        'today_executions': len(today_logs),
-        'success_rate': success_rate
+        'today_executions': sum(today_counts.values()),
+        'today_success': success_count,
+        'today_failure': total_count - success_count,
+        'success_rate': success_rate,
+        'metrics': metrics.summary()
     })
 
+@app.route('/metrics')
+def get_metrics():
+    """按任务和步骤统计的执行次数和耗时直方图，Prometheus 文本格式"""
+    return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/tasks', methods=['GET'])
 def get_tasks():
     """获取所有任务"""
-    tasks = storage.load_tasks()
-    # 过滤掉已删除的任务
-    tasks = [task for task in tasks if task['status'] != 'deleted']
-    return jsonify(tasks)
+    # 已删除的任务不在内存热数据中
+    return jsonify(storage.list_tasks())
 
 @app.route('/api/tasks/<int:task_id>', methods=['GET'])
 def get_task(task_id):
@@ -87,12 +264,8 @@ def get_task(task_id):
 def create_task():
     """创建新任务"""
     try:
-        # 记录原始请求数据，便于调试
-        print(f"收到的原始请求数据: {request.data}")
-
         # 获取请求数据
         task_data = request.json
-        print(f"解析后的任务数据: {task_data}")
 
         # 验证必填字段
         if not task_data:
@@ -116,6 +289,10 @@ def create_task():
         elif task_type == 'interval' and not task_data.get('interval_seconds'):
             return jsonify({'error': '执行间隔不能为空'}), 400
 
+        # 验证并发配置
+        if task_data.get('overlap_policy', 'skip') not in TaskScheduler.OVERLAP_POLICIES:
+            return jsonify({'error': '无效的并发处理方式'}), 400
+
         # 验证API步骤
         steps = task_data.get('steps', [])
         if not steps:
@@ -131,16 +308,15 @@ def create_task():
                 return jsonify({'error': f'步骤 {i+1} 的请求方法不能为空'}), 400
 
         # 添加任务
-        print(f"准备添加任务: {task_data}")
+        if debug_enabled(app_log):
+            app_log.debug('准备添加任务', extra={'fields': {'task': mask_secrets(task_data)}})
         task_id = scheduler.add_task(task_data)
-        print(f"任务创建成功，ID: {task_id}")
+        app_log.info('任务创建成功', extra={'fields': {'task_id': task_id, 'name': name}})
         return jsonify({'id': task_id, 'message': '任务创建成功'})
 
     except Exception as e:
         # 捕获所有异常并返回错误信息
-        print(f"创建任务时发生错误: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        app_log.exception('创建任务时发生错误')
         return jsonify({'error': f'创建任务失败: {str(e)}'}), 500
 
 @app.route('/api/tasks/<int:task_id>', methods=['PUT'])
@@ -170,6 +346,10 @@ def update_task(task_id):
     elif task_type == 'interval' and not task_data.get('interval_seconds'):
         return jsonify({'error': '执行间隔不能为空'}), 400
 
+    # 验证并发配置
+    if task_data.get('overlap_policy', 'skip') not in TaskScheduler.OVERLAP_POLICIES:
+        return jsonify({'error': '无效的并发处理方式'}), 400
+
     # 验证API步骤
     steps = task_data.get('steps', [])
     if not steps:
@@ -227,27 +407,111 @@ def run_task_now(task_id):
     else:
         return jsonify({'error': '任务不存在'}), 404
 
+@app.route('/api/scheduler/metrics')
+def get_scheduler_metrics():
+    """获取每个任务的并发执行状态和排队等待时间"""
+    return jsonify(scheduler.get_metrics())
+
+@app.route('/api/hosts')
+def get_hosts():
+    """获取各主机的熔断状态和限流令牌，多进程引擎的工作进程也使用这里的状态"""
+    return jsonify({'hosts': host_guard.stats()})
+
+@app.route('/api/cache', methods=['GET'])
+def get_cache():
+    """获取响应缓存的条目数和大小(多进程引擎下缓存在各工作进程中，这里为空)"""
+    return jsonify(response_cache.stats())
+
+@app.route('/api/cache', methods=['DELETE'])
+def clear_cache():
+    """清空响应缓存，下次执行时重新请求"""
+    response_cache.clear()
+    return jsonify({'message': '响应缓存已清空'})
+
+@app.route('/api/cluster')
+def get_cluster():
+    """获取集群节点、主节点和触发队列状态，log_nodes 为可按 node 参数查看日志的节点"""
+    if cluster is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **cluster.stats(), 'log_nodes': node_logs.nodes()})
+
+@app.route('/api/events')
+def stream_events():
+    """
+    推送新日志和任务变更(Server-Sent Events)
+
+    集群模式下只推送本节点执行产生的日志，其他节点的日志需按 node 参数查询 /api/logs。
+
+    游标取自 Last-Event-ID 请求头(浏览器断线重连时自动带上)或 cursor 参数，
+    没有游标时只推送之后的新事件。游标已失效时推送 reset 事件，页面需重新全量加载。
+    带 poll=1 参数时改为长轮询：等待新事件后以JSON返回事件列表和下一次请求的游标。
+    """
+    cursor = request.headers.get('Last-Event-ID', type=int)
+    if cursor is None:
+        cursor = request.args.get('cursor', events.last_id, type=int)
+
+    if request.args.get('poll', 0, type=int):
+        batch, reset = events.read(cursor, config.EVENT_KEEPALIVE_INTERVAL)
+        return jsonify({
+            'cursor': events.last_id if reset else (batch[-1][0] if batch else cursor),
+            'reset': reset,
+            'events': [{'id': seq, 'type': event_type, 'data': data} for seq, event_type, data in batch]
+        })
+
+    def generate(cursor):
+        deadline = time.monotonic() + config.EVENT_STREAM_TIMEOUT
+        yield 'retry: 3000\n\n'
+        while time.monotonic() < deadline and not events.closed:
+            batch, reset = events.read(cursor, config.EVENT_KEEPALIVE_INTERVAL)
+            if reset:
+                cursor = events.last_id
+                yield f'id: {cursor}\nevent: reset\ndata: {{}}\n\n'
+            elif not batch:
+                yield ': keepalive\n\n'
+            for seq, event_type, data in batch:
+                yield f'id: {seq}\nevent: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+                cursor = seq
+
+    return Response(generate(cursor), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/logs', methods=['GET'])
 def get_logs():
-    """获取日志列表"""
+    """
+    获取日志列表
+
+    带 before_id 或 after_id 参数时按日志ID游标翻页(before_id 为空表示从最新一条开始)，
+    只读取一页且默认不统计总数，count=1 时附带总条数；否则按 page 页码分页。
+    fields 参数(逗号分隔)只返回指定字段，列表页只取摘要字段时不读取日志内容。
+    集群模式下 node 参数指定查看哪个节点的日志，默认本节点。
+    """
+    log_source = log_storage()
+    if log_source is None:
+        return jsonify({'error': '节点不存在'}), 404
+
     task_id = request.args.get('task_id', type=int)
     status = request.args.get('status')
     page = request.args.get('page', 1, type=int)
     limit = request.args.get('limit', 20, type=int)
-
-    # 获取所有日志
-    logs = storage.load_logs(task_id=task_id, limit=1000)  # 先获取足够多的日志
-
-    # 按状态过滤
-    if status:
-        logs = [log for log in logs if log['status'] == status]
-
-    # 计算分页
-    total_count = len(logs)
+    fields = [field for field in request.args.get('fields', '').split(',') if field] or None
+
+    if 'before_id' in request.args or 'after_id' in request.args:
+        page_logs, has_more = log_source.scan_logs(
+            task_id=task_id, status=status,
+            before_id=request.args.get('before_id', type=int),
+            after_id=request.args.get('after_id', type=int),
+            limit=limit, fields=fields
+        )
+        result = {'logs': page_logs, 'limit': limit, 'has_more': has_more}
+        if request.args.get('count', 0, type=int):
+            result['total_count'] = log_source.count_logs(task_id, status)
+        return jsonify(result)
+
+    # 通过索引直接定位当前页
+    page_logs, total_count = log_source.query_logs(task_id=task_id, status=status, page=page, limit=limit, fields=fields)
     total_pages = (total_count + limit - 1) // limit
-    start_index = (page - 1) * limit
-    end_index = start_index + limit
-    page_logs = logs[start_index:end_index]
 
     return jsonify({
         'logs': page_logs,
@@ -259,50 +523,52 @@ def get_logs():
 
 @app.route('/api/logs', methods=['DELETE'])
 def clear_logs():
-    """清除所有日志"""
+    """清除所有日志，集群模式下只清除本节点的日志"""
     try:
-        # 清空日志文件，写入一个空数组
-        with open(storage.logs_file, 'w', encoding='utf-8') as f:
-            f.write('[]')
+        log_writer.clear_logs()
+        events.publish('logs_cleared', {})
         return jsonify({'message': '所有日志已清除'})
     except Exception as e:
         return jsonify({'error': f'清除日志失败: {str(e)}'}), 500
 
 @app.route('/api/logs/<int:log_id>', methods=['GET'])
 def get_log(log_id):
-    """获取单个日志详情"""
-    logs = storage.load_logs(limit=1000)
-    for log in logs:
-        if log['id'] == log_id:
-            # 确保返回完整的日志信息，特别是details字段
-            if 'details' in log and isinstance(log['details'], dict):
-                # 确保details中的所有字段都被保留
-                details = log['details'].copy()
-
-                # 确保所有步骤都有完整的请求信息
-                if 'step_index' in details:
-                    # 确保请求头和请求体字段存在
-                    if 'headers' not in details:
-                        details['headers'] = {}
-                    if 'body' not in details:
-                        details['body'] = {}
-                    if 'url' not in details:
-                        details['url'] = ''
-                    if 'method' not in details:
-                        details['method'] = ''
-                    if 'status_code' not in details:
-                        details['status_code'] = None
-                    if 'response' not in details:
-                        details['response'] = None
-                    if 'extracted_params' not in details:
-                        details['extracted_params'] = {}
-
-                # 更新日志的details
-                log['details'] = details
-
-            return jsonify(log)
-
-    return jsonify({'error': '日志不存在'}), 404
+    """获取单个日志详情，集群模式下 node 参数指定日志所在的节点"""
+    log_source = log_storage()
+    log = log_source.get_log(log_id) if log_source is not None else None
+    if not log:
+        return jsonify({'error': '日志不存在'}), 404
+
+    # 移入大对象存储的字段只在查看详情时读取
+    log_source.resolve_log(log)
+
+    # 确保返回完整的日志信息，特别是details字段
+    if 'details' in log and isinstance(log['details'], dict):
+        # 确保details中的所有字段都被保留
+        details = log['details'].copy()
+
+        # 确保所有步骤都有完整的请求信息
+        if 'step_index' in details:
+            # 确保请求头和请求体字段存在
+            if 'headers' not in details:
+                details['headers'] = {}
+            if 'body' not in details:
+                details['body'] = {}
+            if 'url' not in details:
+                details['url'] = ''
+            if 'method' not in details:
+                details['method'] = ''
+            if 'status_code' not in details:
+                details['status_code'] = None
+            if 'response' not in details:
+                details['response'] = None
+            if 'extracted_params' not in details:
+                details['extracted_params'] = {}
+
+        # 更新日志的details
+        log['details'] = details
+
+    return jsonify(log)
 
 # 启动浏览器
 def open_browser():
@@ -0,0 +1,74 @@
+# 日志追加写入基准测试：历史日志增长时，单次追加的耗时应保持平稳
+#
+# 用法: python bench/log_append.py [--history 200000] [--step 20000] [--sample 500]
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.storage import Storage
+
+
+def make_log(i):
+    """构造一条与步骤日志体量相近的日志"""
+    return {
+        'task_id': i % 10 + 1,
+        'task_name': f'task-{i % 10 + 1}',
+        'event': 'step',
+        'status': 'success',
+        'message': f'步骤 1 "login" 执行成功',
+        'details': {
+            'step_index': 0,
+            'step_name': 'login',
+            'url': 'http://localhost:3000/api/auth/login',
+            'method': 'POST',
+            'status_code': 200,
+            'response': {'success': True, 'data': {'token': 'x' * 160}},
+            'extracted_params': {'token': 'x' * 160},
+            'headers': {},
+            'body': {'account': 'admin', 'password': '123456'}
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='日志追加写入基准测试')
+    parser.add_argument('--history', type=int, default=200000, help='最终历史日志条数')
+    parser.add_argument('--step', type=int, default=20000, help='每次测量之间写入的日志条数')
+    parser.add_argument('--sample', type=int, default=500, help='每次测量的追加次数')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        storage = Storage(data_dir, log_fsync=False)  # 只测量追加开销随历史增长的变化
+        written = 0
+        while written < args.history:
+            # 先填充历史日志
+            storage.log_store.import_logs(make_log(i) for i in range(args.step))
+            written += args.step
+
+            # 再测量单次追加耗时
+            start = time.perf_counter()
+            for i in range(args.sample):
+                storage.add_log(make_log(i))
+            elapsed = time.perf_counter() - start
+            written += args.sample
+
+            results.append({
+                'history': written,
+                'append_us': round(elapsed / args.sample * 1e6, 2)
+            })
+            print(f"历史日志 {written:>8} 条, 单次追加 {results[-1]['append_us']:>8.2f} us", file=sys.stderr)
+
+        storage.log_store.close()
+
+    print(json.dumps({'benchmark': 'log_append', 'results': results}, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
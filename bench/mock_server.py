@@ -0,0 +1,125 @@
+# 基准测试用的本地模拟API服务，响应延迟和响应体大小可配置
+#
+# 用法: python bench/mock_server.py [--port 18100] [--latency-ms 20] [--jitter-ms 5] [--payload-bytes 2048]
+#
+# 接口:
+#   POST /api/login        返回 data.token
+#   GET  /api/items        需要 Authorization 头，返回 data.items[].id
+#   GET  /api/items/<id>   返回 data.id 和 data.next_id
+# 任一接口可用查询参数 latency_ms、payload_bytes 覆盖启动参数
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """按路径返回固定结构的JSON，延迟和填充大小取自服务配置或查询参数"""
+
+    protocol_version = 'HTTP/1.1'  # 支持连接复用，与真实服务一致
+
+    def log_message(self, format, *args):
+        pass
+
+    def _options(self, query):
+        """本次请求的延迟(秒)和响应体填充字节数"""
+        server = self.server
+        latency_ms = float(query.get('latency_ms', [server.latency_ms])[0])
+        payload_bytes = int(query.get('payload_bytes', [server.payload_bytes])[0])
+        if server.jitter_ms:
+            latency_ms += random.uniform(-server.jitter_ms, server.jitter_ms)
+        return max(latency_ms, 0) / 1000, max(payload_bytes, 0)
+
+    def _send(self, status, data, payload_bytes=0):
+        if payload_bytes:
+            data['padding'] = 'x' * max(payload_bytes - len(json.dumps(data)) - 14, 0)
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        url = urlparse(self.path)
+        delay, payload_bytes = self._options(parse_qs(url.query))
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        if delay:
+            time.sleep(delay)
+
+        self.server.count_request()
+        parts = [part for part in url.path.split('/') if part]
+        if parts == ['api', 'login'] and self.command == 'POST':
+            token = f'token-{random.getrandbits(64):016x}'
+            self._send(200, {'success': True, 'data': {'token': token, 'user_id': 1}}, payload_bytes)
+        elif parts == ['api', 'items'] and self.command == 'GET':
+            if not self.headers.get('Authorization'):
+                self._send(401, {'success': False, 'message': '未登录'})
+                return
+            items = [{'id': i, 'name': f'item-{i}'} for i in range(1, 11)]
+            self._send(200, {'success': True, 'data': {'items': items}}, payload_bytes)
+        elif len(parts) == 3 and parts[:2] == ['api', 'items'] and parts[2].isdigit():
+            item_id = int(parts[2])
+            self._send(200, {'success': True, 'data': {'id': item_id, 'next_id': item_id + 1}}, payload_bytes)
+        else:
+            self._send(404, {'success': False, 'message': 'not found'})
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class MockServer(ThreadingHTTPServer):
+    """模拟API服务，每个连接一个线程"""
+
+    daemon_threads = True
+    request_queue_size = 1024  # 默认的 5 在并发建连时会丢弃连接请求，客户端重传 SYN 要等 1 秒
+
+    def __init__(self, port=0, latency_ms=20, jitter_ms=0, payload_bytes=512, host='127.0.0.1'):
+        super().__init__((host, port), MockHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.payload_bytes = payload_bytes
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='基准测试用的模拟API服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18100, help='监听端口，0 表示随机端口')
+    parser.add_argument('--latency-ms', type=float, default=20, help='每个响应的延迟(毫秒)')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='延迟的随机抖动范围(毫秒)')
+    parser.add_argument('--payload-bytes', type=int, default=512, help='响应体大小(字节)')
+    args = parser.parse_args()
+
+    server = MockServer(args.port, args.latency_ms, args.jitter_ms, args.payload_bytes, host=args.host)
+    # 第一行输出实际地址，供启动它的基准脚本读取
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f'共处理 {server.requests} 个请求', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
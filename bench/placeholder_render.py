@@ -0,0 +1,113 @@
+# 占位符渲染基准测试：对比逐参数多轮替换与编译模板单次渲染的耗时
+#
+# 用法: python bench/placeholder_render.py [--rounds 20000] [--context-size 30]
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.template import CompiledStep, render_value
+
+
+def legacy_replace(text, context):
+    """旧版替换算法(去掉调试输出)：最多10轮，每轮遍历全部上下文参数"""
+    if not text or not isinstance(text, str):
+        return text
+    re.findall(r'(\{[^}]*\$(\w+)[^}]*\})', text)
+    re.findall(r'\$\{([^}]+)\}', text)
+    for _ in range(10):
+        new_text = text
+        for key, value in context.items():
+            placeholder = f'${{{key}}}'
+            if placeholder in new_text:
+                new_text = new_text.replace(placeholder, str(value))
+            placeholder_simple = f'${key}'
+            if placeholder_simple in new_text and f'${{{key}}}' not in new_text:
+                if re.search(r'[\"\']\s*\$' + key + r'\s*[\"\']', new_text) or re.search(r':\s*\$' + key, new_text):
+                    new_text = new_text.replace(placeholder_simple, str(value))
+        if new_text == text:
+            break
+        text = new_text
+    re.findall(r'\$\{([^}]+)\}', text)
+    re.findall(r'\$(\w+)(?![^{])', text)
+    return text
+
+
+def legacy_replace_dict(data, context):
+    """旧版递归替换"""
+    if isinstance(data, dict):
+        return {k: legacy_replace_dict(v, context) for k, v in data.items()}
+    if isinstance(data, list):
+        return [legacy_replace_dict(item, context) for item in data]
+    if isinstance(data, str):
+        return legacy_replace(data, context)
+    return data
+
+
+def make_steps():
+    """构造典型的登录 + 查询 + 提交步骤"""
+    return [
+        {
+            'name': 'login', 'method': 'POST', 'url': 'http://localhost:3000/api/auth/login',
+            'headers': {'Content-Type': 'application/json', 'X-Request-Source': 'xx-job'},
+            'body': {'account': 'admin', 'password': '123456'}
+        },
+        {
+            'name': 'list', 'method': 'GET', 'url': 'http://localhost:3000/api/users/${user_id}/orders?page=${page}',
+            'headers': {'Authorization': 'Bearer ${token}', 'X-Trace': '${trace_id}'},
+            'body': {'status': 'active', 'since': '${since}'}
+        },
+        {
+            'name': 'submit', 'method': 'POST', 'url': 'http://localhost:3000/api/orders/${order_id}/confirm',
+            'headers': {'Authorization': 'Bearer ${token}'},
+            'body': {'order': '${order_id}', 'items': [{'sku': '${sku}', 'count': 1}], 'note': 'auto confirm'}
+        }
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='占位符渲染基准测试')
+    parser.add_argument('--rounds', type=int, default=20000, help='渲染轮数')
+    parser.add_argument('--context-size', type=int, default=30, help='上下文参数个数')
+    args = parser.parse_args()
+
+    context = {f'param_{i}': f'value_{i}' for i in range(args.context_size)}
+    context.update({'token': 'x' * 160, 'user_id': 42, 'page': 1, 'trace_id': 'abc', 'since': '2024-01-01',
+                    'order_id': 1001, 'sku': 'SKU-1'})
+    steps = make_steps()
+
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        for step in steps:
+            legacy_replace(step['url'], context)
+            legacy_replace_dict(step['headers'], context)
+            legacy_replace_dict(step['body'], context)
+    legacy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled = [CompiledStep(step) for step in steps]
+    for _ in range(args.rounds):
+        for step in compiled:
+            step.url.render(context)
+            render_value(step.headers, context)
+            render_value(step.body, context)
+    compiled_time = time.perf_counter() - start
+
+    renders = args.rounds * len(steps)
+    print(json.dumps({
+        'benchmark': 'placeholder_render',
+        'context_size': len(context),
+        'step_renders': renders,
+        'legacy_us_per_step': round(legacy / renders * 1e6, 2),
+        'compiled_us_per_step': round(compiled_time / renders * 1e6, 2),
+        'speedup': round(legacy / compiled_time, 1)
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+# 调度吞吐基准测试：生成 N 个多步骤调用链任务，按固定间隔调度到本地模拟API服务，
+# 统计每秒执行次数、步骤延迟分位数、调度偏移以及日志存储的增长和写入开销
+#
+# 用法: python bench/scheduler_throughput.py [--tasks 50] [--steps 3] [--interval 1] [--duration 30]
+#       [--engine thread|async|process] [--latency-ms 20] [--payload-bytes 512]
+#
+# 模拟服务在单独的进程中运行(见 bench/mock_server.py)，不与被测的调度器争用GIL；
+# 也可以用 --server-url 指向已经启动的服务。结果以JSON输出到标准输出，便于不同版本之间对比。
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
+
+from core import metrics
+from core.api_client import ApiClient
+from core.http_pool import SessionPool
+from core.log_writer import LogWriter
+from core.logger import TaskLogger
+from core.scheduler import TaskScheduler
+from core.storage import Storage
+
+MOCK_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_server.py')
+
+
+def make_steps(base_url, count, fanout=False):
+    """
+    登录取 token，列表取第一个 id，之后每一步用上一步提取的 id 请求详情并提取下一个 id；
+    fanout 时详情步骤都只依赖列表步骤提取的 id，可以并行执行
+    """
+    steps = [
+        {
+            'name': 'login',
+            'url': f'{base_url}/api/login',
+            'method': 'POST',
+            'headers': {'Content-Type': 'application/json'},
+            'body': {'account': 'bench', 'password': '123456'},
+            'extract_params': [{'name': 'token', 'path': '$.data.token'}]
+        },
+        {
+            'name': 'list',
+            'url': f'{base_url}/api/items',
+            'method': 'GET',
+            'headers': {'Authorization': 'Bearer ${token}'},
+            'extract_params': [{'name': 'item_id', 'path': '$.data.items[0].id'}]
+        }
+    ]
+    for i in range(count - 2):
+        steps.append({
+            'name': f'detail-{i + 1}',
+            'url': base_url + '/api/items/${item_id}',
+            'method': 'GET',
+            'headers': {'Authorization': 'Bearer ${token}'},
+            'extract_params': [] if fanout else [{'name': 'item_id', 'path': '$.data.next_id'}]
+        })
+    return steps[:max(count, 1)]
+
+
+def start_server(args):
+    """在子进程中启动模拟服务，返回 (进程, 地址)"""
+    process = subprocess.Popen(
+        [
+            sys.executable, MOCK_SERVER, '--port', '0',
+            '--latency-ms', str(args.latency_ms),
+            '--jitter-ms', str(args.jitter_ms),
+            '--payload-bytes', str(args.payload_bytes)
+        ],
+        stdout=subprocess.PIPE, text=True
+    )
+    url = process.stdout.readline().strip()
+    if not url:
+        process.kill()
+        raise RuntimeError('模拟服务启动失败')
+    return process, url
+
+
+def percentiles(values):
+    """精确分位数(毫秒)"""
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+
+    def pick(q):
+        return round(values[min(int(q * len(values)), len(values) - 1)] * 1000, 3)
+
+    return {
+        'count': len(values),
+        'avg': round(sum(values) / len(values) * 1000, 3),
+        'p50': pick(0.5),
+        'p90': pick(0.9),
+        'p99': pick(0.99),
+        'max': round(values[-1] * 1000, 3)
+    }
+
+
+def dir_size(path):
+    """目录下所有文件的总字节数"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def store_size(storage):
+    """日志分段、索引和大对象各自占用的字节数"""
+    index_size = sum(
+        os.path.getsize(path) for path in (storage.log_index_file, storage.log_index_file + '-wal')
+        if os.path.exists(path)
+    )
+    return {
+        'segments': storage.log_store.total_size(),
+        'index': index_size,
+        'blobs': dir_size(storage.blobs_dir)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='调度吞吐基准测试')
+    parser.add_argument('--tasks', type=int, default=50, help='任务数')
+    parser.add_argument('--steps', type=int, default=3, help='每个调用链的步骤数')
+    parser.add_argument('--parallelism', type=int, default=1, help='调用链内同时执行的步骤数')
+    parser.add_argument('--fanout', action='store_true', help='详情步骤互不依赖，配合 --parallelism 测试并行执行')
+    parser.add_argument('--interval', type=float, default=1, help='每个任务的执行间隔(秒)')
+    parser.add_argument('--duration', type=float, default=30, help='测量时长(秒)')
+    parser.add_argument('--engine', choices=('thread', 'async', 'process'), default='thread', help='执行引擎')
+    parser.add_argument('--workers', type=int, default=20, help='线程引擎的工作线程数，也是每个主机的连接数上限')
+    parser.add_argument('--async-concurrency', type=int, default=200, help='异步引擎的最大并发数')
+    parser.add_argument('--processes', type=int, default=0, help='多进程引擎的工作进程数，0 表示CPU核数')
+    parser.add_argument('--latency-ms', type=float, default=20, help='模拟服务的响应延迟(毫秒)')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='模拟服务的延迟抖动(毫秒)')
+    parser.add_argument('--payload-bytes', type=int, default=512, help='模拟服务的响应体大小(字节)')
+    parser.add_argument('--server-url', help='使用已启动的模拟服务，不再自动启动')
+    parser.add_argument('--log-fsync', action='store_true', help='日志每批写入后 fsync，与生产默认配置一致')
+    args = parser.parse_args()
+
+    # 工作进程以 fork 方式启动，需在创建其他线程之前
+    worker_pool = None
+    if args.engine == 'process':
+        from core.worker_pool import WorkerPool
+        worker_pool = WorkerPool(args.processes, pool_options={'pool_maxsize': args.workers})
+
+    server = None
+    base_url = args.server_url
+    if not base_url:
+        server, base_url = start_server(args)
+
+    drifts = []
+    missed = {'missed': 0, 'max_instances': 0}
+    lock = threading.Lock()
+
+    def on_job_event(event):
+        """APScheduler 执行完触发回调(即投递完本次执行)时，记录相对计划触发时间的偏移"""
+        with lock:
+            if event.code == EVENT_JOB_EXECUTED:
+                scheduled = event.scheduled_run_time
+                drifts.append((datetime.now(scheduled.tzinfo) - scheduled).total_seconds())
+            elif event.code == EVENT_JOB_MISSED:
+                missed['missed'] += 1
+            else:
+                missed['max_instances'] += 1
+
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            storage = Storage(data_dir, log_fsync=args.log_fsync)
+            api_client = ApiClient(SessionPool(pool_maxsize=args.workers))
+            log_writer = LogWriter(storage)
+            logger = TaskLogger(storage, log_writer)
+
+            async_client = None
+            if args.engine == 'async':
+                from core.async_client import AsyncApiClient
+                async_client = AsyncApiClient(api_client, max_concurrency=args.async_concurrency)
+
+            scheduler = TaskScheduler(
+                storage, api_client, logger,
+                max_workers=args.workers,
+                async_client=async_client,
+                worker_pool=worker_pool
+            )
+            scheduler.scheduler.add_listener(on_job_event, EVENT_JOB_EXECUTED | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+
+            size_before = store_size(storage)
+            steps = make_steps(base_url, args.steps, args.fanout)
+            print(f'{args.tasks} 个任务 x {args.steps} 步, 间隔 {args.interval}s, 引擎 {args.engine}, '
+                  f'测量 {args.duration}s ...', file=sys.stderr)
+
+            cpu_start = time.process_time()
+            start = time.perf_counter()
+            for i in range(args.tasks):
+                scheduler.add_task({
+                    'name': f'bench-{i + 1}',
+                    'type': 'interval',
+                    'interval_seconds': args.interval,
+                    'parallelism': args.parallelism,
+                    'steps': steps
+                })
+
+            time.sleep(args.duration)
+            # 停止触发并等待执行中的调用链结束，之后的日志全部写入存储
+            scheduler.shutdown()
+            elapsed = time.perf_counter() - start
+            log_writer.close()
+            cpu = time.process_time() - cpu_start
+
+            step_latency = []
+            step_ttfb = []
+            step_failures = 0
+            for log in storage.log_store.iter_logs():
+                if log.get('event') != 'step':
+                    continue
+                if log.get('status') != 'success':
+                    step_failures += 1
+                timings = (log.get('details') or {}).get('timings') or {}
+                if 'total' in timings:
+                    step_latency.append(timings['total'])
+                if 'ttfb' in timings:
+                    step_ttfb.append(timings['ttfb'])
+
+            size_after = store_size(storage)
+            runs = metrics.summary()['task_runs']
+            executions = sum(runs.values())
+            written = metrics.LOGS_WRITTEN.total()
+            write_samples = metrics.LOG_WRITE.samples()
+            write_seconds = sum(state['sum'] for _, state in write_samples)
+            write_batches = sum(state['count'] for _, state in write_samples)
+            growth = {key: size_after[key] - size_before[key] for key in size_after}
+            growth_total = sum(growth.values())
+
+            task_states = scheduler.get_metrics().values()
+            waited = sum(state['executions'] for state in task_states)
+            wait_total = sum(state['queue_wait_avg'] * state['executions'] for state in task_states)
+
+            results = {
+                'executions': executions,
+                'executions_success': runs.get('success', 0),
+                'executions_failure': runs.get('failure', 0),
+                'executions_per_sec': round(executions / elapsed, 2),
+                'expected_per_sec': round(args.tasks / args.interval, 2),
+                'skipped': metrics.TASK_SKIPPED.total(),
+                'elapsed_seconds': round(elapsed, 3),
+                'cpu_seconds': round(cpu, 3),
+                'cpu_ms_per_execution': round(cpu / executions * 1000, 3) if executions else None,
+                'chain_duration_ms': {
+                    key: round(value * 1000, 3) for key, value in metrics.TASK_DURATION.summary().items() if key != 'count'
+                },
+                'step_latency_ms': percentiles(step_latency),
+                'step_ttfb_ms': percentiles(step_ttfb),
+                'step_failures': step_failures,
+                'scheduling_drift_ms': percentiles(drifts),
+                'queue_wait_ms': {
+                    'avg': round(wait_total / waited * 1000, 3) if waited else 0,
+                    'max': round(max((state['queue_wait_max'] for state in task_states), default=0) * 1000, 3),
+                    'p99_estimated': round(metrics.TASK_QUEUE_WAIT.summary()['p99'] * 1000, 3)
+                },
+                'missed_triggers': missed,
+                'log_store': {
+                    'logs_written': written,
+                    'growth_bytes': growth,
+                    'bytes_per_log': round(growth_total / written, 1) if written else None,
+                    'bytes_per_execution': round(growth_total / executions, 1) if executions else None,
+                    'write_batches': write_batches,
+                    'write_seconds': round(write_seconds, 4),
+                    'write_us_per_log': round(write_seconds / written * 1e6, 2) if written else None,
+                    'write_ms_per_batch': round(write_seconds / write_batches * 1000, 3) if write_batches else None
+                }
+            }
+
+            storage.log_store.close()
+            storage.log_index.close()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(json.dumps({
+        'benchmark': 'scheduler_throughput',
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'config': vars(args),
+        'results': results
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,19 +4,44 @@
 import json
 import requests
 import time
-from jsonpath_ng import parse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-class ApiClient:
-    def __init__(self):
-        self.timeout = 30  # 默认请求超时时间(秒)
+from urllib3.exceptions import ReadTimeoutError
+
+from core.diagnostics import debug_enabled, emit_debug, get_logger, mask_secrets
+from core.host_guard import CircuitOpen
+from core.http_pool import SessionPool, request_timing
+from core.response_cache import CACHE_LOOKUPS
+from core.retry import RetryPolicy, retry_budget
+from core.step_graph import StepGraph
+from core.stream import ResponseTooLarge, StreamExtractor, read_limited
+from core.template import (
+    CompiledStep, compile_steps, compile_template, compile_value, jsonpath_cache, normalize_path, render_value
+)
+from core.timeouts import ChainTimeouts, request_timeout, timeout_error
+
+log = get_logger('api_client')
 
-    def execute_step(self, step, context=None):
+class ApiClient:
+    def __init__(self, session_pool=None, error_text_max=1000, stream_max_bytes=64 * 1024 * 1024,
+                 stream_chunk_size=64 * 1024, host_guard=None, response_cache=None,
+                 stream_buffer_max_bytes=16 * 1024 * 1024):
+        self.session_pool = session_pool or SessionPool()  # 按主机复用的长连接会话
+        self.error_text_max = error_text_max  # 错误信息中保留的响应内容字符数，0 表示不截断
+        self.stream_max_bytes = stream_max_bytes  # 流式模式下响应大小上限(字节)，步骤可单独设置
+        self.stream_chunk_size = stream_chunk_size  # 流式模式下每次读取的字节数
+        self.stream_buffer_max_bytes = stream_buffer_max_bytes  # 无法边读边解析、需整体解析时的缓冲上限(字节)
+        self.host_guard = host_guard  # 按主机限流和熔断，为空时不控制
+        self.response_cache = response_cache  # GET 响应缓存，步骤用 cache 字段开启，为空时不缓存
+
+    def execute_step(self, step, context=None, timeouts=None):
         """
         执行API调用步骤
 
         参数:
             step: API步骤配置，包含url、method、headers、body等信息
             context: 上下文参数，用于替换URL和请求体中的占位符
+            timeouts: 本次请求的超时 {'connect', 'read', 'total'}(秒)，默认按步骤和全局配置计算
 
         返回:
             {
@@ -24,173 +49,379 @@ class ApiClient:
                 'response': dict,  # 响应内容
                 'status_code': int,  # HTTP状态码
                 'error': str,  # 错误信息(如果有)
-                'extracted_params': dict  # 提取的参数
+                'error_type': str,  # 失败类型(如果有): http/timeout/connection/invalid_json/too_large/
+                                    # circuit_open/rate_limited/unknown
+                'extracted_params': dict,  # 提取的参数
+                'timings': dict,  # 各阶段耗时(秒): dns/connect/ttfb/total
+                'timeouts': dict,  # 实际使用的超时(秒): connect/read/total，0 表示不限制
+                'cache': str  # 开启缓存时的缓存状态: hit 命中, revalidated 重新验证后使用缓存, miss 未命中
             }
         """
         if context is None:
             context = {}
+        if timeouts is None:
+            timeouts = ChainTimeouts().for_step(step)
 
         result = {
             'success': False,
             'response': None,
             'status_code': None,
             'error': None,
-            'extracted_params': {}
+            'extracted_params': {},
+            'timeouts': timeouts
         }
 
-        try:
-            # 准备请求参数
-            url = self._replace_placeholders(step.get('url', ''), context)
-            method = step.get('method', 'GET').upper()
-
-            # 获取原始的请求头和请求体，确保引用值被保留
-            original_headers = step.get('headers', {})
-            original_body = step.get('body', {})
-
-            # 替换请求头和请求体中的占位符
-            headers = self._replace_placeholders_dict(original_headers, context)
-            body = self._replace_placeholders_dict(original_body, context)
-
-            # 确保请求头和请求体的引用值被正确处理
-            # 特别注意处理像 "Authorization": "Bearer ${token}" 这样的引用
-
-            # 记录原始和替换后的请求信息，便于调试
-            step_name = step.get('name', '未知')
-            print(f"=== 步骤 {step_name} 请求信息 ===")
-            print(f"上下文参数: {context}")
-            print(f"原始请求头: {original_headers}")
-            print(f"替换后请求头: {headers}")
-            print(f"原始请求体: {original_body}")
-            print(f"替换后请求体: {body}")
-
-            # 检查关键参数是否被正确替换
-            if 'Authorization' in headers:
-                auth_value = headers.get('Authorization', '')
-                # 检查标准格式 ${token}
-                if '${token}' in auth_value:
-                    if 'token' in context:
-                        # 直接替换请求头中的token
-                        headers['Authorization'] = auth_value.replace('${token}', str(context['token']))
-                        print(f"✓ 成功替换token: {context['token']}")
-                        # 验证token是否为空
-                        if not context['token'] or (isinstance(context['token'], str) and not context['token'].strip()):
-                            print("✗ 警告: token值为空")
-                    else:
-                        print("✗ 警告: 请求头中包含${token}但上下文中没有token参数")
-                # 检查假设性格式 $token
-                elif '$token' in auth_value and '${token}' not in auth_value:
-                    if 'token' in context:
-                        # 直接替换请求头中的token
-                        headers['Authorization'] = auth_value.replace('$token', str(context['token']))
-                        print(f"✓ 成功替换假设性token: {context['token']}")
-                        # 验证token是否为空
-                        if not context['token'] or (isinstance(context['token'], str) and not context['token'].strip()):
-                            print("✗ 警告: token值为空")
-                    else:
-                        print("✗ 警告: 请求头中包含$token但上下文中没有token参数")
-
-            # 检查其他可能的引用参数
-            for key, value in headers.items():
-                if isinstance(value, str) and '${' in value:
-                    import re
-                    placeholders = re.findall(r'\$\{([^}]+)\}', value)
-                    for placeholder in placeholders:
-                        if placeholder in context:
-                            print(f"✓ 请求头 {key} 成功替换参数 {placeholder}: {context[placeholder]}")
-                            # 验证参数是否为空
-                            if not context[placeholder] or (isinstance(context[placeholder], str) and not context[placeholder].strip()):
-                                print(f"✗ 警告: 参数 {placeholder} 值为空")
-                        else:
-                            print(f"✗ 警告: 请求头 {key} 包含参数 {placeholder} 但上下文中没有该参数")
-
-            # 检查请求体中的引用参数
-            if isinstance(body, dict):
-                for key, value in body.items():
-                    if isinstance(value, str):
-                        # 检查标准格式 ${param}
-                        if '${' in value:
-                            import re
-                            placeholders = re.findall(r'\$\{([^}]+)\}', value)
-                            for placeholder in placeholders:
-                                if placeholder in context:
-                                    print(f"✓ 请求体 {key} 成功替换参数 {placeholder}: {context[placeholder]}")
-                                    # 验证参数是否为空
-                                    if not context[placeholder] or (isinstance(context[placeholder], str) and not context[placeholder].strip()):
-                                        print(f"✗ 警告: 参数 {placeholder} 值为空")
-                                else:
-                                    print(f"✗ 警告: 请求体 {key} 包含参数 {placeholder} 但上下文中没有该参数")
-
-                        # 检查假设性格式 $param (但不是 ${param})
-                        elif '$' in value and '${' not in value:
-                            import re
-                            simple_placeholders = re.findall(r'\$(\w+)', value)
-                            for placeholder in simple_placeholders:
-                                if placeholder in context:
-                                    print(f"✓ 请求体 {key} 成功替换假设性参数 {placeholder}: {context[placeholder]}")
-                                    # 验证参数是否为空
-                                    if not context[placeholder] or (isinstance(context[placeholder], str) and not context[placeholder].strip()):
-                                        print(f"✗ 警告: 参数 {placeholder} 值为空")
-                                else:
-                                    print(f"✗ 警告: 请求体 {key} 包含假设性参数 {placeholder} 但上下文中没有该参数")
-
-            # 无论是否成功，先记录请求信息
-            result['url'] = url
-            result['method'] = method
-            result['headers'] = headers
-            result['body'] = body
-
-            # 发送请求
-            response = requests.request(
-                method=method,
-                url=url,
-                headers=headers,
-                json=body if method in ['POST', 'PUT', 'PATCH'] else None,
-                params=body if method == 'GET' else None,
-                timeout=self.timeout
-            )
+        start = time.perf_counter()
+        started = time.monotonic()
+        guarded = False
+        with request_timing() as timing:
+            try:
+                url, method, headers, body = self._prepare_request(step, context)
+
+                # 无论是否成功，先记录请求信息
+                result['url'] = url
+                result['method'] = method
+                result['headers'] = headers
+                result['body'] = body
+
+                # 开启缓存的步骤，缓存的响应仍在有效期内时不发请求
+                cached = self._cache_lookup(step, method, url, headers, body)
+                if cached is not None and cached[1] is not None and cached[1].fresh():
+                    self._handle_cached(step, result, cached[1], 'hit')
+                else:
+                    # 主机熔断中时不发请求，直接失败
+                    guarded = self._check_host(url)
+                    self._send(step, result, timing, method, url, headers, body, timeouts, started, cached)
+
+            except CircuitOpen as e:
+                result['error'] = str(e)
+                result['error_type'] = 'circuit_open'
+            except ResponseTooLarge as e:
+                result['error'] = str(e)
+                result['error_type'] = 'too_large'
+            except requests.exceptions.ConnectTimeout:
+                result['error'] = timeout_error('连接', timeouts, started)
+                result['error_type'] = 'timeout'
+            except (requests.exceptions.Timeout, ReadTimeoutError):
+                result['error'] = timeout_error('读取', timeouts, started)
+                result['error_type'] = 'timeout'
+            except TimeoutError as e:
+                result['error'] = f"请求超时({e})"
+                result['error_type'] = 'timeout'
+            except requests.exceptions.ConnectionError as e:
+                # 读取响应体时的读取超时被 requests 包装为 ConnectionError
+                if e.args and isinstance(e.args[0], ReadTimeoutError):
+                    result['error'] = timeout_error('读取', timeouts, started)
+                    result['error_type'] = 'timeout'
+                else:
+                    result['error'] = "连接错误"
+                    result['error_type'] = 'connection'
+            except json.JSONDecodeError:
+                result['error'] = "响应不是有效的JSON格式"
+                result['error_type'] = 'invalid_json'
+            except Exception as e:
+                result['error'] = f"未知错误: {str(e)}"
+                result['error_type'] = 'unknown'
 
-            result['status_code'] = response.status_code
-            result['response'] = response.json() if response.headers.get('content-type', '').find('application/json') != -1 else response.text
+        if guarded:
+            self._record_host(result)
 
-            # 检查响应状态
-            if response.status_code >= 200 and response.status_code < 300:
-                result['success'] = True
+        # 各阶段耗时(秒): 新建连接时才有 dns 和 connect，ttfb 为发出请求到收到响应头
+        timing['total'] = time.perf_counter() - start
+        result['timings'] = {phase: round(value, 6) for phase, value in timing.items()}
+        return result
+
+    def _send(self, step, result, timing, method, url, headers, body, timeouts, started, cached=None):
+        """
+        发送请求并按响应填充步骤结果
 
-                # 提取参数
-                if 'extract_params' in step and step['extract_params']:
-                    result['extracted_params'] = self._extract_params(
-                        result['response'], 
-                        step['extract_params']
+        参数:
+            cached: 开启缓存时为 (缓存键, 缓存的响应或 None, 有效期)，有过期的缓存响应时发送条件请求，
+                服务端返回 304 则使用缓存内容，否则缓存新的成功响应
+        """
+        headers = self._conditional_headers(cached, headers)
+
+        # 复用该主机的长连接会话；设置了总超时时按块读取响应以检查总时间
+        response = self.session_pool.get(url).request(
+            method=method,
+            url=url,
+            headers=headers,
+            json=body if method in ['POST', 'PUT', 'PATCH'] else None,
+            params=body if method == 'GET' else None,
+            timeout=request_timeout(timeouts),
+            stream=bool(step.get('stream') or timeouts['total'])
+        )
+
+        timing['ttfb'] = response.elapsed.total_seconds()
+
+        if self._handle_not_modified(step, result, cached, response.status_code, response.headers):
+            response.close()
+            return
+
+        content_type = response.headers.get('content-type', '')
+        text = None
+        if step.get('stream') or timeouts['total']:
+            # 流式模式：边读边解析，只保留提取路径上的值；非流式模式按块读取全文
+            with response:
+                chunks = self._iter_chunks(response, timeouts, started)
+                extractor = None
+                if step.get('stream'):
+                    extractor = self._stream_extractor(step, response.status_code, content_type)
+                if extractor is not None:
+                    for chunk in chunks:
+                        extractor.feed(chunk)
+                        if extractor.done:
+                            break
+                    self._handle_streamed_response(step, result, response.status_code, extractor)
+                else:
+                    max_bytes = self._stream_max_bytes(step) if step.get('stream') else 0
+                    text = read_limited(chunks, max_bytes).decode(response.encoding or 'utf-8', 'replace')
+                    self._handle_response(
+                        step, result, response.status_code, content_type, text, lambda: json.loads(text)
                     )
-            else:
-                result['error'] = f"HTTP错误: {response.status_code} - {response.text}"
-
-        except requests.exceptions.Timeout:
-            result['error'] = "请求超时"
-        except requests.exceptions.ConnectionError:
-            result['error'] = "连接错误"
-        except json.JSONDecodeError:
-            result['error'] = "响应不是有效的JSON格式"
-        except Exception as e:
-            result['error'] = f"未知错误: {str(e)}"
+        else:
+            text = response.text
+            self._handle_response(step, result, response.status_code, content_type, text, response.json)
+
+        self._cache_store(cached, result, response.status_code, content_type, text, response.headers)
+
+    def _cache_lookup(self, step, method, url, headers, body):
+        """步骤开启缓存时返回 (缓存键, 缓存的响应或 None, 有效期)，否则返回 None"""
+        if self.response_cache is None:
+            return None
+        options = self.response_cache.options(step, method)
+        if options is None:
+            return None
+        key = self.response_cache.key(method, url, body, headers, options['vary'])
+        return key, self.response_cache.get(key), options['ttl']
+
+    def _conditional_headers(self, cached, headers):
+        """有过期的缓存响应时加入条件请求头"""
+        if cached is None or cached[1] is None:
+            return headers
+        return cached[1].conditional_headers(headers)
+
+    def _handle_not_modified(self, step, result, cached, status_code, response_headers):
+        """条件请求返回 304 时延长缓存有效期并使用缓存内容，返回是否已处理"""
+        if cached is None or cached[1] is None or status_code != 304:
+            return False
+        key, entry, ttl = cached
+        self._handle_cached(step, result, self.response_cache.revalidate(key, entry, response_headers, ttl), 'revalidated')
+        return True
+
+    def _handle_cached(self, step, result, entry, status):
+        """用缓存的响应填充步骤结果，参数照常从响应中提取"""
+        text = entry.text
+        self._handle_response(step, result, entry.status_code, entry.content_type, text, lambda: json.loads(text))
+        result['cache'] = status
+        CACHE_LOOKUPS.inc(result=status)
+
+    def _cache_store(self, cached, result, status_code, content_type, text, response_headers):
+        """步骤开启缓存时缓存成功的响应，失败的响应不缓存"""
+        if cached is None:
+            return
+        key, _, ttl = cached
+        result['cache'] = 'miss'
+        CACHE_LOOKUPS.inc(result='miss')
+        if result['success']:
+            self.response_cache.store(key, status_code, content_type, text, response_headers, ttl)
+
+    def _iter_chunks(self, response, timeouts, started):
+        """按块读取响应体，设置了总超时时从 started(time.monotonic())起超过总超时抛出 TimeoutError"""
+        total = timeouts['total']
+        if not total:
+            return response.iter_content(self.stream_chunk_size)
+        return self._deadline_chunks(response, started + total, total)
+
+    def _deadline_chunks(self, response, deadline, total):
+        raw = response.raw
+        if not hasattr(raw, 'read1'):
+            # urllib3 1.x 每块读满才返回，只能在块之间检查
+            for chunk in response.iter_content(self.stream_chunk_size):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f'总时间超过 {total:g} 秒')
+                yield chunk
+            return
+
+        # read1 收到数据即返回，每次读取前把套接字超时缩短到剩余时间，数据缓慢到达时也能按时结束
+        sock = getattr(raw.connection, 'sock', None)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f'总时间超过 {total:g} 秒')
+            if sock is not None:
+                current = sock.gettimeout()
+                sock.settimeout(remaining if current is None else min(current, remaining))
+            try:
+                chunk = raw.read1(self.stream_chunk_size, decode_content=True)
+            except ReadTimeoutError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f'总时间超过 {total:g} 秒') from None
+                raise
+            if not chunk:
+                return
+            yield chunk
+
+    def _check_host(self, url):
+        """熔断器放行时返回 True(请求结束后需调用 _record_host)，熔断中抛出 CircuitOpen，未启用时返回 False"""
+        if self.host_guard is None:
+            return False
+        host = self.session_pool.host_key(url)
+        if not self.host_guard.allow(host):
+            raise CircuitOpen(f'主机 {host} 连续失败已熔断，暂停请求')
+        return True
+
+    def _record_host(self, result):
+        """向熔断器报告请求结果，超时、连接错误和 5xx 视为主机故障"""
+        failed = result.get('error_type') in ('timeout', 'connection') or (result.get('status_code') or 0) >= 500
+        self.host_guard.record(self.session_pool.host_key(result['url']), failed)
+
+    def _reserve_host(self, step, context):
+        """
+        为步骤的请求预约主机限流令牌
 
-        return result
+        返回:
+            (需要等待的秒数, None)，等待时间超过上限时为 (None, 失败的步骤结果)
+        """
+        if self.host_guard is None or self.host_guard.rate <= 0:
+            return 0, None
+        if not isinstance(step, CompiledStep):
+            step = CompiledStep(step)
+        url = step.url.render(context)
+        host = self.session_pool.host_key(url)
+        wait = self.host_guard.reserve(host)
+        if wait is not None:
+            return wait, None
+        return None, {
+            'success': False,
+            'response': None,
+            'status_code': None,
+            'error': f'主机 {host} 限流排队超过 {self.host_guard.max_wait} 秒',
+            'error_type': 'rate_limited',
+            'extracted_params': {},
+            'url': url,
+            'method': step.method,
+            'timings': {}
+        }
+
+    def _prepare_request(self, step, context):
+        """使用编译模板渲染步骤中的占位符，返回 (url, method, headers, body)"""
+        if not isinstance(step, CompiledStep):
+            step = CompiledStep(step)
+
+        url = step.url.render(context)
+        method = step.method
+        headers = render_value(step.headers, context)
+        body = render_value(step.body, context)
+
+        # 记录替换后的请求信息，仅在开启调试时计算，敏感字段脱敏
+        if self._debug_enabled(step):
+            emit_debug(
+                log, step.debug, '步骤请求信息',
+                step=step.get('name', '未知'), method=method, url=url,
+                headers=mask_secrets(headers), body=mask_secrets(body), context=mask_secrets(context),
+                missing_params=sorted(name for name in step.names if name not in context)
+            )
+
+        return url, method, headers, body
+
+    def _handle_response(self, step, result, status_code, content_type, text, load_json):
+        """根据响应状态和内容填充步骤结果，成功时提取参数"""
+        result['status_code'] = status_code
+        result['response'] = load_json() if content_type.find('application/json') != -1 else text
+
+        # 检查响应状态
+        if status_code >= 200 and status_code < 300:
+            result['success'] = True
+
+            # 提取参数
+            if 'extract_params' in step and step['extract_params']:
+                result['extracted_params'] = self._extract_params(
+                    result['response'], 
+                    step['extract_params'],
+                    step.extract_exprs if isinstance(step, CompiledStep) else None,
+                    getattr(step, 'debug', False)
+                )
+        else:
+            if self.error_text_max and len(text) > self.error_text_max:
+                text = f'{text[:self.error_text_max]}...(已截断，共{len(text)}字符)'
+            result['error'] = f"HTTP错误: {status_code} - {text}"
+            result['error_type'] = 'http'
+
+    def _stream_max_bytes(self, step):
+        """步骤的响应大小上限"""
+        return step.get('max_response_bytes') or self.stream_max_bytes
+
+    def _stream_extractor(self, step, status_code, content_type):
+        """
+        为流式模式的成功JSON响应创建提取器
+
+        失败响应或非JSON响应返回 None，由调用方在大小上限内读取全文后按普通方式处理。
+        """
+        if not (200 <= status_code < 300) or content_type.find('application/json') == -1:
+            return None
+        paths = [p.get('path') for p in step.get('extract_params') or [] if p.get('name') and p.get('path')]
+        return StreamExtractor(paths, self._stream_max_bytes(step), self.stream_buffer_max_bytes)
+
+    def _handle_streamed_response(self, step, result, status_code, extractor):
+        """流式模式下填充步骤结果，响应内容只保留提取路径上的值"""
+        values = extractor.close()
+        result['status_code'] = status_code
+        result['response'] = values
+        result['response_size'] = extractor.size
+        result['streamed'] = True
+        result['success'] = True
+
+        if step.get('extract_params'):
+            result['extracted_params'] = self._extract_params(
+                None, step['extract_params'], debug=getattr(step, 'debug', False), values=values
+            )
 
-    def execute_chain(self, steps, retry_times=1):
+    def compile_steps(self, steps, debug=False):
+        """将步骤预先编译为模板，保存或调度任务时调用一次即可"""
+        return compile_steps(steps, debug)
+
+    def _debug_enabled(self, step):
+        """步骤所属任务开启调试，或全局日志级别为 DEBUG"""
+        return debug_enabled(log, getattr(step, 'debug', False))
+
+    def execute_chain(self, steps, retry_times=1, parallelism=1, timeout=None):
         """
-        执行API调用链
+        执行API调用链，重试前在当前线程中等待
 
         参数:
-            steps: API步骤列表
-            retry_times: 失败重试次数
+            steps: API步骤列表，可以是原始步骤或 compile_steps 的结果
+            retry_times: 失败重试次数，步骤可用 retry 字段单独配置重试策略
+            parallelism: 同时执行的步骤数上限，大于 1 时按参数依赖并行执行互不依赖的步骤
+            timeout: 任务的超时设置 {'connect', 'read', 'total', 'chain'}(秒)，见 ChainTimeouts，
+                步骤可用 timeout 字段单独设置请求超时
 
         返回:
             {
                 'success': bool,  # 整个链是否成功
-                'steps': list,  # 每个步骤的执行结果
+                'steps': list,  # 每个步骤的执行结果，按步骤顺序排列
                 'error': str  # 错误信息(如果有)
             }
         """
+        chain = self.run_chain(steps, retry_times, parallelism, timeout)
+        try:
+            while True:
+                time.sleep(next(chain))
+        except StopIteration as stop:
+            return stop.value
+
+    def run_chain(self, steps, retry_times=1, parallelism=1, timeout=None):
+        """
+        以生成器的形式执行API调用链，参数与 execute_chain 相同
+
+        需要等待重试时 yield 等待的秒数，调用方等待后调用 next() 继续，等待期间可以释放线程；
+        执行结束时通过 StopIteration.value 返回与 execute_chain 相同的结果。
+        """
+        steps = compile_steps(steps)
+        timeouts = ChainTimeouts(timeout)
+        if parallelism > 1 and len(steps) > 1:
+            return (yield from self._run_graph(steps, retry_times, parallelism, timeouts))
+
         result = {
             'success': False,
             'steps': [],
@@ -200,26 +431,14 @@ class ApiClient:
         context = {}  # 用于存储步骤间传递的参数
 
         for i, step in enumerate(steps):
-            step_result = None
-            retry_count = 0
+            # 超过调用链截止时间后不再执行剩余的步骤
+            if timeouts.expired():
+                result['error'] = timeouts.cancelled(len(steps) - i)
+                return result
 
             # 执行当前步骤，支持重试
-            while retry_count <= retry_times:
-                step_result = self.execute_step(step, context)
-
-                if step_result['success']:
-                    break
-
-                retry_count += 1
-                if retry_count <= retry_times:
-                    time.sleep(1)  # 重试前等待1秒
-
-            # 保存步骤结果
-            result['steps'].append({
-                'step_index': i,
-                'step_name': step.get('name', f'步骤{i+1}'),
-                'result': step_result
-            })
+            step_result, attempts = yield from self._run_with_retry(step, context, retry_times, timeouts)
+            result['steps'].append(self._step_entry(steps, i, step_result, attempts))
 
             # 如果步骤失败，终止链式调用
             if not step_result['success']:
@@ -231,241 +450,129 @@ class ApiClient:
             extracted_params = step_result['extracted_params']
             context.update(extracted_params)
 
-            # 记录步骤执行结果，便于调试
-            print(f"步骤 {i+1} ({step.get('name', '未知步骤')}) 执行完成")
-            print(f"提取的参数: {extracted_params}")
-            print(f"当前上下文: {context}")
-
-            # 验证关键参数是否正确提取
-            extract_params = step.get('extract_params', [])
-            if extract_params:
-                for param_config in extract_params:
-                    param_name = param_config.get('name', '')
-                    if param_name and param_name in context:
-                        print(f"✓ 成功提取参数 {param_name}: {context[param_name]}")
-                    elif param_name:
-                        print(f"✗ 警告: 参数 {param_name} 未在响应中找到")
-
-                # 特别检查token参数，因为它是链式调用的关键
-                if i == 0 and any(p.get('name') == 'token' for p in extract_params):
-                    if 'token' in context:
-                        print(f"✓ 步骤 {i+1} 成功提取token，可用于后续步骤")
-                    else:
-                        print(f"✗ 警告: 步骤 {i+1} 应提取token参数但未找到，后续步骤可能失败")
-
-            # 检查下一步是否需要当前步骤提取的参数
-            if i < len(steps) - 1:
-                next_step = steps[i+1]
-                next_headers = next_step.get('headers', {})
-                next_body = next_step.get('body', {})
-                next_url = next_step.get('url', '')
-
-                print(f"=== 检查步骤 {i+2} 的参数依赖 ===")
-
-                # 检查下一步的请求头、请求体和URL中是否有占位符
-                all_placeholders = set()
-                placeholder_details = {}  # 记录占位符的详细信息
-
-                # 从请求头中提取占位符
-                for key, value in next_headers.items():
-                    if isinstance(value, str):
-                        import re
-                        # 检查标准格式 ${param}
-                        if '${' in value:
-                            placeholders = re.findall(r'\$\{([^}]+)\}', value)
-                            for placeholder in placeholders:
-                                all_placeholders.add(placeholder)
-                                if placeholder not in placeholder_details:
-                                    placeholder_details[placeholder] = []
-                                placeholder_details[placeholder].append(f"请求头 {key}")
-
-                        # 检查假设性格式 $param (但不是 ${param})
-                        elif '$' in value and '${' not in value:
-                            # 特别检查 {"Authorization":$token} 格式
-                            if key == 'Authorization' and '$token' in value:
-                                all_placeholders.add('token')
-                                if 'token' not in placeholder_details:
-                                    placeholder_details['token'] = []
-                                placeholder_details['token'].append(f"请求头 {key} (假设性格式)")
-                            else:
-                                simple_placeholders = re.findall(r'\$(\w+)', value)
-                                for placeholder in simple_placeholders:
-                                    all_placeholders.add(placeholder)
-                                    if placeholder not in placeholder_details:
-                                        placeholder_details[placeholder] = []
-                                    placeholder_details[placeholder].append(f"请求头 {key} (假设性格式)")
-
-                # 从请求体中提取占位符
-                if isinstance(next_body, dict):
-                    for key, value in next_body.items():
-                        if isinstance(value, str):
-                            import re
-                            # 检查标准格式 ${param}
-                            if '${' in value:
-                                placeholders = re.findall(r'\$\{([^}]+)\}', value)
-                                for placeholder in placeholders:
-                                    all_placeholders.add(placeholder)
-                                    if placeholder not in placeholder_details:
-                                        placeholder_details[placeholder] = []
-                                    placeholder_details[placeholder].append(f"请求体 {key}")
-
-                            # 检查假设性格式 $param (但不是 ${param})
-                            elif '$' in value and '${' not in value:
-                                # 特别检查 {"name":$name} 格式
-                                if key == 'name' and '$name' in value:
-                                    all_placeholders.add('name')
-                                    if 'name' not in placeholder_details:
-                                        placeholder_details['name'] = []
-                                    placeholder_details['name'].append(f"请求体 {key} (假设性格式)")
-                                else:
-                                    simple_placeholders = re.findall(r'\$(\w+)', value)
-                                    for placeholder in simple_placeholders:
-                                        all_placeholders.add(placeholder)
-                                        if placeholder not in placeholder_details:
-                                            placeholder_details[placeholder] = []
-                                        placeholder_details[placeholder].append(f"请求体 {key} (假设性格式)")
-
-                # 从URL中提取占位符
-                if isinstance(next_url, str):
-                    import re
-                    # 检查标准格式 ${param}
-                    if '${' in next_url:
-                        placeholders = re.findall(r'\$\{([^}]+)\}', next_url)
-                        for placeholder in placeholders:
-                            all_placeholders.add(placeholder)
-                            if placeholder not in placeholder_details:
-                                placeholder_details[placeholder] = []
-                            placeholder_details[placeholder].append("URL")
-
-                    # 检查假设性格式 $param (但不是 ${param})
-                    elif '$' in next_url and '${' not in next_url:
-                        simple_placeholders = re.findall(r'\$(\w+)', next_url)
-                        for placeholder in simple_placeholders:
-                            all_placeholders.add(placeholder)
-                            if placeholder not in placeholder_details:
-                                placeholder_details[placeholder] = []
-                            placeholder_details[placeholder].append("URL (假设性格式)")
-
-                # 检查所有占位符是否在上下文中
-                for placeholder in all_placeholders:
-                    locations = ", ".join(placeholder_details[placeholder])
-                    if placeholder in context:
-                        value = context[placeholder]
-                        print(f"✓ 下一步需要参数 {placeholder} (使用于: {locations})，已在上下文中找到，值: {value}")
-
-                        # 验证参数是否为空
-                        if not value or (isinstance(value, str) and not value.strip()):
-                            print(f"✗ 警告: 参数 {placeholder} 值为空")
-                    else:
-                        print(f"✗ 警告: 下一步需要参数 {placeholder} (使用于: {locations})，但未在上下文中找到")
-
-                        # 检查是否在当前步骤的extract_params中配置了提取
-                        extract_params = step.get('extract_params', [])
-                        if any(p.get('name') == placeholder for p in extract_params):
-                            print(f"✗ 错误: 参数 {placeholder} 已在当前步骤的extract_params中配置，但未能成功提取")
-                        else:
-                            print(f"✗ 提示: 参数 {placeholder} 未在当前步骤的extract_params中配置，请检查配置")
+            if self._debug_enabled(step):
+                self._check_chain_progress(steps, i, extracted_params, context)
 
         # 所有步骤都成功
         result['success'] = True
         return result
 
+    def _step_entry(self, steps, i, step_result, attempts):
+        """调用链结果中的步骤条目，attempts 为包含重试在内的执行次数"""
+        return {
+            'step_index': i,
+            'step_name': steps[i].get('name', f'步骤{i+1}'),
+            'attempts': attempts,
+            'result': step_result
+        }
+
+    def _log_dependencies(self, steps, dependencies):
+        """调试时记录各步骤依赖的步骤名称"""
+        emit_debug(
+            log, getattr(steps[0], 'debug', False), '步骤依赖关系',
+            dependencies={
+                steps[i].get('name', f'步骤{i+1}'): [steps[j].get('name', f'步骤{j+1}') for j in deps]
+                for i, deps in enumerate(dependencies)
+            }
+        )
+
+    def _run_with_retry(self, step, context, retry_times, timeouts):
+        """
+        执行步骤，可重试的失败按退避时间 yield 后重试，返回 (步骤结果, 包含重试在内的执行次数)
+
+        退避等待后会超过调用链截止时间时不再重试。
+        """
+        policy = RetryPolicy.for_step(step, retry_times)
+        retry_budget.deposit()
+        retry = 0
+        while True:
+            # 限流等待与重试等待一样交给调用方，不占用线程
+            wait, step_result = self._reserve_host(step, context)
+            if step_result is None:
+                if wait:
+                    yield wait
+                step_result = self.execute_step(step, context, timeouts.for_step(step))
+            if step_result['success']:
+                return step_result, retry + 1
+            delay = self._retry_delay(policy, step_result, retry, timeouts)
+            if delay is None:
+                return step_result, retry + 1
+            yield delay
+            retry += 1
+
+    def _retry_delay(self, policy, step_result, retry, timeouts):
+        """
+        失败的步骤是否进行第 retry 次重试，重试时返回退避秒数，否则返回 None
+
+        退避等待后会超过调用链截止时间时不再重试，也不消耗重试预算；同步和异步执行引擎共用。
+        """
+        delay = policy.delay(retry)
+        if not timeouts.allows(delay) or not policy.should_retry(step_result, retry):
+            return None
+        return delay
+
+    def _run_graph(self, steps, retry_times, parallelism, timeouts):
+        """
+        按参数依赖并行执行调用链，调度规则见 StepGraph
+
+        调用链耗时接近依赖关系中最长路径的耗时；没有执行中的步骤、只有等待重试或限流的步骤时
+        yield 等待时间，与顺序执行一样由调用方等待，不占用步骤线程。
+        """
+        graph = StepGraph(self, steps, retry_times, parallelism, timeouts)
+        running = {}  # {Future: 步骤序号}
+        with ThreadPoolExecutor(max_workers=min(parallelism, len(steps)), thread_name_prefix='chain-step') as executor:
+            while graph.unfinished():
+                for i, context in graph.start():
+                    future = executor.submit(self.execute_step, steps[i], context, timeouts.for_step(steps[i]))
+                    running[future] = i
+
+                timeout = graph.timeout()
+                if not running:
+                    if timeout is None:
+                        break
+                    yield timeout
+                    continue
+
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    graph.finish(running.pop(future), future.result())
+
+        return graph.result()
+
+    def close(self):
+        """关闭连接池"""
+        self.session_pool.close()
+
+    def _check_chain_progress(self, steps, i, extracted_params, context):
+        """步骤完成后检查参数提取情况以及下一步的参数依赖，仅在开启调试时调用"""
+        step = steps[i]
+        expected = [p.get('name') for p in step.get('extract_params') or [] if p.get('name')]
+        fields = {
+            'step': step.get('name', f'步骤{i+1}'),
+            'extracted': mask_secrets(extracted_params),
+            'not_extracted': [name for name in expected if name not in context]
+        }
+
+        # 下一步引用但上下文中不存在的参数，直接使用编译模板中记录的参数名
+        if i < len(steps) - 1:
+            next_step = steps[i+1]
+            if not isinstance(next_step, CompiledStep):
+                next_step = CompiledStep(next_step)
+            fields['next_step_missing'] = sorted(name for name in next_step.names if name not in context)
+
+        emit_debug(log, getattr(step, 'debug', False), '步骤执行完成', **fields)
+
     def _replace_placeholders_dict(self, data, context):
         """递归替换字典中的所有占位符"""
-        if isinstance(data, dict):
-            # 特殊处理Authorization请求头，确保token直接替换
-            result = {}
-            for k, v in data.items():
-                if k == 'Authorization' and isinstance(v, str):
-                    # 直接替换token，不通过递归处理
-                    if '${token}' in v and 'token' in context:
-                        result[k] = v.replace('${token}', str(context['token']))
-                    elif '$token' in v and '${token}' not in v and 'token' in context:
-                        result[k] = v.replace('$token', str(context['token']))
-                    else:
-                        result[k] = self._replace_placeholders_dict(v, context)
-                else:
-                    result[k] = self._replace_placeholders_dict(v, context)
-            return result
-        elif isinstance(data, list):
-            return [self._replace_placeholders_dict(item, context) for item in data]
-        elif isinstance(data, str):
-            return self._replace_placeholders(data, context)
-        else:
-            return data
+        return render_value(compile_value(data), context)
 
     def _replace_placeholders(self, text, context):
         """替换文本中的占位符，格式为 ${param_name}"""
         if not text or not isinstance(text, str):
             return text
+        return compile_template(text).render(context)
 
-        # 递归替换，直到没有占位符为止
-        max_iterations = 10  # 防止无限循环
-        original_text = text  # 保存原始文本用于日志
-
-        # 特殊处理：检查是否是假设性参数格式
-        # 例如 {"Authorization":$token} 或 {"name":$name}
-        import re
-        json_pattern = r'(\{[^}]*\$(\w+)[^}]*\})'
-        json_matches = re.findall(json_pattern, text)
-
-        # 检查假设性参数格式
-        for full_match, param_name in json_matches:
-            if param_name in context:
-                print(f"✓ 找到假设性参数 ${param_name} 在上下文中，值: {context[param_name]}")
-            else:
-                print(f"✗ 警告: 假设性参数 ${param_name} 不在上下文中")
-
-        # 提取所有占位符，确保它们在上下文中
-        placeholders = re.findall(r'\$\{([^}]+)\}', text)
-
-        # 检查所有占位符是否在上下文中
-        for placeholder in placeholders:
-            if placeholder in context:
-                print(f"✓ 找到占位符 ${placeholder} 在上下文中，值: {context[placeholder]}")
-            else:
-                print(f"✗ 警告: 占位符 ${placeholder} 不在上下文中")
-
-        for iteration in range(max_iterations):
-            new_text = text
-            for key, value in context.items():
-                # 处理标准格式 ${param_name}
-                placeholder = f'${{{key}}}'
-                if placeholder in new_text:
-                    new_text = new_text.replace(placeholder, str(value))
-                    print(f"替换占位符 {placeholder} -> {value}")
-
-                # 处理假设性参数格式 $param_name
-                placeholder_simple = f'${key}'
-                if placeholder_simple in new_text and f'${{{key}}}' not in new_text:
-                    # 只在JSON字符串中替换简单格式，避免误替换
-                    if re.search(r'[\"\']\s*\$' + key + r'\s*[\"\']', new_text) or re.search(r':\s*\$' + key, new_text):
-                        new_text = new_text.replace(placeholder_simple, str(value))
-                        print(f"替换假设性参数 {placeholder_simple} -> {value}")
-
-            # 如果没有变化，说明已经没有占位符了
-            if new_text == text:
-                break
-
-            text = new_text
-
-        # 记录替换结果
-        if original_text != text:
-            print(f"占位符替换结果: {original_text} -> {text}")
-
-        # 再次检查是否还有未替换的占位符
-        remaining_placeholders = re.findall(r'\$\{([^}]+)\}', text)
-        if remaining_placeholders:
-            print(f"警告: 仍有未替换的占位符: {remaining_placeholders}")
-
-        # 检查是否还有未替换的假设性参数
-        remaining_simple_placeholders = re.findall(r'\$(\w+)(?![^{])', text)
-        if remaining_simple_placeholders:
-            print(f"警告: 仍有未替换的假设性参数: {remaining_simple_placeholders}")
-
-        return text
-
-    def _extract_params(self, response, extract_params):
+    def _extract_params(self, response, extract_params, compiled_exprs=None, debug=False, values=None):
         """
         从响应中提取参数
 
@@ -481,12 +588,15 @@ class ApiClient:
                     ...
                 ]
 
+            compiled_exprs: 预先编译好的路径表达式 {路径: 表达式}，缺失时从编译缓存获取
+            debug: 所属任务是否开启调试诊断
+            values: 流式解析得到的 {路径: 值}，给出时不再在响应中查找
+
         返回:
             提取的参数字典
         """
         extracted = {}
-        print(f"=== 提取参数 ===")
-        print(f"响应数据: {response}")
+        verbose = debug_enabled(log, debug)
 
         for param in extract_params:
             name = param.get('name')
@@ -494,50 +604,45 @@ class ApiClient:
             param_type = param.get('type', 'string')
 
             if not name or not path:
-                print(f"警告: 参数配置不完整，跳过: {param}")
+                if verbose:
+                    emit_debug(log, debug, '参数配置不完整，跳过', param=param)
                 continue
 
-            print(f"尝试提取参数: name={name}, path={path}, type={param_type}")
-
             try:
-                # 处理特殊路径格式，如 $data.token 转换为 $.data.token
-                if path.startswith('$') and not path.startswith('$.'):
-                    path = '$.' + path[1:]  # 在$后添加.
-                    print(f"转换路径格式: {path}")
-
-                # 使用jsonpath_ng解析JSON路径
-                jsonpath_expr = parse(path)
-                matches = jsonpath_expr.find(response)
+                if values is not None:
+                    matches = [values[path]] if path in values else []
+                else:
+                    # 使用预先编译的路径表达式，$data.token 等格式已在编译时规范化
+                    jsonpath_expr = (compiled_exprs or {}).get(path) or jsonpath_cache.get(path)
+                    matches = [match.value for match in jsonpath_expr.find(response)]
 
                 if matches:
-                    value = matches[0].value
-                    print(f"找到匹配值: {value}")
+                    value = matches[0]
 
                     # 类型转换
                     if param_type == 'number':
                         try:
                             value = float(value) if '.' in str(value) else int(value)
-                            print(f"转换为数字类型: {value}")
                         except ValueError:
-                            print(f"警告: 无法将值 {value} 转换为数字类型")
+                            log.warning('无法将提取的值转换为数字类型', extra={'fields': {'param': name, 'path': path}})
                             continue
                     elif param_type == 'boolean':
                         if isinstance(value, str):
                             value = value.lower() in ('true', '1', 'yes', 'on')
-                            print(f"转换为布尔类型: {value}")
 
                     # 验证提取的值是否为空
                     if value is None or (isinstance(value, str) and not value.strip()):
-                        print(f"警告: 参数 {name} 的值为空")
+                        if verbose:
+                            emit_debug(log, debug, '提取的参数值为空', param=name, path=path)
                         continue
 
                     extracted[name] = value
-                    print(f"✓ 成功提取参数 {name}: {value} (类型: {type(value).__name__})")
-                else:
-                    print(f"✗ 警告: 路径 {path} 在响应中未找到匹配项")
+                elif verbose:
+                    emit_debug(log, debug, '路径在响应中未找到匹配项', param=name, path=normalize_path(path))
             except Exception as e:
                 # 提取参数失败，记录错误但继续处理其他参数
-                print(f"✗ 提取参数 {name} 失败: {str(e)}")
+                log.warning('提取参数失败', extra={'fields': {'param': name, 'path': path, 'error': str(e)}})
 
-        print(f"提取的所有参数: {extracted}")
+        if verbose:
+            emit_debug(log, debug, '参数提取结果', extracted=mask_secrets(extracted))
         return extracted
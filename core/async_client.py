@@ -0,0 +1,343 @@
+# 异步API调用模块，在单个事件循环中并发执行大量API调用链
+
+import asyncio
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+try:
+    import httpx
+except ImportError:  # 可选依赖，未安装时无法启用异步执行引擎
+    httpx = None
+
+from core.host_guard import CircuitOpen
+from core.retry import RetryPolicy, retry_budget
+from core.step_graph import StepGraph
+from core.stream import ResponseTooLarge
+from core.template import compile_steps
+from core.timeouts import ChainTimeouts, request_timeout, timeout_error
+
+
+class AsyncApiClient:
+    """
+    基于 asyncio + httpx 的API调用链执行引擎
+
+    所有调用链运行在一个后台事件循环线程中，等待网络I/O时不占用
+    操作系统线程。占位符替换、响应处理和参数提取复用 ApiClient 的逻辑，
+    返回的结果结构与 ApiClient.execute_chain 完全一致。
+    """
+
+    def __init__(self, api_client, max_concurrency=200, per_host_limit=20):
+        if httpx is None:
+            raise RuntimeError('异步执行引擎需要安装 httpx: pip install httpx')
+
+        self.api_client = api_client
+        self.max_concurrency = max_concurrency  # 全局同时进行的请求数上限
+        self.per_host_limit = per_host_limit  # 单个主机同时进行的请求数上限
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='async-engine')
+        self.thread.daemon = True
+        self.thread.start()
+
+        # 信号量和客户端必须在事件循环线程中创建
+        asyncio.run_coroutine_threadsafe(self._setup(), self.loop).result()
+
+    async def _setup(self):
+        """在事件循环中初始化客户端和并发限制"""
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.host_semaphores = {}
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency
+            )
+        )
+
+    def _host_semaphore(self, url):
+        """获取URL所属主机的并发限制"""
+        parts = urlsplit(url)
+        key = f'{parts.scheme}://{parts.netloc}'.lower()
+        if key not in self.host_semaphores:
+            self.host_semaphores[key] = asyncio.Semaphore(self.per_host_limit)
+        return self.host_semaphores[key]
+
+    def _params(self, method, url, body):
+        """GET 请求的请求体作为查询参数；httpx 传入 params 时会替换URL中原有的查询参数，先合并，与 requests 一致"""
+        if method != 'GET' or body is None:
+            return None
+        return httpx.QueryParams(urlsplit(url).query).merge(body)
+
+    def _timeout(self, timeouts):
+        """httpx 的超时设置，写入和等待连接池的超时与读取超时相同"""
+        connect, read = request_timeout(timeouts)
+        return httpx.Timeout(connect=connect, read=read, write=read, pool=read)
+
+    async def execute_step(self, step, context=None, timeouts=None):
+        """执行单个API步骤，参数和返回结构与 ApiClient.execute_step 相同"""
+        if context is None:
+            context = {}
+        if timeouts is None:
+            timeouts = ChainTimeouts().for_step(step)
+
+        result = {
+            'success': False,
+            'response': None,
+            'status_code': None,
+            'error': None,
+            'extracted_params': {},
+            'timeouts': timeouts
+        }
+
+        start = time.perf_counter()
+        started = time.monotonic()
+        timing = {}
+        guarded = False
+        try:
+            url, method, headers, body = self.api_client._prepare_request(step, context)
+
+            # 无论是否成功，先记录请求信息
+            result['url'] = url
+            result['method'] = method
+            result['headers'] = headers
+            result['body'] = body
+
+            # 开启缓存的步骤，缓存的响应仍在有效期内时不发请求
+            cached = self.api_client._cache_lookup(step, method, url, headers, body)
+            if cached is not None and cached[1] is not None and cached[1].fresh():
+                self.api_client._handle_cached(step, result, cached[1], 'hit')
+                return result
+            headers = self.api_client._conditional_headers(cached, headers)
+
+            # 主机熔断中时不发请求，直接失败
+            guarded = self.api_client._check_host(url)
+
+            async with self.semaphore, self._host_semaphore(url):
+                trace = self._tracer(timing)
+                if step.get('stream') or timeouts['total']:
+                    await self._stream_request(
+                        step, result, method, url, headers, body, trace, timeouts, started, cached
+                    )
+                    return result
+
+                response = await self.client.request(
+                    method=method,
+                    url=url,
+                    headers=headers,
+                    json=body if method in ['POST', 'PUT', 'PATCH'] else None,
+                    params=self._params(method, url, body),
+                    timeout=self._timeout(timeouts),
+                    extensions={'trace': trace}
+                )
+
+            if self.api_client._handle_not_modified(step, result, cached, response.status_code, response.headers):
+                return result
+            content_type = response.headers.get('content-type', '')
+            self.api_client._handle_response(
+                step, result, response.status_code, content_type, response.text, response.json
+            )
+            self.api_client._cache_store(
+                cached, result, response.status_code, content_type, response.text, response.headers
+            )
+
+        except CircuitOpen as e:
+            result['error'] = str(e)
+            result['error_type'] = 'circuit_open'
+        except ResponseTooLarge as e:
+            result['error'] = str(e)
+            result['error_type'] = 'too_large'
+        except httpx.ConnectTimeout:
+            result['error'] = timeout_error('连接', timeouts, started)
+            result['error_type'] = 'timeout'
+        except httpx.TimeoutException:
+            result['error'] = timeout_error('读取', timeouts, started)
+            result['error_type'] = 'timeout'
+        except TimeoutError as e:
+            result['error'] = f"请求超时({e})"
+            result['error_type'] = 'timeout'
+        except httpx.TransportError:
+            result['error'] = "连接错误"
+            result['error_type'] = 'connection'
+        except json.JSONDecodeError:
+            result['error'] = "响应不是有效的JSON格式"
+            result['error_type'] = 'invalid_json'
+        except Exception as e:
+            result['error'] = f"未知错误: {str(e)}"
+            result['error_type'] = 'unknown'
+        finally:
+            if guarded:
+                self.api_client._record_host(result)
+            timing['total'] = time.perf_counter() - start
+            result['timings'] = {phase: round(value, 6) for phase, value in timing.items()}
+
+        return result
+
+    def _tracer(self, timing):
+        """
+        httpcore 的 trace 回调，记录新建连接和首字节耗时
+
+        connect 包含域名解析、TCP连接和TLS握手(异步引擎中无法单独测量域名解析)，
+        ttfb 为发出请求到收到响应头的时间，与 ApiClient 记录的阶段一致。
+        """
+        start = time.perf_counter()
+        marks = {}
+
+        async def trace(event_name, info):
+            now = time.perf_counter()
+            if event_name == 'connection.connect_tcp.started':
+                marks['connect'] = now
+            elif event_name in ('connection.connect_tcp.complete', 'connection.start_tls.complete'):
+                if 'connect' in marks:
+                    timing['connect'] = now - marks['connect']
+            elif event_name.endswith('.receive_response_headers.complete'):
+                timing['ttfb'] = now - start
+        return trace
+
+    async def _stream_request(self, step, result, method, url, headers, body, trace, timeouts, started, cached=None):
+        """按块读取响应，设置了总超时时从 started(time.monotonic())起整个请求限制在总超时内"""
+        request = self._read_stream(step, result, method, url, headers, body, trace, timeouts, cached)
+        if not timeouts['total']:
+            return await request
+        try:
+            return await asyncio.wait_for(request, max(started + timeouts['total'] - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"总时间超过 {timeouts['total']:g} 秒") from None
+
+    async def _read_stream(self, step, result, method, url, headers, body, trace, timeouts, cached=None):
+        """
+        流式模式：边读边解析，只保留提取路径上的值，与 ApiClient 的流式模式一致；
+        非流式步骤在这里读取全文，开启缓存时与 ApiClient._send 一样处理 304 和缓存
+        """
+        async with self.client.stream(
+            method,
+            url,
+            headers=headers,
+            json=body if method in ['POST', 'PUT', 'PATCH'] else None,
+            params=self._params(method, url, body),
+            timeout=self._timeout(timeouts),
+            extensions={'trace': trace}
+        ) as response:
+            if self.api_client._handle_not_modified(step, result, cached, response.status_code, response.headers):
+                return
+            content_type = response.headers.get('content-type', '')
+            chunks = response.aiter_bytes(self.api_client.stream_chunk_size)
+            extractor = None
+            if step.get('stream'):
+                extractor = self.api_client._stream_extractor(step, response.status_code, content_type)
+            if extractor is not None:
+                async for chunk in chunks:
+                    extractor.feed(chunk)
+                    if extractor.done:
+                        break
+                self.api_client._handle_streamed_response(step, result, response.status_code, extractor)
+                return
+
+            max_bytes = self.api_client._stream_max_bytes(step) if step.get('stream') else 0
+            data = bytearray()
+            async for chunk in chunks:
+                data += chunk
+                if max_bytes and len(data) > max_bytes:
+                    raise ResponseTooLarge(f'响应超过大小上限({max_bytes}字节)')
+            text = bytes(data).decode(response.encoding or 'utf-8', 'replace')
+            self.api_client._handle_response(
+                step, result, response.status_code, content_type, text, lambda: json.loads(text)
+            )
+            self.api_client._cache_store(cached, result, response.status_code, content_type, text, response.headers)
+
+    async def execute_chain(self, steps, retry_times=1, parallelism=1, timeout=None):
+        """执行API调用链，参数和返回结构与 ApiClient.execute_chain 相同"""
+        steps = compile_steps(steps)
+        timeouts = ChainTimeouts(timeout)
+        if parallelism > 1 and len(steps) > 1:
+            return await self._execute_graph(steps, retry_times, parallelism, timeouts)
+
+        result = {
+            'success': False,
+            'steps': [],
+            'error': None
+        }
+
+        context = {}  # 用于存储步骤间传递的参数
+
+        for i, step in enumerate(steps):
+            # 超过调用链截止时间后不再执行剩余的步骤
+            if timeouts.expired():
+                result['error'] = timeouts.cancelled(len(steps) - i)
+                return result
+
+            step_result, attempts = await self._execute_with_retry(step, context, retry_times, timeouts)
+            result['steps'].append(self.api_client._step_entry(steps, i, step_result, attempts))
+
+            # 如果步骤失败，终止链式调用
+            if not step_result['success']:
+                result['error'] = f"步骤{i+1}失败: {step_result['error']}"
+                return result
+
+            extracted_params = step_result['extracted_params']
+            context.update(extracted_params)
+            if self.api_client._debug_enabled(step):
+                self.api_client._check_chain_progress(steps, i, extracted_params, context)
+
+        result['success'] = True
+        return result
+
+    async def _execute_with_retry(self, step, context, retry_times, timeouts):
+        """
+        执行步骤，可重试的失败按重试策略退避后重试，返回 (步骤结果, 包含重试在内的执行次数)
+
+        退避等待后会超过调用链截止时间时不再重试。
+        """
+        policy = RetryPolicy.for_step(step, retry_times)
+        retry_budget.deposit()
+        retry = 0
+        while True:
+            wait, step_result = self.api_client._reserve_host(step, context)
+            if step_result is None:
+                if wait:
+                    await asyncio.sleep(wait)
+                step_result = await self.execute_step(step, context, timeouts.for_step(step))
+            if step_result['success']:
+                return step_result, retry + 1
+            delay = self.api_client._retry_delay(policy, step_result, retry, timeouts)
+            if delay is None:
+                return step_result, retry + 1
+            await asyncio.sleep(delay)  # 等待期间不占用线程
+            retry += 1
+
+    async def _execute_graph(self, steps, retry_times, parallelism, timeouts):
+        """按参数依赖并发执行调用链，调度规则与 ApiClient._run_graph 相同(见 StepGraph)，等待期间不占用线程"""
+        graph = StepGraph(self.api_client, steps, retry_times, parallelism, timeouts)
+        running = {}  # {Task: 步骤序号}
+        while graph.unfinished():
+            for i, context in graph.start():
+                task = asyncio.ensure_future(self.execute_step(steps[i], context, timeouts.for_step(steps[i])))
+                running[task] = i
+
+            timeout = graph.timeout()
+            if not running:
+                if timeout is None:
+                    break
+                await asyncio.sleep(timeout)
+                continue
+
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                graph.finish(running.pop(task), task.result())
+
+        return graph.result()
+
+    def submit_chain(self, steps, retry_times=1, parallelism=1, timeout=None):
+        """从其他线程提交调用链，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(
+            self.execute_chain(steps, retry_times, parallelism, timeout), self.loop
+        )
+
+    def close(self):
+        """关闭客户端并停止事件循环"""
+        if self.loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self.client.aclose(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
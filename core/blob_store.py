@@ -0,0 +1,145 @@
+# 大对象存储模块，按内容哈希保存超过内联上限的日志字段
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# 日志字段被移出后留下的引用标记
+BLOB_KEY = '$blob'
+
+
+class BlobStore:
+    """
+    按内容寻址的大对象存储
+
+    对象以 SHA-256 哈希命名，存放在 blob_dir/哈希前两位/哈希 下，
+    相同内容只保存一份。开启压缩时以 gzip 格式保存。
+
+    对象的引用计数在引用它的日志写入索引时才增加，保存对象到日志写入之间有一段时间差。
+    保存时刷新对象的修改时间，清理不再被引用的对象时跳过 orphan_grace 秒内保存过的对象，
+    避免删掉刚被新日志复用、引用计数还没来得及增加的对象。
+    """
+
+    def __init__(self, blob_dir, compress=True, orphan_grace=600):
+        self.blob_dir = blob_dir
+        self.compress = compress
+        self.orphan_grace = orphan_grace
+        self.lock = threading.Lock()  # 复用已有对象与删除对象互斥
+
+        if not os.path.exists(blob_dir):
+            os.makedirs(blob_dir)
+
+    def _path(self, digest):
+        """对象哈希对应的文件路径"""
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def put(self, data):
+        """保存对象并返回哈希，内容已存在时直接返回"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        with self.lock:
+            try:
+                os.utime(path)
+                return digest
+            except FileNotFoundError:
+                pass
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        # 先写临时文件再重命名，读取方不会看到写了一半的对象
+        fd, tmp_path = tempfile.mkstemp(prefix=digest + '.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(gzip.compress(data, mtime=0) if self.compress else data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return digest
+
+    def get(self, digest):
+        """读取对象内容，不存在时返回 None"""
+        try:
+            with open(self._path(digest), 'rb') as f:
+                data = f.read()
+        except (FileNotFoundError, ValueError):
+            return None
+
+        # 按文件头判断是否压缩，压缩开关变化后旧对象仍然可读
+        if data[:2] == b'\x1f\x8b':
+            data = gzip.decompress(data)
+        return data
+
+    def delete(self, digests):
+        """删除不再被引用的对象，返回 orphan_grace 秒内保存过、暂不删除的对象哈希"""
+        skipped = []
+        with self.lock:
+            now = time.time()
+            for digest in digests:
+                path = self._path(digest)
+                try:
+                    if now - os.path.getmtime(path) < self.orphan_grace:
+                        skipped.append(digest)
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return skipped
+
+    def clear(self):
+        """删除所有对象"""
+        shutil.rmtree(self.blob_dir, ignore_errors=True)
+        os.makedirs(self.blob_dir)
+
+
+def spill(details, store, max_bytes, preview_chars=200):
+    """
+    将日志详情中序列化后超过 max_bytes 的字段移入大对象存储
+
+    被移出的字段替换为 {'$blob': 哈希, 'size': 字节数, 'preview': 开头部分}，
+    打开日志详情时再由 resolve 还原。
+    """
+    if not max_bytes or not isinstance(details, dict):
+        return details
+
+    spilled = {}
+    for key, value in details.items():
+        if isinstance(value, (dict, list, str)):
+            data = json.dumps(value, ensure_ascii=False).encode('utf-8')
+            if len(data) > max_bytes:
+                text = value if isinstance(value, str) else data.decode('utf-8')
+                value = {BLOB_KEY: store.put(data), 'size': len(data), 'preview': text[:preview_chars]}
+        spilled[key] = value
+    return spilled
+
+
+def blob_refs(log):
+    """日志中引用的对象哈希"""
+    details = log.get('details')
+    if not isinstance(details, dict):
+        return []
+    return [value[BLOB_KEY] for value in details.values() if isinstance(value, dict) and BLOB_KEY in value]
+
+
+def resolve(details, store):
+    """将日志详情中的对象引用还原为原始内容，对象丢失时保留引用"""
+    if not isinstance(details, dict):
+        return details
+
+    resolved = {}
+    for key, value in details.items():
+        if isinstance(value, dict) and BLOB_KEY in value:
+            data = store.get(value[BLOB_KEY])
+            if data is not None:
+                value = json.loads(data)
+        resolved[key] = value
+    return resolved
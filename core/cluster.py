@@ -0,0 +1,375 @@
+# 集群模块，多个节点通过共享的 SQLite 文件协调调度，每次触发只由一个节点执行
+
+import socket
+import sqlite3
+import threading
+import time
+
+from core.diagnostics import get_logger
+
+log = get_logger('cluster')
+
+LEADER_LEASE = 'scheduler'
+
+
+class ClusterStore:
+    """
+    集群共享状态
+
+    保存在共享磁盘上的 SQLite 文件中，包含三张表:
+        nodes   - 节点心跳
+        leases  - 调度主节点租约，只有持有租约的节点负责定时触发
+        firings - 触发队列，主节点写入，各节点以原子更新认领，每条只被认领一次
+
+    数据库使用默认的回滚日志模式(WAL 不支持网络文件系统)，所有写操作以
+    BEGIN IMMEDIATE 开始，多个进程之间互斥。各节点时钟需要保持同步。
+    """
+
+    def __init__(self, db_path, node_id, lease_seconds=15):
+        self.db_path = db_path
+        self.node_id = node_id
+        self.lease_seconds = lease_seconds
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._create_tables()
+
+    def _create_tables(self):
+        """创建集群表"""
+        with self.lock:
+            self.conn.executescript('''
+                CREATE TABLE IF NOT EXISTS nodes (
+                    node_id TEXT PRIMARY KEY,
+                    heartbeat REAL,
+                    started REAL
+                );
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    node_id TEXT,
+                    expires REAL
+                );
+                CREATE TABLE IF NOT EXISTS firings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_id INTEGER,
+                    max_instances INTEGER,
+                    state TEXT,
+                    created_by TEXT,
+                    created_at REAL,
+                    node_id TEXT,
+                    claimed_at REAL,
+                    finished_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_firings_state ON firings (state, id);
+                CREATE INDEX IF NOT EXISTS idx_firings_task ON firings (task_id, state);
+            ''')
+
+    def _transaction(self, func, *args):
+        """在写事务中执行 func(cursor, *args)，出错时回滚"""
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                result = func(cursor, *args)
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+            cursor.execute('COMMIT')
+            return result
+
+    def heartbeat(self, started=None):
+        """更新本节点心跳"""
+        now = time.time()
+
+        def run(cursor):
+            cursor.execute(
+                'INSERT INTO nodes (node_id, heartbeat, started) VALUES (?, ?, ?) '
+                'ON CONFLICT (node_id) DO UPDATE SET heartbeat = excluded.heartbeat',
+                (self.node_id, now, started or now)
+            )
+        self._transaction(run)
+
+    def abandon_own_firings(self):
+        """节点重启时，上次运行中认领但未完成的触发标记为已放弃"""
+        def run(cursor):
+            cursor.execute(
+                "UPDATE firings SET state = 'abandoned', finished_at = ? WHERE node_id = ? AND state = 'running'",
+                (time.time(), self.node_id)
+            )
+        self._transaction(run)
+
+    def acquire_leadership(self):
+        """获取或续约调度主节点租约，返回本节点是否为主节点"""
+        now = time.time()
+
+        def run(cursor):
+            row = cursor.execute('SELECT node_id, expires FROM leases WHERE name = ?', (LEADER_LEASE,)).fetchone()
+            if row and row[0] != self.node_id and row[1] > now:
+                return False
+            cursor.execute(
+                'INSERT INTO leases (name, node_id, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET node_id = excluded.node_id, expires = excluded.expires',
+                (LEADER_LEASE, self.node_id, now + self.lease_seconds)
+            )
+            return True
+        return self._transaction(run)
+
+    def release_leadership(self):
+        """主动释放主节点租约，其他节点无需等待租约过期即可接管"""
+        def run(cursor):
+            cursor.execute('DELETE FROM leases WHERE name = ? AND node_id = ?', (LEADER_LEASE, self.node_id))
+        self._transaction(run)
+
+    def leave(self):
+        """节点退出集群"""
+        def run(cursor):
+            cursor.execute('DELETE FROM nodes WHERE node_id = ?', (self.node_id,))
+        self._transaction(run)
+
+    def enqueue(self, task, policy, fenced=True, max_pending=100):
+        """
+        写入一次触发，返回是否被接受
+
+        参数:
+            task: 任务
+            policy: 并发策略 skip/queue/allow，按全集群排队和运行中的触发数判断
+            fenced: 是否要求本节点持有主节点租约，定时触发需要，手动执行不需要
+            max_pending: queue 策略下每个任务最多排队的触发数
+        """
+        now = time.time()
+        max_instances = max(int(task.get('max_instances', 1) or 1), 1)
+        if policy not in ('queue', 'allow'):
+            policy = 'skip'
+
+        def run(cursor):
+            if fenced:
+                row = cursor.execute('SELECT node_id, expires FROM leases WHERE name = ?', (LEADER_LEASE,)).fetchone()
+                if not row or row[0] != self.node_id or row[1] <= now:
+                    return False
+
+            if policy != 'allow':
+                counts = dict(cursor.execute(
+                    "SELECT state, COUNT(*) FROM firings WHERE task_id = ? AND state IN ('queued', 'running') "
+                    "GROUP BY state", (task['id'],)
+                ).fetchall())
+                if policy == 'skip' and counts.get('queued', 0) + counts.get('running', 0) >= max_instances:
+                    return False
+                if policy == 'queue' and counts.get('queued', 0) >= max_pending:
+                    return False
+
+            cursor.execute(
+                "INSERT INTO firings (task_id, max_instances, state, created_by, created_at) "
+                "VALUES (?, ?, 'queued', ?, ?)",
+                (task['id'], 0 if policy == 'allow' else max_instances, self.node_id, now)
+            )
+            return True
+        return self._transaction(run)
+
+    def claim(self, limit):
+        """
+        认领最多 limit 条排队中的触发，返回 [(触发ID, 任务ID), ...]
+
+        同一任务运行中的触发数达到 max_instances 时暂不认领(0 表示不限)，
+        认领在写事务中完成，同一条触发不会被两个节点认领。
+        """
+        if limit <= 0:
+            return []
+        now = time.time()
+
+        def run(cursor):
+            rows = cursor.execute(
+                "SELECT id, task_id, max_instances FROM firings WHERE state = 'queued' ORDER BY id LIMIT ?",
+                (limit * 4,)
+            ).fetchall()
+            if not rows:
+                return []
+
+            task_ids = list({row[1] for row in rows})
+            marks = ','.join('?' * len(task_ids))
+            running = dict(cursor.execute(
+                f"SELECT task_id, COUNT(*) FROM firings WHERE state = 'running' AND task_id IN ({marks}) "
+                f"GROUP BY task_id", task_ids
+            ).fetchall())
+
+            claimed = []
+            for firing_id, task_id, max_instances in rows:
+                if max_instances and running.get(task_id, 0) >= max_instances:
+                    continue
+                running[task_id] = running.get(task_id, 0) + 1
+                claimed.append((firing_id, task_id))
+                if len(claimed) >= limit:
+                    break
+
+            cursor.executemany(
+                "UPDATE firings SET state = 'running', node_id = ?, claimed_at = ? WHERE id = ?",
+                [(self.node_id, now, firing_id) for firing_id, _ in claimed]
+            )
+            return claimed
+        return self._transaction(run)
+
+    def finish(self, firing_id, state='done'):
+        """标记触发执行结束"""
+        def run(cursor):
+            cursor.execute(
+                'UPDATE firings SET state = ?, finished_at = ? WHERE id = ?', (state, time.time(), firing_id)
+            )
+        self._transaction(run)
+
+    def recover(self, retention_seconds=86400):
+        """
+        主节点定期维护
+
+        心跳超时节点上运行中的触发标记为已放弃(不会重新执行，保证每次触发最多执行一次)，
+        清理超过保留时间的已结束触发和长期失联的节点。
+        """
+        now = time.time()
+
+        def run(cursor):
+            dead_before = now - self.lease_seconds
+            cursor.execute(
+                "UPDATE firings SET state = 'abandoned', finished_at = ? WHERE state = 'running' AND node_id NOT IN "
+                "(SELECT node_id FROM nodes WHERE heartbeat >= ?)", (now, dead_before)
+            )
+            abandoned = cursor.rowcount
+            cursor.execute(
+                "DELETE FROM firings WHERE state IN ('done', 'failed', 'abandoned') AND finished_at < ?",
+                (now - retention_seconds,)
+            )
+            cursor.execute('DELETE FROM nodes WHERE heartbeat < ?', (now - retention_seconds,))
+            return abandoned
+        return self._transaction(run)
+
+    def stats(self):
+        """集群状态: 节点、主节点和各状态的触发数"""
+        now = time.time()
+        with self.lock:
+            nodes = self.conn.execute('SELECT node_id, heartbeat, started FROM nodes ORDER BY node_id').fetchall()
+            leader = self.conn.execute(
+                'SELECT node_id, expires FROM leases WHERE name = ?', (LEADER_LEASE,)
+            ).fetchone()
+            firings = dict(self.conn.execute('SELECT state, COUNT(*) FROM firings GROUP BY state').fetchall())
+        return {
+            'node_id': self.node_id,
+            'leader': leader[0] if leader and leader[1] > now else None,
+            'nodes': [
+                {
+                    'node_id': node_id,
+                    'alive': heartbeat >= now - self.lease_seconds,
+                    'heartbeat_age': round(now - heartbeat, 1),
+                    'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started))
+                }
+                for node_id, heartbeat, started in nodes
+            ],
+            'firings': firings
+        }
+
+    def close(self):
+        """关闭数据库连接"""
+        with self.lock:
+            self.conn.close()
+
+
+class ClusterNode:
+    """
+    集群节点
+
+    心跳线程定期更新心跳并争取主节点租约：成为主节点后按任务文件调度定时触发，
+    失去租约后移除所有定时触发。认领线程从触发队列认领任务交给本节点的调度器执行，
+    执行能力随节点数横向扩展；节点宕机后租约过期，由其他节点接管调度。
+    """
+
+    def __init__(self, store, heartbeat_interval=5, poll_interval=1.0, max_pending=100):
+        self.store = store
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.max_pending = max_pending
+        self.is_leader = False
+        self.scheduler = None
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    @property
+    def node_id(self):
+        return self.store.node_id
+
+    def start(self, scheduler):
+        """加入集群，启动心跳和认领线程"""
+        self.scheduler = scheduler
+        self.started = time.time()
+        self.store.abandon_own_firings()
+        self.tick()
+
+        for target, name in ((self._heartbeat_loop, 'cluster-heartbeat'), (self._claim_loop, 'cluster-claim')):
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def tick(self):
+        """一次心跳：续约主节点租约，主节点同步定时触发并做维护"""
+        self.store.heartbeat(self.started)
+        leader = self.store.acquire_leadership()
+
+        if leader:
+            if not self.is_leader:
+                log.info('成为调度主节点', extra={'fields': {'node_id': self.node_id}})
+            self.is_leader = True
+            self.scheduler.sync_jobs()
+            abandoned = self.store.recover()
+            if abandoned:
+                log.warning('失联节点上的触发已放弃', extra={'fields': {'count': abandoned}})
+        elif self.is_leader:
+            log.warning('失去调度主节点租约', extra={'fields': {'node_id': self.node_id}})
+            self.is_leader = False
+            self.scheduler.clear_jobs()
+
+    def _heartbeat_loop(self):
+        """后台线程：定期心跳"""
+        while not self.stop_event.wait(self.heartbeat_interval):
+            try:
+                self.tick()
+            except Exception:
+                log.exception('集群心跳失败')
+
+    def _claim_loop(self):
+        """后台线程：按空闲执行能力认领触发并投递到本节点执行"""
+        while not self.stop_event.wait(self.poll_interval):
+            try:
+                for firing_id, task_id in self.store.claim(self.scheduler.free_slots()):
+                    self.scheduler.run_firing(firing_id, task_id)
+            except Exception:
+                log.exception('认领触发失败')
+
+    def enqueue(self, task, policy, fenced=True):
+        """写入一次触发，定时触发只有主节点能写入"""
+        return self.store.enqueue(task, policy, fenced=fenced, max_pending=self.max_pending)
+
+    def finish(self, firing_id, state='done'):
+        """标记触发执行结束"""
+        try:
+            self.store.finish(firing_id, state)
+        except Exception:
+            log.exception('更新触发状态失败', extra={'fields': {'firing_id': firing_id}})
+
+    def stats(self):
+        """集群状态"""
+        return {**self.store.stats(), 'is_leader': self.is_leader}
+
+    def stop(self):
+        """停止心跳和认领，已认领的触发继续执行"""
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def close(self):
+        """退出集群，主节点主动释放租约，调用前需等待已认领的触发执行完毕"""
+        self.stop()
+        if self.is_leader:
+            self.store.release_leadership()
+            self.is_leader = False
+        self.store.leave()
+        self.store.close()
+
+
+def default_node_id():
+    """默认节点ID，同一主机运行多个节点时需要通过配置区分"""
+    return socket.gethostname()
@@ -0,0 +1,169 @@
+# 配置模块，集中管理可调参数，均可通过同名的 XXJOB_ 环境变量覆盖
+
+import os
+
+
+def _env_str(name, default):
+    """读取字符串配置"""
+    return os.environ.get(f'XXJOB_{name}', default)
+
+
+def _env_int(name, default):
+    """读取整数配置"""
+    value = os.environ.get(f'XXJOB_{name}')
+    return int(value) if value else default
+
+
+def _env_bool(name, default):
+    """读取布尔配置"""
+    value = os.environ.get(f'XXJOB_{name}')
+    return value.lower() in ('1', 'true', 'yes', 'on') if value else default
+
+
+def _env_float(name, default):
+    """读取浮点数配置"""
+    value = os.environ.get(f'XXJOB_{name}')
+    return float(value) if value else default
+
+
+# 数据目录
+DATA_DIR = _env_str('DATA_DIR', 'data')
+
+# 运行日志级别(DEBUG/INFO/WARNING/ERROR)和输出格式(text/json)
+# 调试诊断只在 DEBUG 级别或任务单独开启调试时输出
+LOG_LEVEL = _env_str('LOG_LEVEL', 'INFO')
+LOG_FORMAT = _env_str('LOG_FORMAT', 'text')
+
+# 日志分段文件大小上限(字节)，写满后滚动到新分段
+LOG_SEGMENT_MAX_BYTES = _env_int('LOG_SEGMENT_MAX_BYTES', 8 * 1024 * 1024)
+
+# 日志分段最长写入时间(秒)，超过后即使未写满也滚动到新分段，0 表示只按大小滚动
+LOG_SEGMENT_MAX_AGE = _env_int('LOG_SEGMENT_MAX_AGE', 24 * 3600)
+
+# 日志保留策略，0 表示不限:
+#   LOG_RETENTION_DAYS      - 日志最长保留天数
+#   LOG_RETENTION_PER_TASK  - 每个任务最多保留的日志条数
+#   LOG_RETENTION_MAX_BYTES - 日志分段总大小上限(字节)，超出时删除最旧的分段
+# 后台每隔 LOG_COMPACT_INTERVAL 秒清理一次已封存的分段，LOG_ARCHIVE_COMPRESS 开启时压缩归档
+LOG_RETENTION_DAYS = _env_int('LOG_RETENTION_DAYS', 0)
+LOG_RETENTION_PER_TASK = _env_int('LOG_RETENTION_PER_TASK', 0)
+LOG_RETENTION_MAX_BYTES = _env_int('LOG_RETENTION_MAX_BYTES', 0)
+LOG_COMPACT_INTERVAL = _env_int('LOG_COMPACT_INTERVAL', 300)
+LOG_ARCHIVE_COMPRESS = _env_bool('LOG_ARCHIVE_COMPRESS', True)
+
+# 日志详情字段(响应、请求头、请求体等)序列化后超过该大小(字节)时移入按内容寻址的
+# 大对象存储，日志中只保留引用和开头部分，打开日志详情时再读取；0 表示全部内联保存
+LOG_INLINE_MAX_BYTES = _env_int('LOG_INLINE_MAX_BYTES', 16 * 1024)
+LOG_BLOB_COMPRESS = _env_bool('LOG_BLOB_COMPRESS', True)
+# 清理日志后不再被引用的大对象，最近 LOG_BLOB_ORPHAN_GRACE 秒内被保存或复用过的暂不删除，
+# 留给还在写入队列中、引用了该对象的日志
+LOG_BLOB_ORPHAN_GRACE = _env_int('LOG_BLOB_ORPHAN_GRACE', 600)
+
+# 请求失败时错误信息中保留的响应内容字符数，0 表示不截断
+ERROR_TEXT_MAX_CHARS = _env_int('ERROR_TEXT_MAX_CHARS', 1000)
+
+# 步骤开启流式解析(stream)时的响应大小上限(字节，步骤可用 max_response_bytes 单独设置)
+# 和每次读取的字节数；安装 ijson 后只构建参数提取路径上的值
+STREAM_MAX_RESPONSE_BYTES = _env_int('STREAM_MAX_RESPONSE_BYTES', 64 * 1024 * 1024)
+STREAM_CHUNK_SIZE = _env_int('STREAM_CHUNK_SIZE', 64 * 1024)
+# 未安装 ijson 或提取路径包含复杂语法时无法边读边解析，缓冲全部响应的上限(字节)
+STREAM_BUFFER_MAX_BYTES = _env_int('STREAM_BUFFER_MAX_BYTES', 16 * 1024 * 1024)
+
+# 每批日志写入后是否 fsync 到磁盘，关闭后吞吐更高但断电时可能丢失最近的日志
+LOG_FSYNC = _env_bool('LOG_FSYNC', True)
+
+# 后台日志写入：攒够多少条或等待多久(秒)后批量落盘
+LOG_BATCH_SIZE = _env_int('LOG_BATCH_SIZE', 200)
+LOG_FLUSH_INTERVAL = _env_float('LOG_FLUSH_INTERVAL', 0.5)
+
+# 日志队列容量及队列满时的处理方式:
+#   block - 阻塞等待队列腾出空间
+#   drop  - 丢弃新日志并计数
+#   sync  - 在当前线程直接写盘
+LOG_QUEUE_SIZE = _env_int('LOG_QUEUE_SIZE', 10000)
+LOG_BACKPRESSURE = _env_str('LOG_BACKPRESSURE', 'block')
+
+# 任务执行线程池大小，以及每个任务最多排队等待的执行次数(overlap_policy 为 queue 时)
+SCHEDULER_MAX_WORKERS = _env_int('SCHEDULER_MAX_WORKERS', 20)
+SCHEDULER_MAX_PENDING = _env_int('SCHEDULER_MAX_PENDING', 100)
+
+# 页面实时推送: 事件缓冲区保存的最近事件数(断线重连时在此范围内可以接续)，
+# 无事件时发送心跳的间隔(秒)，以及单个推送连接的最长时间(秒)，到期后浏览器自动重连
+EVENT_BUFFER_SIZE = _env_int('EVENT_BUFFER_SIZE', 1000)
+EVENT_KEEPALIVE_INTERVAL = _env_float('EVENT_KEEPALIVE_INTERVAL', 15)
+EVENT_STREAM_TIMEOUT = _env_float('EVENT_STREAM_TIMEOUT', 300)
+
+# 集群模式: 多个节点共享 DATA_DIR 下的任务文件，通过 CLUSTER_DB(默认 DATA_DIR/cluster.db)
+# 协调调度。持有主节点租约的节点负责定时触发，触发写入共享队列后由各节点认领执行，
+# 每次触发只执行一次；节点心跳超过 CLUSTER_LEASE_SECONDS 秒未更新视为宕机，由其他节点接管。
+# 每个节点的日志保存在 DATA_DIR/nodes/<节点ID>/ 下，同一主机运行多个节点时需设置不同的 CLUSTER_NODE_ID
+CLUSTER_ENABLED = _env_bool('CLUSTER_ENABLED', False)
+CLUSTER_DB = _env_str('CLUSTER_DB', '')
+CLUSTER_NODE_ID = _env_str('CLUSTER_NODE_ID', '')
+CLUSTER_LEASE_SECONDS = _env_int('CLUSTER_LEASE_SECONDS', 15)
+CLUSTER_HEARTBEAT_INTERVAL = _env_float('CLUSTER_HEARTBEAT_INTERVAL', 5)
+CLUSTER_POLL_INTERVAL = _env_float('CLUSTER_POLL_INTERVAL', 1.0)
+
+# HTTP连接池: 每个主机保持的连接数、连接数满时是否等待、是否保持长连接、
+# 空闲会话回收时间(秒)以及最多缓存的主机数
+HTTP_POOL_MAXSIZE = _env_int('HTTP_POOL_MAXSIZE', 10)
+HTTP_POOL_BLOCK = _env_bool('HTTP_POOL_BLOCK', False)
+HTTP_KEEP_ALIVE = _env_bool('HTTP_KEEP_ALIVE', True)
+HTTP_IDLE_TIMEOUT = _env_float('HTTP_IDLE_TIMEOUT', 300)
+HTTP_MAX_HOSTS = _env_int('HTTP_MAX_HOSTS', 100)
+
+# 调用链执行引擎: thread - 在工作线程中同步执行; async - 在事件循环中并发执行(需安装 httpx);
+# process - 在独立的工作进程中执行，主进程只负责Web、调度和写日志
+EXECUTION_ENGINE = _env_str('EXECUTION_ENGINE', 'thread')
+
+# 多进程引擎的工作进程数，0 表示与CPU核数相同
+WORKER_PROCESSES = _env_int('WORKER_PROCESSES', 0)
+
+# 异步引擎全局同时进行的请求数上限，以及单个主机同时进行的请求数上限
+ASYNC_MAX_CONCURRENCY = _env_int('ASYNC_MAX_CONCURRENCY', 200)
+ASYNC_PER_HOST_LIMIT = _env_int('ASYNC_PER_HOST_LIMIT', 20)
+
+# 步骤失败重试: 第 n 次重试前等待 [0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2^n)] 秒内的随机时间，
+# 只有状态码在 RETRY_STATUS_CODES 中、或错误类型在 RETRY_ERRORS 中(timeout 超时, connection 连接错误,
+# invalid_json 响应不是JSON, too_large 响应过大)的失败才重试，步骤可用 retry 字段单独配置
+RETRY_BASE_DELAY = _env_float('RETRY_BASE_DELAY', 1.0)
+RETRY_MAX_DELAY = _env_float('RETRY_MAX_DELAY', 30.0)
+RETRY_STATUS_CODES = _env_str('RETRY_STATUS_CODES', '408,425,429,500,502,503,504')
+RETRY_ERRORS = _env_str('RETRY_ERRORS', 'timeout,connection')
+
+# 全局重试预算: 每个步骤首次请求积累 RETRY_BUDGET_RATIO 次重试额度，另外每秒补充
+# RETRY_BUDGET_MIN_PER_SECOND 次，额度最多累积 RETRY_BUDGET_CAPACITY 次(0 表示不限制重试流量)
+RETRY_BUDGET_RATIO = _env_float('RETRY_BUDGET_RATIO', 0.2)
+RETRY_BUDGET_MIN_PER_SECOND = _env_float('RETRY_BUDGET_MIN_PER_SECOND', 1.0)
+RETRY_BUDGET_CAPACITY = _env_int('RETRY_BUDGET_CAPACITY', 100)
+
+# 请求超时(秒): 建立连接的超时、等待响应数据的超时、单次请求的总时间(0 表示不限制)，
+# 以及整个调用链的截止时间(0 表示不限制)，任务和步骤可用 timeout 字段单独设置
+REQUEST_CONNECT_TIMEOUT = _env_float('REQUEST_CONNECT_TIMEOUT', 10)
+REQUEST_READ_TIMEOUT = _env_float('REQUEST_READ_TIMEOUT', 30)
+REQUEST_TOTAL_TIMEOUT = _env_float('REQUEST_TOTAL_TIMEOUT', 0)
+CHAIN_TIMEOUT = _env_float('CHAIN_TIMEOUT', 0)
+
+# 按主机限流: 每个主机每秒最多发出的请求数(0 表示不限流)、允许的突发请求数，
+# 以及排队等待的最长时间(秒)，超过后步骤直接失败
+HOST_RATE_LIMIT = _env_float('HOST_RATE_LIMIT', 0)
+HOST_RATE_BURST = _env_int('HOST_RATE_BURST', 10)
+HOST_RATE_MAX_WAIT = _env_float('HOST_RATE_MAX_WAIT', 30)
+
+# 按主机熔断: 最近 CIRCUIT_WINDOW 次请求中至少 CIRCUIT_MIN_REQUESTS 次、且超时/连接错误/5xx 的比例
+# 达到 CIRCUIT_FAILURE_RATE 时熔断，CIRCUIT_OPEN_SECONDS 秒内发往该主机的步骤直接失败，
+# 之后放行 CIRCUIT_HALF_OPEN_MAX 个试探请求，全部成功则恢复，否则继续熔断
+CIRCUIT_BREAKER_ENABLED = _env_bool('CIRCUIT_BREAKER_ENABLED', True)
+CIRCUIT_WINDOW = _env_int('CIRCUIT_WINDOW', 20)
+CIRCUIT_MIN_REQUESTS = _env_int('CIRCUIT_MIN_REQUESTS', 10)
+CIRCUIT_FAILURE_RATE = _env_float('CIRCUIT_FAILURE_RATE', 0.5)
+CIRCUIT_OPEN_SECONDS = _env_float('CIRCUIT_OPEN_SECONDS', 30)
+CIRCUIT_HALF_OPEN_MAX = _env_int('CIRCUIT_HALF_OPEN_MAX', 1)
+
+# GET 响应缓存(步骤用 cache 字段开启): 最多缓存的响应数、总大小(字节)，以及步骤未设置 ttl 时的有效期(秒)
+RESPONSE_CACHE_MAX_ENTRIES = _env_int('RESPONSE_CACHE_MAX_ENTRIES', 1000)
+RESPONSE_CACHE_MAX_BYTES = _env_int('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+RESPONSE_CACHE_TTL = _env_float('RESPONSE_CACHE_TTL', 60)
+
+# JSON路径编译缓存最多保存的路径数
+JSONPATH_CACHE_SIZE = _env_int('JSONPATH_CACHE_SIZE', 1024)
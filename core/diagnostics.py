@@ -0,0 +1,89 @@
+# 诊断日志模块，提供分级的结构化运行日志，调试诊断只在开启时才计算
+
+import json
+import logging
+import sys
+from datetime import datetime
+
+# 请求头和参数中需要脱敏的字段
+SENSITIVE_KEYS = ('authorization', 'cookie', 'token', 'password', 'secret', 'api-key', 'apikey')
+
+
+def get_logger(name):
+    """获取模块的运行日志记录器"""
+    return logging.getLogger(f'xxjob.{name}')
+
+
+def debug_enabled(logger, debug=False):
+    """任务开启调试或日志级别为 DEBUG 时才需要计算调试诊断"""
+    return debug or logger.isEnabledFor(logging.DEBUG)
+
+
+def emit_debug(logger, debug, message, **fields):
+    """
+    输出调试诊断
+
+    调用方应先用 debug_enabled 判断，避免在生产路径上构造诊断内容。
+    任务单独开启调试时以 INFO 级别输出，不受全局日志级别限制。
+    """
+    level = logging.INFO if debug else logging.DEBUG
+    logger.log(level, message, extra={'fields': fields})
+
+
+def mask_secrets(data):
+    """对请求头、请求体和上下文中的敏感字段脱敏，只保留前4个字符"""
+    if isinstance(data, dict):
+        masked = {}
+        for key, value in data.items():
+            if isinstance(key, str) and any(word in key.lower() for word in SENSITIVE_KEYS):
+                text = str(value)
+                masked[key] = text[:4] + '***' if len(text) > 4 else '***'
+            else:
+                masked[key] = mask_secrets(value)
+        return masked
+    if isinstance(data, list):
+        return [mask_secrets(item) for item in data]
+    return data
+
+
+class TextFormatter(logging.Formatter):
+    """文本格式：时间 级别 模块 消息 key=value ..."""
+
+    def format(self, record):
+        line = f"{datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S')} " \
+               f"{record.levelname} {record.name} {record.getMessage()}"
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(
+                f'{key}={json.dumps(value, ensure_ascii=False, default=str)}' for key, value in fields.items()
+            )
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """JSON格式：每条日志一行 JSON，便于日志系统采集"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level='INFO', fmt='text'):
+    """配置运行日志输出到标准输出"""
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+    root = logging.getLogger('xxjob')
+    root.handlers = [handler]
+    root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    root.propagate = False
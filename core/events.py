@@ -0,0 +1,67 @@
+# 事件模块，向页面推送新日志和任务变更，页面只需下载增量
+
+import threading
+import time
+from collections import deque
+
+
+class EventBus:
+    """
+    进程内事件总线
+
+    最近的事件保存在固定容量的环形缓冲区中，每个事件有递增的序号，订阅方
+    以上次收到的序号为游标读取之后的事件。序号从启动时的毫秒时间戳开始，
+    服务重启后旧游标必然落在缓冲区之外，订阅方据此得知需要重新全量加载。
+    """
+
+    def __init__(self, capacity=1000):
+        self.condition = threading.Condition()
+        self.events = deque(maxlen=capacity)  # [(序号, 类型, 数据), ...]
+        self.seq = int(time.time() * 1000)
+        self.closed = False
+
+    @property
+    def last_id(self):
+        """最新事件的序号，新订阅方以此为游标只接收之后的事件"""
+        with self.condition:
+            return self.seq
+
+    def publish(self, event_type, data):
+        """发布一个事件，返回其序号"""
+        with self.condition:
+            self.seq += 1
+            self.events.append((self.seq, event_type, data))
+            self.condition.notify_all()
+            return self.seq
+
+    def read(self, cursor, timeout=None):
+        """
+        读取游标之后的事件，没有新事件时最多等待 timeout 秒
+
+        返回:
+            (事件列表, 是否需要重新全量加载)，游标过旧(已被挤出缓冲区)或来自
+            上一次运行时需要重新加载，此时事件列表为空
+        """
+        with self.condition:
+            if not self._valid(cursor):
+                return [], True
+            if cursor >= self.seq and timeout and not self.closed:
+                self.condition.wait_for(lambda: self.seq > cursor or self.closed, timeout)
+                if not self._valid(cursor):
+                    return [], True
+            if cursor >= self.seq:
+                return [], False
+            # 序号连续，直接按偏移量切片
+            start = len(self.events) - (self.seq - cursor)
+            return list(self.events)[start:], False
+
+    def _valid(self, cursor):
+        """游标是否仍能接续，调用方需持有锁"""
+        oldest = self.events[0][0] if self.events else self.seq + 1
+        return oldest - 1 <= cursor <= self.seq
+
+    def close(self):
+        """唤醒所有等待中的订阅方，关闭后读取不再等待"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
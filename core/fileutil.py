@@ -0,0 +1,53 @@
+# 文件工具模块，提供崩溃安全的文件写入
+
+import glob
+import json
+import os
+import tempfile
+
+
+def fsync_dir(path):
+    """刷新目录项，确保重命名在断电后依然生效(部分平台不支持时忽略)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write_json(path, data):
+    """
+    原子写入JSON文件
+
+    先写入同目录下的临时文件并 fsync，再用 os.replace 替换目标文件。
+    进程在任何时刻被杀死，目标文件要么是旧内容，要么是完整的新内容。
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    fsync_dir(directory)
+
+
+def remove_stale_temp(path):
+    """删除写入中途被中断而遗留的临时文件"""
+    for tmp_path in glob.glob(glob.escape(path) + '.*.tmp'):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
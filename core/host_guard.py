@@ -0,0 +1,303 @@
+# 出站流量控制模块，按主机限流，并在主机持续失败时熔断，快速失败而不再等待超时
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from multiprocessing.managers import BaseManager
+
+from core.diagnostics import get_logger
+from core.metrics import registry
+
+log = get_logger('host_guard')
+
+CIRCUIT_TRANSITIONS = registry.counter('circuit_transitions_total', '熔断器状态切换次数', ('host', 'state'))
+REQUESTS_REJECTED = registry.counter(
+    'host_requests_rejected_total', '被熔断或限流拒绝的请求数: circuit_open 熔断中, rate_limited 限流等待超时',
+    ('host', 'reason')
+)
+
+
+class CircuitOpen(Exception):
+    """主机熔断中，请求未发出"""
+
+
+class RateLimiter:
+    """
+    单个主机的令牌桶限流
+
+    令牌以每秒 rate 个的速度补充，最多累积 burst 个。申请时预约一个令牌并返回需要等待的秒数，
+    令牌不足时余额为负，后来者依次排在后面，请求被均匀地分散开，而不是同时到达后再一起等待。
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def reserve(self, max_wait):
+        """预约一个令牌，返回需要等待的秒数；等待时间超过 max_wait 时不预约，返回 None"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = max(-(self.tokens - 1) / self.rate, 0)
+        if max_wait and wait > max_wait:
+            return None
+        self.tokens -= 1
+        return wait
+
+    def stats(self):
+        return {'rate': self.rate, 'burst': self.burst, 'tokens': round(self.tokens, 2)}
+
+
+class CircuitBreaker:
+    """
+    单个主机的熔断器
+
+    closed: 正常放行，记录最近 window 次请求的结果，次数不少于 min_requests 且失败率达到
+        failure_rate 时切换到 open
+    open: 拒绝所有请求，open_seconds 秒后切换到 half_open
+    half_open: 放行最多 half_open_max 个试探请求，全部成功后恢复 closed，任一失败重新 open
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, host, window=20, min_requests=10, failure_rate=0.5, open_seconds=30, half_open_max=1):
+        self.host = host
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.half_open_max = half_open_max
+        self.state = self.CLOSED
+        self.outcomes = deque(maxlen=window)  # 最近请求是否失败
+        self.opened_at = 0.0
+        self.probes = 0  # half_open 状态下已放行的试探请求数
+        self.probe_successes = 0
+
+    def _transition(self, state, now):
+        self.state = state
+        if state != self.OPEN:
+            self.outcomes.clear()  # 熔断期间保留触发熔断时的统计，便于查看
+        self.probes = 0
+        self.probe_successes = 0
+        if state == self.OPEN:
+            self.opened_at = now
+        CIRCUIT_TRANSITIONS.inc(host=self.host, state=state)
+
+    def allow(self):
+        """是否放行本次请求"""
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now - self.opened_at < self.open_seconds:
+                return False
+            self._transition(self.HALF_OPEN, now)
+        if self.state == self.HALF_OPEN:
+            if self.probes >= self.half_open_max:
+                return False
+            self.probes += 1
+        return True
+
+    def record(self, failed):
+        """记录一次请求的结果"""
+        now = time.monotonic()
+        if self.state == self.HALF_OPEN:
+            if failed:
+                self._transition(self.OPEN, now)
+            else:
+                self.probe_successes += 1
+                if self.probe_successes >= self.half_open_max:
+                    self._transition(self.CLOSED, now)
+            return
+        if self.state == self.OPEN:
+            return
+
+        self.outcomes.append(failed)
+        failures = sum(self.outcomes)
+        if len(self.outcomes) >= self.min_requests and failures / len(self.outcomes) >= self.failure_rate:
+            self._transition(self.OPEN, now)
+
+    def stats(self):
+        failures = sum(self.outcomes)
+        stats = {
+            'state': self.state,
+            'requests': len(self.outcomes),
+            'failures': failures,
+            'failure_rate': round(failures / len(self.outcomes), 4) if self.outcomes else 0
+        }
+        if self.state == self.OPEN:
+            stats['retry_in'] = round(max(self.open_seconds - (time.monotonic() - self.opened_at), 0), 3)
+        return stats
+
+
+class HostGuard:
+    """
+    按主机(协议+域名+端口)共享的限流器和熔断器
+
+    同一进程内所有调用链共用，主机数量超过 max_hosts 时淘汰最久未访问的主机状态。
+    rate 为 0 时不限流，breaker 为 False 时不熔断。
+    """
+
+    def __init__(self, rate=0, burst=10, max_wait=30, breaker=True, window=20, min_requests=10,
+                 failure_rate=0.5, open_seconds=30, half_open_max=1, max_hosts=1000):
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait  # 限流时最多等待的秒数，超过后直接失败
+        self.breaker = breaker
+        self.breaker_options = {
+            'window': window,
+            'min_requests': min_requests,
+            'failure_rate': failure_rate,
+            'open_seconds': open_seconds,
+            'half_open_max': half_open_max
+        }
+        self.max_hosts = max_hosts
+        self.lock = threading.Lock()
+        self.hosts = OrderedDict()  # {主机: {'limiter': RateLimiter, 'breaker': CircuitBreaker}}
+
+    def _host(self, host):
+        """获取主机状态，调用方需持有锁"""
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = {
+                'limiter': RateLimiter(self.rate, self.burst) if self.rate > 0 else None,
+                'breaker': CircuitBreaker(host, **self.breaker_options) if self.breaker else None
+            }
+            while len(self.hosts) > self.max_hosts:
+                self.hosts.popitem(last=False)
+        else:
+            self.hosts.move_to_end(host)
+        return state
+
+    def reserve(self, host):
+        """为发往主机的请求预约限流令牌，返回需要等待的秒数，超过最长等待时间时返回 None"""
+        if self.rate <= 0:
+            return 0
+        with self.lock:
+            wait = self._host(host)['limiter'].reserve(self.max_wait)
+        if wait is None:
+            REQUESTS_REJECTED.inc(host=host, reason='rate_limited')
+        return wait
+
+    def allow(self, host):
+        """熔断器是否放行发往主机的请求"""
+        if not self.breaker:
+            return True
+        with self.lock:
+            allowed = self._host(host)['breaker'].allow()
+        if not allowed:
+            REQUESTS_REJECTED.inc(host=host, reason='circuit_open')
+        return allowed
+
+    def record(self, host, failed):
+        """记录请求结果，failed 表示主机故障(超时、连接错误或 5xx)"""
+        if not self.breaker:
+            return
+        with self.lock:
+            self._host(host)['breaker'].record(failed)
+
+    def stats(self):
+        """各主机的限流和熔断状态"""
+        with self.lock:
+            hosts = []
+            for host, state in self.hosts.items():
+                entry = {'host': host}
+                if state['breaker'] is not None:
+                    entry['circuit'] = state['breaker'].stats()
+                if state['limiter'] is not None:
+                    entry['rate_limit'] = state['limiter'].stats()
+                hosts.append(entry)
+        return hosts
+
+
+class _GuardManager(BaseManager):
+    """工作进程连接主进程中 HostGuard 使用的管理器"""
+
+
+_GuardManager.register('host_guard')
+
+
+class HostGuardServer:
+    """
+    在主进程中以后台线程对外提供 HostGuard，供多进程执行引擎的工作进程共用
+
+    工作进程各自持有一份 HostGuard 时，限流速率会放大为进程数倍，熔断也互不相通。
+    共用主进程中的一份后，所有进程按同一个令牌桶限流、同一个熔断器熔断，
+    /api/hosts 和熔断指标也能看到工作进程的请求。
+
+    监听地址在创建时确定，应在启动工作进程之前创建，工作进程启动后再调用 start。
+    """
+
+    def __init__(self, guard):
+        self.guard = guard
+        manager_class = type('HostGuardServerManager', (BaseManager,), {})
+        manager_class.register('host_guard', callable=lambda: guard)
+        self.server = manager_class().get_server()
+        self.address = self.server.address
+        self.thread = None
+
+    def start(self):
+        """开始处理工作进程的请求"""
+        self.thread = threading.Thread(target=self.server.serve_forever, name='host-guard-server')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def client(self):
+        """工作进程中使用的 RemoteHostGuard"""
+        return RemoteHostGuard(self.address, self.guard.rate, self.guard.max_wait, self.guard.breaker)
+
+
+class RemoteHostGuard:
+    """
+    工作进程中的 HostGuard，每次调用都交给主进程中的 HostGuardServer 处理，接口与 HostGuard 相同
+
+    在首次调用时连接，fork 出的每个工作进程各自连接。主进程不可达时放行请求并记录警告，
+    不因流量控制不可用而让调用链失败。
+    """
+
+    def __init__(self, address, rate, max_wait, breaker=True):
+        self.address = address
+        self.rate = rate
+        self.max_wait = max_wait
+        self.breaker = breaker
+        self.lock = threading.Lock()
+        self.proxy = None
+        self.pid = None
+
+    def _guard(self):
+        """连接主进程中的 HostGuard，fork 后重新连接"""
+        with self.lock:
+            if self.proxy is None or self.pid != os.getpid():
+                manager = _GuardManager(self.address)
+                manager.connect()
+                self.proxy = manager.host_guard()
+                self.pid = os.getpid()
+            return self.proxy
+
+    def _call(self, method, fallback, *args):
+        try:
+            return getattr(self._guard(), method)(*args)
+        except (OSError, EOFError) as e:
+            with self.lock:
+                self.proxy = None
+            log.warning('无法连接主进程的流量控制，本次请求不限流', extra={'fields': {'error': str(e)}})
+            return fallback
+
+    def reserve(self, host):
+        if self.rate <= 0:
+            return 0
+        return self._call('reserve', 0, host)
+
+    def allow(self, host):
+        if not self.breaker:
+            return True
+        return self._call('allow', True, host)
+
+    def record(self, host, failed):
+        if self.breaker:
+            self._call('record', None, host, failed)
+
+    def stats(self):
+        return self._call('stats', [])
@@ -0,0 +1,190 @@
+# HTTP连接池模块，按主机复用 requests.Session 以保持长连接
+
+import socket
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.util.connection import allowed_gai_family
+
+# 当前线程正在进行的请求的连接耗时记录，由 request_timing 设置
+_local = threading.local()
+
+
+@contextmanager
+def request_timing():
+    """
+    记录当前线程中一次请求建立新连接的耗时
+
+    yield 的字典在建立新连接时写入 dns(域名解析)和 connect(TCP连接及TLS握手)，单位秒；
+    复用已有长连接时字典保持为空。
+    """
+    timing = {}
+    _local.timing = timing
+    try:
+        yield timing
+    finally:
+        _local.timing = None
+
+
+class _TimedConnectionMixin:
+    """
+    建立连接时分别记录域名解析和连接耗时
+
+    单独计时域名解析依赖 urllib3 连接类的私有实现(_new_conn 按 _dns_host 解析并连接)，
+    requirements.txt 限定了验证过的 urllib3 主版本；连接对象没有 _dns_host 时不单独解析，
+    只记录连接总耗时。
+    """
+
+    def connect(self):
+        timing = getattr(_local, 'timing', None)
+        if timing is None:
+            return super().connect()
+
+        start = time.perf_counter()
+        super().connect()
+        timing['connect'] = time.perf_counter() - start - timing.get('dns', 0)
+
+    def _new_conn(self):
+        timing = getattr(_local, 'timing', None)
+        if timing is None or not hasattr(self, '_dns_host'):
+            return super()._new_conn()
+
+        # 先单独解析域名并计时，再依次连接解析出的地址，连接过程不再重复解析
+        start = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(self._dns_host, self.port, allowed_gai_family(), socket.SOCK_STREAM)
+        except OSError:
+            # 解析失败时按原有流程连接，由 urllib3 报告错误
+            return super()._new_conn()
+        timing['dns'] = time.perf_counter() - start
+
+        host = self._dns_host
+        error = None
+        try:
+            for address in dict.fromkeys(sockaddr[0] for *_, sockaddr in addresses):
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except ConnectTimeoutError as e:
+                    error = e
+            raise error
+        finally:
+            self._dns_host = host
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """新建连接时记录域名解析和连接耗时的适配器，配合 request_timing 使用"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool
+        }
+
+
+class SessionPool:
+    """
+    按主机划分的会话池
+
+    同一主机(协议+域名+端口)的请求复用同一个 requests.Session，
+    连接在请求之间保持打开，避免每个步骤重新建立 TCP 连接和 TLS 握手。
+    长时间未使用的会话会被回收，主机数量超过上限时淘汰最久未使用的会话。
+    """
+
+    def __init__(self, pool_maxsize=10, pool_block=False, keep_alive=True, idle_timeout=300, max_hosts=100):
+        self.pool_maxsize = pool_maxsize  # 每个主机最多保持的连接数
+        self.pool_block = pool_block  # 连接数达到上限时是否等待空闲连接
+        self.keep_alive = keep_alive
+        self.idle_timeout = idle_timeout
+        self.max_hosts = max_hosts
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()  # 主机 -> (会话, 最近使用时间)
+        self.last_eviction = time.monotonic()
+
+    @staticmethod
+    def host_key(url):
+        """URL对应的主机标识"""
+        parts = urlsplit(url)
+        return f'{parts.scheme}://{parts.netloc}'.lower()
+
+    def _create_session(self):
+        """创建会话并挂载连接池适配器"""
+        session = requests.Session()
+        adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, pool_block=self.pool_block)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        # 不在任务之间共享Cookie，与每次单独请求的行为保持一致
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def get(self, url):
+        """获取URL所属主机的会话"""
+        key = self.host_key(url)
+        now = time.monotonic()
+        expired = []
+
+        with self.lock:
+            if now - self.last_eviction >= min(self.idle_timeout, 60):
+                expired = self._evict_idle(now)
+                self.last_eviction = now
+
+            if key in self.sessions:
+                session = self.sessions[key][0]
+                self.sessions.move_to_end(key)
+            else:
+                session = self._create_session()
+                while len(self.sessions) >= self.max_hosts:
+                    expired.append(self.sessions.popitem(last=False)[1][0])
+            self.sessions[key] = (session, now)
+
+        for old_session in expired:
+            old_session.close()
+        return session
+
+    def _evict_idle(self, now):
+        """取出空闲超时的会话，调用方需持有锁"""
+        expired = [key for key, (_, last_used) in self.sessions.items() if now - last_used > self.idle_timeout]
+        return [self.sessions.pop(key)[0] for key in expired]
+
+    def stats(self):
+        """当前会话池状态"""
+        with self.lock:
+            return {'hosts': list(self.sessions.keys())}
+
+    def close(self):
+        """关闭所有会话"""
+        with self.lock:
+            sessions = [session for session, _ in self.sessions.values()]
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
@@ -0,0 +1,62 @@
+# 日志压缩模块，在后台按保留策略清理已封存的日志分段并压缩归档
+
+import threading
+
+from core.diagnostics import get_logger
+
+log = get_logger('log_compactor')
+
+
+class LogCompactor:
+    """
+    后台日志压缩器
+
+    每隔 interval 秒执行一次 Storage.compact_logs：删除超过保留天数、
+    超过单任务保留条数的日志，分段总大小超限时删除最旧的分段，
+    并把封存的分段压缩为 .jsonl.gz。归档分段仍然可以按需查询。
+    """
+
+    def __init__(self, storage, interval=300, max_age_days=0, max_per_task=0, max_bytes=0, compress=True):
+        self.storage = storage
+        self.interval = interval
+        self.max_age_days = max_age_days
+        self.max_per_task = max_per_task
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.last_run = None  # 最近一次执行结果
+        self.stop_event = threading.Event()
+
+        self.thread = threading.Thread(target=self._run, name='log-compactor')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        """后台线程：定期执行一次压缩"""
+        while not self.stop_event.wait(self.interval):
+            self.compact()
+
+    def compact(self):
+        """立即执行一次压缩，出错时不影响下一次执行"""
+        try:
+            self.last_run = self.storage.compact_logs(
+                max_age_days=self.max_age_days,
+                max_per_task=self.max_per_task,
+                max_bytes=self.max_bytes,
+                compress=self.compress
+            )
+        except Exception:
+            log.exception('日志压缩失败')
+            return None
+
+        if self.last_run['segments']:
+            log.info('日志压缩完成', extra={'fields': self.last_run})
+        return self.last_run
+
+    def close(self):
+        """停止后台线程"""
+        self.stop_event.set()
+        self.thread.join()
+
+    def stats(self):
+        """最近一次压缩结果"""
+        return self.last_run
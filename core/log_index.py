@@ -0,0 +1,267 @@
+# 日志索引模块，使用内嵌 SQLite 数据库为分段日志建立索引
+
+import os
+import sqlite3
+import threading
+import urllib.parse
+
+from core.blob_store import blob_refs
+
+
+class LogIndex:
+    """
+    日志索引
+
+    按日志ID、任务ID、状态和日期记录每条日志在分段文件中的位置，
+    并维护按天聚合的状态计数和大对象的引用计数。索引可以随时从分段文件重建。
+    列表页需要的摘要字段也保存在索引中，只查询摘要时不必读取分段文件。
+    read_only 时以只读方式打开其他进程维护的索引，不建表也不修改。
+    """
+
+    # 索引中保存的日志字段
+    SUMMARY_FIELDS = ('id', 'task_id', 'task_name', 'event', 'status', 'message', 'timestamp')
+
+    def __init__(self, db_path, read_only=False):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        if read_only:
+            uri = 'file:' + urllib.parse.quote(os.path.abspath(db_path)) + '?mode=ro'
+            self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            return
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self._create_tables()
+
+    def _create_tables(self):
+        """创建索引表"""
+        with self.lock, self.conn:
+            self.conn.executescript('''
+                CREATE TABLE IF NOT EXISTS logs (
+                    id INTEGER PRIMARY KEY,
+                    task_id INTEGER,
+                    status TEXT,
+                    event TEXT,
+                    day TEXT,
+                    timestamp TEXT,
+                    segment INTEGER,
+                    offset INTEGER,
+                    length INTEGER,
+                    task_name TEXT,
+                    message TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_logs_task ON logs (task_id, id);
+                CREATE INDEX IF NOT EXISTS idx_logs_status ON logs (status, id);
+                CREATE INDEX IF NOT EXISTS idx_logs_task_status ON logs (task_id, status, id);
+                CREATE INDEX IF NOT EXISTS idx_logs_day ON logs (day);
+                CREATE TABLE IF NOT EXISTS daily_counts (
+                    day TEXT,
+                    status TEXT,
+                    count INTEGER,
+                    PRIMARY KEY (day, status)
+                );
+                CREATE TABLE IF NOT EXISTS blob_refs (
+                    digest TEXT PRIMARY KEY,
+                    refs INTEGER
+                );
+            ''')
+
+    def add_many(self, entries):
+        """
+        批量写入索引
+
+        参数:
+            entries: [(日志, (分段, 偏移量, 长度)), ...]
+        """
+        rows = []
+        counts = {}
+        refs = {}
+        for log, (segment, offset, length) in entries:
+            timestamp = log.get('timestamp', '')
+            day = timestamp[:10]
+            rows.append((log['id'], log.get('task_id'), log.get('status'), log.get('event'),
+                         day, timestamp, segment, offset, length, log.get('task_name'), log.get('message')))
+            key = (day, log.get('status'))
+            counts[key] = counts.get(key, 0) + 1
+            for digest in blob_refs(log):
+                refs[digest] = refs.get(digest, 0) + 1
+
+        if not rows:
+            return
+
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO logs (id, task_id, status, event, day, timestamp, segment, offset, length, '
+                'task_name, message) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows
+            )
+            self.conn.executemany(
+                'INSERT INTO daily_counts (day, status, count) VALUES (?, ?, ?) '
+                'ON CONFLICT (day, status) DO UPDATE SET count = count + excluded.count',
+                [(day, status, count) for (day, status), count in counts.items()]
+            )
+            self.conn.executemany(
+                'INSERT INTO blob_refs (digest, refs) VALUES (?, ?) '
+                'ON CONFLICT (digest) DO UPDATE SET refs = refs + excluded.refs',
+                list(refs.items())
+            )
+
+    def add(self, log, location):
+        """写入单条日志的索引"""
+        self.add_many([(log, location)])
+
+    def last_id(self):
+        """已建立索引的最大日志ID"""
+        with self.lock:
+            row = self.conn.execute('SELECT MAX(id) FROM logs').fetchone()
+        return row[0] or 0
+
+    def locate(self, log_id):
+        """按日志ID查找位置，返回 (分段, 偏移量, 长度) 或 None"""
+        with self.lock:
+            return self.conn.execute(
+                'SELECT segment, offset, length FROM logs WHERE id = ?', (log_id,)
+            ).fetchone()
+
+    def _where(self, task_id=None, status=None, before_id=None, after_id=None):
+        """构造过滤条件"""
+        clauses = []
+        params = []
+        if task_id:
+            clauses.append('task_id = ?')
+            params.append(task_id)
+        if status:
+            clauses.append('status = ?')
+            params.append(status)
+        if before_id:
+            clauses.append('id < ?')
+            params.append(before_id)
+        if after_id:
+            clauses.append('id > ?')
+            params.append(after_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        return where, params
+
+    def query(self, task_id=None, status=None, limit=20, offset=0, before_id=None, after_id=None,
+              columns=('segment', 'offset', 'length')):
+        """
+        按过滤条件分页查询，按ID倒序返回指定列
+
+        参数:
+            before_id / after_id: 按ID定位的分页游标，只返回更早/更新的日志，
+                after_id 时返回紧接游标之后的 limit 条
+            columns: 返回的列，默认为日志位置
+        """
+        where, params = self._where(task_id, status, before_id, after_id)
+        order = 'ASC' if after_id and not before_id else 'DESC'
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(columns)} FROM logs {where} ORDER BY id {order} LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        return rows[::-1] if order == 'ASC' else rows
+
+    def count(self, task_id=None, status=None):
+        """按过滤条件统计日志条数"""
+        where, params = self._where(task_id, status)
+        with self.lock:
+            return self.conn.execute(f'SELECT COUNT(*) FROM logs {where}', params).fetchone()[0]
+
+    def daily_counts(self, day):
+        """某天各状态的日志条数"""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT status, count FROM daily_counts WHERE day = ?', (day,)
+            ).fetchall()
+        return dict(rows)
+
+    def expired_ids(self, segments, before=None, max_per_task=0):
+        """
+        指定分段中超出保留策略的日志ID，返回 {分段: {日志ID, ...}}
+
+        参数:
+            segments: 参与清理的分段编号
+            before: 早于该时间戳('%Y-%m-%d %H:%M:%S')的日志过期
+            max_per_task: 每个任务最多保留的日志条数，0 表示不限
+        """
+        expired = {}
+        if not segments:
+            return expired
+
+        marks = ','.join('?' * len(segments))
+        rows = []
+        with self.lock:
+            if before:
+                rows += self.conn.execute(
+                    f'SELECT id, segment FROM logs WHERE segment IN ({marks}) AND timestamp < ?',
+                    list(segments) + [before]
+                ).fetchall()
+            if max_per_task:
+                rows += self.conn.execute(
+                    f'SELECT id, segment FROM (SELECT id, segment, ROW_NUMBER() OVER '
+                    f'(PARTITION BY task_id ORDER BY id DESC) AS rank FROM logs) '
+                    f'WHERE rank > ? AND segment IN ({marks})',
+                    [max_per_task] + list(segments)
+                ).fetchall()
+
+        for log_id, segment in rows:
+            expired.setdefault(segment, set()).add(log_id)
+        return expired
+
+    def relocate(self, entries, removed):
+        """
+        分段重写后更新日志位置并删除被清理的日志，按天计数保持不变
+
+        参数:
+            entries: [(日志, (分段, 偏移量, 长度)), ...]
+            removed: 被清理的日志
+
+        返回:
+            不再被任何日志引用的大对象哈希
+        """
+        refs = {}
+        for log in removed:
+            for digest in blob_refs(log):
+                refs[digest] = refs.get(digest, 0) + 1
+
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'UPDATE logs SET segment = ?, offset = ?, length = ? WHERE id = ?',
+                [(segment, offset, length, log['id']) for log, (segment, offset, length) in entries]
+            )
+            self.conn.executemany('DELETE FROM logs WHERE id = ?', [(log.get('id'),) for log in removed])
+            if not refs:
+                return []
+
+            self.conn.executemany(
+                'UPDATE blob_refs SET refs = refs - ? WHERE digest = ?',
+                [(count, digest) for digest, count in refs.items()]
+            )
+            marks = ','.join('?' * len(refs))
+            orphans = [row[0] for row in self.conn.execute(
+                f'SELECT digest FROM blob_refs WHERE refs <= 0 AND digest IN ({marks})', list(refs)
+            )]
+            self.conn.execute(f'DELETE FROM blob_refs WHERE refs <= 0 AND digest IN ({marks})', list(refs))
+            return orphans
+
+    def referenced(self, digests):
+        """仍被日志引用的大对象哈希"""
+        digests = list(digests)
+        if not digests:
+            return set()
+        marks = ','.join('?' * len(digests))
+        with self.lock:
+            return {row[0] for row in self.conn.execute(
+                f'SELECT digest FROM blob_refs WHERE refs > 0 AND digest IN ({marks})', digests
+            )}
+
+    def clear(self):
+        """清空索引"""
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM logs')
+            self.conn.execute('DELETE FROM daily_counts')
+            self.conn.execute('DELETE FROM blob_refs')
+
+    def close(self):
+        """关闭数据库连接"""
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,417 @@
+# 日志存储模块，以追加写入的分段 JSON Lines 文件保存执行日志
+
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from core.fileutil import atomic_write_json, fsync_dir
+
+
+class LogStore:
+    """
+    追加写入的分段日志存储
+
+    每条日志序列化为一行 JSON 追加到当前分段文件末尾，分段写满
+    segment_max_bytes 后滚动到新的分段文件。追加一条日志的开销与
+    历史日志数量无关，读取时从最新的分段向前倒序扫描。
+
+    每批日志写完后 fsync，写入过程中进程被杀死最多留下末尾一行不完整的
+    记录，启动时会截掉这半行，之前已写入的日志不受影响。
+
+    分段写满或打开超过 segment_max_age 秒后封存，封存的分段不再写入，
+    可以被压缩归档为 .jsonl.gz 或按保留策略重写，最新的分段始终保持原样。
+
+    read_only 时只读取其他进程正在写入的目录(如集群中其他节点的日志)：不修复末尾、不清理临时文件，
+    每次读取前重新列出分段，以跟上对方的滚动和归档。
+    """
+
+    SEGMENT_PREFIX = 'segment-'
+    NEXT_ID_FILE = 'next_id.json'  # 清除日志时记录的下一个日志ID，清除后重启ID也不回退
+    SEGMENT_SUFFIX = '.jsonl'
+    ARCHIVE_SUFFIX = '.jsonl.gz'
+
+    def __init__(self, log_dir, segment_max_bytes=8 * 1024 * 1024, fsync=True, segment_max_age=0,
+                 read_only=False):
+        self.log_dir = log_dir
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age  # 分段最长写入时间(秒)，0 表示只按大小滚动
+        self.fsync = fsync  # 每批写入后是否刷新到磁盘
+        self.read_only = read_only
+        self.lock = threading.Lock()
+        self._file = None
+        self._file_started = None  # 当前分段开始写入的时间
+
+        if not read_only and not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+
+        self.archived = set()  # 已压缩归档的分段编号
+        self.segments = self._list_segments()
+        if read_only:
+            self.next_id = None  # 日志ID由写入方分配
+            return
+        self._repair_tail()
+        self.next_id = self._recover_next_id()
+
+    def _segment_path(self, segment):
+        """分段编号对应的文件路径，归档分段为压缩文件"""
+        suffix = self.ARCHIVE_SUFFIX if segment in self.archived else self.SEGMENT_SUFFIX
+        return os.path.join(self.log_dir, f'{self.SEGMENT_PREFIX}{segment:06d}{suffix}')
+
+    def _list_segments(self):
+        """列出已有分段编号，按从旧到新排序"""
+        segments = set()
+        archived = set()
+        for name in os.listdir(self.log_dir):
+            if not name.startswith(self.SEGMENT_PREFIX):
+                continue
+            if name.endswith('.tmp'):
+                # 重写分段时被中断遗留的临时文件，原分段仍然完整
+                if not self.read_only:
+                    os.remove(os.path.join(self.log_dir, name))
+                continue
+            for suffix in (self.SEGMENT_SUFFIX, self.ARCHIVE_SUFFIX):
+                if name.endswith(suffix):
+                    number = name[len(self.SEGMENT_PREFIX):-len(suffix)]
+                    if number.isdigit():
+                        segments.add(int(number))
+                        if suffix == self.ARCHIVE_SUFFIX:
+                            archived.add(int(number))
+
+        # 归档过程中被中断时压缩文件与原文件可能同时存在，以完整的原文件为准
+        for segment in list(archived):
+            base = os.path.join(self.log_dir, f'{self.SEGMENT_PREFIX}{segment:06d}')
+            if os.path.exists(base + self.SEGMENT_SUFFIX):
+                if not self.read_only:
+                    os.remove(base + self.ARCHIVE_SUFFIX)
+                archived.discard(segment)
+        self.archived = archived  # 整体替换，只读时其他线程可能正在读取
+        return sorted(segments)
+
+    def _read_file(self, segment):
+        """读取分段的全部内容，归档分段自动解压"""
+        path = self._segment_path(segment)
+        if segment in self.archived:
+            with gzip.open(path, 'rb') as f:
+                return f.read()
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _repair_tail(self):
+        """截掉最新分段末尾因写入中断而不完整的一行"""
+        if not self.segments or self.segments[-1] in self.archived:
+            return
+
+        path = self._segment_path(self.segments[-1])
+        with open(path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+
+            # 从末尾向前找到最后一个换行符
+            position = size
+            while position > 0:
+                chunk_start = max(0, position - 4096)
+                f.seek(chunk_start)
+                chunk = f.read(position - chunk_start)
+                index = chunk.rfind(b'\n')
+                if index != -1:
+                    end = chunk_start + index + 1
+                    break
+                position = chunk_start
+            else:
+                end = 0
+
+            if end < size:
+                f.truncate(end)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _recover_next_id(self):
+        """从最新的非空分段恢复下一个日志ID，不小于清除日志时记录的ID"""
+        floor = 1
+        try:
+            with open(os.path.join(self.log_dir, self.NEXT_ID_FILE), 'r', encoding='utf-8') as f:
+                floor = int(json.load(f))
+        except (OSError, ValueError, TypeError):
+            pass
+
+        for segment in reversed(self.segments):
+            ids = [record.get('id', 0) for record in self._read_segment(segment)]
+            if ids:
+                return max(max(ids) + 1, floor)
+        return floor
+
+    def _read_segment(self, segment, reverse=False):
+        """逐条读取分段中的日志，跳过无法解析的行"""
+        records = [record for record, _, _ in self.scan_segment(segment)]
+        if reverse:
+            records.reverse()
+        return records
+
+    def scan_segment(self, segment):
+        """顺序扫描分段，逐条返回 (日志, 偏移量, 长度)"""
+        try:
+            data = self._read_file(segment)
+        except FileNotFoundError:
+            return
+
+        offset = 0
+        for line in data.splitlines(keepends=True):
+            length = len(line)
+            if line.strip():
+                try:
+                    yield json.loads(line), offset, length
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    pass
+            offset += length
+
+    def read_at(self, segment, offset, length):
+        """按位置读取单条日志"""
+        logs = self.read_many([(segment, offset, length)])
+        return logs[0] if logs else None
+
+    def read_many(self, locations):
+        """
+        按位置批量读取日志，同一分段只打开一次，保持传入顺序
+
+        归档分段无法随机读取，按需整体解压一次后再按位置切片。
+        """
+        with self.lock:
+            if self._file is not None:
+                self._file.flush()
+            if self.read_only:
+                # 写入方可能已滚动、归档或删除了分段
+                self.segments = self._list_segments()
+
+        handles = {}
+        archives = {}
+        logs = []
+        try:
+            for segment, offset, length in locations:
+                if segment in self.archived:
+                    if segment not in archives:
+                        try:
+                            archives[segment] = self._read_file(segment)
+                        except FileNotFoundError:
+                            archives[segment] = b''
+                    data = archives[segment][offset:offset + length]
+                else:
+                    if segment not in handles:
+                        try:
+                            handles[segment] = open(self._segment_path(segment), 'rb')
+                        except FileNotFoundError:
+                            handles[segment] = None
+                    f = handles[segment]
+                    if f is None:
+                        continue
+                    f.seek(offset)
+                    data = f.read(length)
+                try:
+                    logs.append(json.loads(data))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+        finally:
+            for f in handles.values():
+                if f is not None:
+                    f.close()
+        return logs
+
+    def _segment_started(self, segment):
+        """分段开始写入的时间，取第一条日志的时间戳"""
+        try:
+            with open(self._segment_path(segment), 'rb') as f:
+                first = json.loads(f.readline())
+            return datetime.strptime(first['timestamp'], '%Y-%m-%d %H:%M:%S').timestamp()
+        except (OSError, ValueError, KeyError, TypeError):
+            return time.time()
+
+    def _segment_full(self, size, started):
+        """分段是否已写满或写入时间过长"""
+        if size >= self.segment_max_bytes:
+            return True
+        return bool(self.segment_max_age and size and time.time() - started >= self.segment_max_age)
+
+    def _open_segment(self):
+        """打开当前可写分段，写满或超过时间时滚动到新分段"""
+        if self._file is not None and not self._segment_full(self._file.tell(), self._file_started):
+            return self._file
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        if not self.segments:
+            self.segments.append(1)
+            self._file_started = time.time()
+        else:
+            path = self._segment_path(self.segments[-1])
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            started = self._segment_started(self.segments[-1]) if size else time.time()
+            if self.segments[-1] in self.archived or self._segment_full(size, started):
+                self.segments.append(self.segments[-1] + 1)
+                started = time.time()
+            self._file_started = started
+
+        self._file = open(self._segment_path(self.segments[-1]), 'ab')
+        return self._file
+
+    def sealed_segments(self):
+        """已封存、不会再写入的分段，即除最新分段外的所有分段"""
+        with self.lock:
+            return list(self.segments[:-1])
+
+    def segment_size(self, segment):
+        """分段文件在磁盘上的大小"""
+        try:
+            return os.path.getsize(self._segment_path(segment))
+        except FileNotFoundError:
+            return 0
+
+    def total_size(self):
+        """所有分段文件在磁盘上的总大小"""
+        with self.lock:
+            segments = list(self.segments)
+        return sum(self.segment_size(segment) for segment in segments)
+
+    def rewrite_segment(self, segment, keep, compress):
+        """
+        重写已封存的分段，只保留 keep(日志) 为真的日志，按需压缩归档
+
+        新内容先写入临时文件，由 commit_rewrite 替换原文件。
+        返回 (临时文件路径, 保留的 [(日志, 新位置)], 丢弃的日志列表)，
+        临时文件路径为 None 表示分段已没有需要保留的日志。
+        """
+        kept = []
+        dropped = []
+        lines = []
+        offset = 0
+        for record, _, _ in self.scan_segment(segment):
+            if not keep(record):
+                dropped.append(record)
+                continue
+            line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+            kept.append((record, (segment, offset, len(line))))
+            lines.append(line)
+            offset += len(line)
+
+        if not kept:
+            return None, kept, dropped
+
+        suffix = self.ARCHIVE_SUFFIX if compress else self.SEGMENT_SUFFIX
+        tmp_path = os.path.join(self.log_dir, f'{self.SEGMENT_PREFIX}{segment:06d}{suffix}.tmp')
+        with open(tmp_path, 'wb') as raw:
+            if compress:
+                with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+                    f.writelines(lines)
+            else:
+                raw.writelines(lines)
+            raw.flush()
+            os.fsync(raw.fileno())
+        return tmp_path, kept, dropped
+
+    def commit_rewrite(self, segment, tmp_path):
+        """用重写后的临时文件替换已封存的分段，临时文件为 None 时删除该分段"""
+        with self.lock:
+            old_path = self._segment_path(segment)
+            if tmp_path is None:
+                os.remove(old_path)
+                self.segments.remove(segment)
+                self.archived.discard(segment)
+            else:
+                new_path = tmp_path[:-len('.tmp')]
+                os.replace(tmp_path, new_path)
+                if new_path.endswith(self.ARCHIVE_SUFFIX):
+                    self.archived.add(segment)
+                else:
+                    self.archived.discard(segment)
+                if new_path != old_path:
+                    os.remove(old_path)
+            fsync_dir(self.log_dir)
+
+    def allocate_id(self):
+        """预先分配一个日志ID，供异步写入时提前返回"""
+        with self.lock:
+            log_id = self.next_id
+            self.next_id += 1
+            return log_id
+
+    def _write(self, log):
+        """写入一行，未分配ID时分配ID，返回日志所在位置 (分段, 偏移量, 长度)"""
+        if 'id' not in log:
+            log['id'] = self.next_id
+            self.next_id += 1
+
+        f = self._open_segment()
+        line = (json.dumps(log, ensure_ascii=False) + '\n').encode('utf-8')
+        offset = f.tell()
+        f.write(line)
+        return self.segments[-1], offset, len(line)
+
+    def append(self, log):
+        """追加一条日志，分配自增ID，返回日志所在位置"""
+        return self.append_many([log])[0]
+
+    def append_many(self, logs):
+        """批量追加日志，整批写完后统一刷新，返回各条日志的位置"""
+        with self.lock:
+            locations = [self._write(log) for log in logs]
+            if self._file is not None:
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            return locations
+
+    def import_logs(self, logs):
+        """批量导入旧格式日志，按原有顺序重新分配ID，返回各条日志的位置"""
+        logs = list(logs)
+        for log in logs:
+            log.pop('id', None)
+        return self.append_many(logs)
+
+    def iter_logs(self):
+        """从新到旧遍历所有日志"""
+        with self.lock:
+            segments = list(self.segments)
+            if self._file is not None:
+                self._file.flush()
+
+        for segment in reversed(segments):
+            yield from self._read_segment(segment, reverse=True)
+
+    def count(self):
+        """日志总条数"""
+        return sum(1 for _ in self.iter_logs())
+
+    def is_empty(self):
+        """是否还没有任何日志"""
+        return next(self.iter_logs(), None) is None
+
+    def clear(self):
+        """
+        删除所有分段
+
+        日志ID继续递增不从1重新开始，已分配ID还未写入的日志写入后不会与清除前的日志重复，
+        页面按ID去重和翻页也不会混淆；下一个ID先写入文件，重启后同样不回退。
+        """
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            atomic_write_json(os.path.join(self.log_dir, self.NEXT_ID_FILE), self.next_id)
+            for segment in self.segments:
+                try:
+                    os.remove(self._segment_path(segment))
+                except FileNotFoundError:
+                    pass
+            self.segments = []
+            self.archived = set()
+
+    def close(self):
+        """关闭当前分段文件"""
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
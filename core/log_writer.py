@@ -0,0 +1,172 @@
+# 日志写入模块，在后台线程中批量写入执行日志
+
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from core.diagnostics import get_logger
+from core.metrics import LOG_WRITE, LOGS_WRITTEN
+
+log = get_logger('log_writer')
+
+
+class LogWriter:
+    """
+    后台批量日志写入器
+
+    日志先进入有界内存队列，由后台线程在攒够 batch_size 条或等待
+    flush_interval 秒后一次性写入存储，磁盘延迟不再占用任务执行线程。
+
+    队列满时按 backpressure 处理: block 阻塞等待，drop 丢弃，sync 由提交线程
+    把队列中已有的日志连同本条一起写入。每批写入成功后调用 on_written(日志列表)。
+    """
+
+    BACKPRESSURE_POLICIES = ('block', 'drop', 'sync')
+
+    def __init__(self, storage, batch_size=200, flush_interval=0.5, max_queue=10000, backpressure='block'):
+        if backpressure not in self.BACKPRESSURE_POLICIES:
+            raise ValueError(f'无效的队列满处理方式: {backpressure}')
+
+        self.storage = storage
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.backpressure = backpressure
+        # 分配ID、入队和取出批次都在 lock 内完成，队列中的日志始终按ID排列
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.queue = deque()
+        self.unwritten = 0  # 已提交还未写完的日志条数，flush 等待其归零
+        # 取出批次后、释放 lock 之前拿到写入锁，各批次按取出顺序依次写入
+        self.write_lock = threading.Lock()
+        self.on_written = None
+        self.dropped = 0
+        self.closed = False
+
+        self.thread = threading.Thread(target=self._run, name='log-writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, log):
+        """提交一条日志，立即分配ID和时间戳后入队，返回日志ID；队列满被丢弃时返回 None"""
+        log['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        with self.changed:
+            if self.backpressure == 'block':
+                while len(self.queue) >= self.max_queue and not self.closed:
+                    self.changed.wait()
+
+            if not self.closed and len(self.queue) < self.max_queue:
+                # 分配ID与入队之间不释放锁，队列中的日志始终按ID排列
+                log['id'] = self.storage.allocate_log_id()
+                self.queue.append(log)
+                self.unwritten += 1
+                self.changed.notify_all()
+                return log['id']
+            if not self.closed and self.backpressure == 'drop':
+                self.dropped += 1
+                return None
+
+            # 队列已满(sync)或后台线程已停止，队列中的日志ID都比本条小，连同本条一起由当前线程写入
+            log['id'] = self.storage.allocate_log_id()
+            self.queue.append(log)
+            self.unwritten += 1
+            batch = self._take(len(self.queue))
+
+        self._write_batch(batch)
+        return log['id']
+
+    def _take(self, count):
+        """从队首取出至多 count 条日志作为一批并获取写入锁，调用方需持有 lock"""
+        batch = [self.queue.popleft() for _ in range(min(count, len(self.queue)))]
+        self.write_lock.acquire()
+        self.changed.notify_all()
+        return batch
+
+    def _run(self):
+        """后台线程：按数量或时间阈值批量写入"""
+        while True:
+            with self.changed:
+                while not self.queue and not self.closed:
+                    self.changed.wait()
+                if not self.queue:
+                    return
+
+                # 数量不足时继续等待，直到攒够一批、队列已满、等待超时或关闭
+                deadline = time.monotonic() + self.flush_interval
+                while len(self.queue) < min(self.batch_size, self.max_queue) and not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.changed.wait(remaining)
+                if not self.queue:
+                    continue
+                batch = self._take(self.batch_size)
+
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        """写入取出的一批日志并释放写入锁"""
+        try:
+            self._write(batch)
+        finally:
+            self.write_lock.release()
+            with self.changed:
+                self.unwritten -= len(batch)
+                self.changed.notify_all()
+
+    def _write(self, batch):
+        """写入一批日志，出错时不影响后续批次"""
+        try:
+            with LOG_WRITE.time():
+                self.storage.add_logs(batch)
+            LOGS_WRITTEN.inc(len(batch))
+        except Exception:
+            log.exception('批量写入日志失败', extra={'fields': {'batch_size': len(batch)}})
+            return
+
+        if self.on_written is not None:
+            try:
+                self.on_written(batch)
+            except Exception:
+                log.exception('日志写入回调失败', extra={'fields': {'batch_size': len(batch)}})
+
+    def flush(self):
+        """等待队列中已提交的日志全部写入"""
+        with self.changed:
+            while self.unwritten:
+                self.changed.wait()
+
+    def clear_logs(self):
+        """
+        清除存储中的全部日志
+
+        等待正在写入的批次完成，队列中还未写入的日志一并丢弃，清除期间提交的日志在清除之后写入。
+        """
+        with self.changed:
+            batch = self._take(len(self.queue))
+        try:
+            self.storage.clear_logs()
+        finally:
+            self.write_lock.release()
+            with self.changed:
+                self.unwritten -= len(batch)
+                self.changed.notify_all()
+
+    def close(self):
+        """停止后台线程，关闭前写完队列中剩余日志"""
+        with self.changed:
+            if self.closed:
+                return
+            self.closed = True
+            self.changed.notify_all()
+        self.thread.join()
+        self.flush()
+
+    def stats(self):
+        """队列状态"""
+        return {
+            'queue_size': len(self.queue),
+            'dropped': self.dropped
+        }
@@ -4,9 +4,43 @@
 import os
 from datetime import datetime
 
+from core.blob_store import spill
+from core.diagnostics import debug_enabled, emit_debug, get_logger, mask_secrets
+from core.metrics import LOG_WRITE, LOGS_WRITTEN
+
+run_log = get_logger('logger')  # 运行日志，区别于写入存储的任务执行日志
+
 class TaskLogger:
-    def __init__(self, storage):
+    # 推送给页面的日志字段，详情在打开日志时再按ID读取
+    EVENT_FIELDS = ('id', 'task_id', 'task_name', 'event', 'status', 'message', 'timestamp')
+
+    def __init__(self, storage, writer=None, inline_max_bytes=0, events=None):
         self.storage = storage
+        self.writer = writer  # 后台批量写入器，为空时同步写入
+        self.inline_max_bytes = inline_max_bytes  # 日志详情字段内联保存的大小上限，0 表示不限
+        self.events = events  # 事件总线，写入的日志摘要推送给页面
+        if writer is not None:
+            # 日志写入存储后才推送，页面收到推送时按ID一定能查到日志
+            writer.on_written = self._publish
+
+    def _publish(self, logs):
+        """推送已写入存储的日志摘要"""
+        if self.events is None:
+            return
+        for log in logs:
+            self.events.publish('log', {field: log.get(field) for field in self.EVENT_FIELDS})
+
+    def _write(self, log):
+        """写入一条日志并返回日志ID，超过内联上限的详情字段移入大对象存储"""
+        log['details'] = spill(log['details'], self.storage.blob_store, self.inline_max_bytes)
+        if self.writer is not None:
+            return self.writer.submit(log)
+
+        with LOG_WRITE.time():
+            self.storage.add_log(log)
+        LOGS_WRITTEN.inc()
+        self._publish([log])
+        return log['id']
 
     def log_task_start(self, task_id, task_name):
         """记录任务开始执行"""
@@ -18,8 +52,7 @@ class TaskLogger:
             'message': f'任务 "{task_name}" 开始执行',
             'details': {}
         }
-        self.storage.add_log(log)
-        return log['id']
+        return self._write(log)
 
     def log_task_success(self, task_id, task_name, details=None):
         """记录任务执行成功"""
@@ -31,8 +64,7 @@ class TaskLogger:
             'message': f'任务 "{task_name}" 执行成功',
             'details': details or {}
         }
-        self.storage.add_log(log)
-        return log['id']
+        return self._write(log)
 
     def log_task_failure(self, task_id, task_name, error, details=None):
         """记录任务执行失败"""
@@ -44,8 +76,7 @@ class TaskLogger:
             'message': f'任务 "{task_name}" 执行失败: {error}',
             'details': details or {}
         }
-        self.storage.add_log(log)
-        return log['id']
+        return self._write(log)
 
     def log_step_execution(self, task_id, task_name, step_index, step_name, step_result):
         """记录API步骤执行情况"""
@@ -54,6 +85,8 @@ class TaskLogger:
 
         if not step_result['success']:
             message += f': {step_result["error"]}'
+            if step_result.get('retry_denied'):
+                message += '(重试预算已耗尽，未重试)'
 
         # 确保记录完整的请求信息，使用copy避免引用问题
         details = {
@@ -65,30 +98,25 @@ class TaskLogger:
             'response': step_result.get('response'),
             'extracted_params': step_result.get('extracted_params', {}),
             'headers': step_result.get('headers', {}),
-            'body': step_result.get('body', {})
+            'body': step_result.get('body', {}),
+            'timings': step_result.get('timings', {})
         }
-
-        # 确保请求头和请求体的引用值被正确处理和记录
-        # 这样在查看日志时可以看到原始的引用值，如 "Authorization": "Bearer ${token}"
-
-        # 记录步骤执行详情，便于调试
-        print(f"=== 记录步骤 {step_index} ({step_name}) 日志 ===")
-        print(f"请求URL: {details['url']}")
-        print(f"请求方法: {details['method']}")
-
-        # 检查请求头中是否有引用值被替换
-        headers = details['headers']
-        if isinstance(headers, dict) and 'Authorization' in headers:
-            auth_header = headers['Authorization']
-            if isinstance(auth_header, str) and 'Bearer' in auth_header:
-                if '${token}' in auth_header:
-                    print(f"请求头Authorization包含未替换的token引用: {auth_header}")
-                else:
-                    print(f"请求头Authorization已正确设置: {auth_header[:20]}...")  # 只显示前20个字符，避免泄露token
-        print(f"请求头: {headers}")
-
-        print(f"状态码: {details['status_code']}")
-        print(f"提取的参数: {details['extracted_params']}")
+        if step_result.get('error_type'):
+            details['error_type'] = step_result['error_type']
+        if step_result.get('timeouts'):
+            details['timeouts'] = step_result['timeouts']
+        if step_result.get('cache'):
+            details['cache'] = step_result['cache']
+
+        # 记录步骤执行详情，仅在 DEBUG 级别时计算，敏感请求头脱敏
+        if debug_enabled(run_log):
+            emit_debug(
+                run_log, False, '记录步骤日志',
+                task_id=task_id, step_index=step_index, step_name=step_name,
+                url=details['url'], method=details['method'], status_code=details['status_code'],
+                headers=mask_secrets(details['headers']),
+                extracted_params=mask_secrets(details['extracted_params'])
+            )
 
         log = {
             'task_id': task_id,
@@ -98,8 +126,7 @@ class TaskLogger:
             'message': message,
             'details': details
         }
-        self.storage.add_log(log)
-        return log['id']
+        return self._write(log)
 
     def get_task_logs(self, task_id, limit=100):
         """获取特定任务的日志"""
@@ -108,3 +135,8 @@ class TaskLogger:
     def get_all_logs(self, limit=200):
         """获取所有任务的日志"""
         return self.storage.load_logs(limit=limit)
+
+    def close(self):
+        """关闭日志写入器，写完队列中剩余日志"""
+        if self.writer is not None:
+            self.writer.close()
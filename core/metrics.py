@@ -0,0 +1,266 @@
+# 指标模块，在内存中累计计数器和耗时直方图，以 Prometheus 文本格式导出
+
+import threading
+import time
+from contextlib import contextmanager
+
+# 默认直方图分桶上界(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_value(value):
+    """数值的文本表示，整数不带小数点"""
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=None):
+    """标签的文本表示，如 {task_id="1",status="success"}"""
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class Metric:
+    """指标基类，每组标签取值对应一条序列"""
+
+    type_name = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}  # {标签值: 序列状态}
+
+    def _key(self, labels):
+        """标签取值，按声明顺序排列"""
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def remove(self, name, value):
+        """移除某个标签取值的全部序列，如已删除任务的指标"""
+        if name not in self.labels:
+            return
+        index = self.labels.index(name)
+        with self.lock:
+            for key in [key for key in self.values if key[index] == str(value)]:
+                del self.values[key]
+
+
+class Counter(Metric):
+    """只增不减的计数器，按标签值分别计数"""
+
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """增加计数"""
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        """[(标签值, 计数), ...]"""
+        with self.lock:
+            return sorted(self.values.items())
+
+    def render(self):
+        """Prometheus 文本格式"""
+        return [
+            f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}'
+            for key, value in self.samples()
+        ]
+
+    def total(self):
+        """所有标签取值的计数之和"""
+        with self.lock:
+            return sum(self.values.values())
+
+
+class Histogram(Metric):
+    """耗时直方图，按标签值分别统计各分桶的次数、总和与次数"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        """记录一次观测值"""
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """记录 with 代码块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        """[(标签值, {'buckets', 'sum', 'count'}), ...]"""
+        with self.lock:
+            return sorted(
+                (key, {'buckets': list(state['buckets']), 'sum': state['sum'], 'count': state['count']})
+                for key, state in self.values.items()
+            )
+
+    def render(self):
+        """Prometheus 文本格式"""
+        lines = []
+        for key, state in self.samples():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['buckets']):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{_format_labels(self.labels, key, ("le", _format_value(bound)))} {cumulative}'
+                )
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {_format_value(state["sum"])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {state["count"]}')
+        return lines
+
+    def summary(self, **labels):
+        """
+        合并符合标签条件的序列，返回次数、平均值和按分桶估算的分位数(秒)
+
+        参数:
+            labels: 只合并这些标签取值的序列，如 phase='total'
+        """
+        indexes = {self.labels.index(name): str(value) for name, value in labels.items() if name in self.labels}
+        buckets = [0] * len(self.buckets)
+        total = 0.0
+        count = 0
+        for key, state in self.samples():
+            if any(key[i] != value for i, value in indexes.items()):
+                continue
+            buckets = [a + b for a, b in zip(buckets, state['buckets'])]
+            total += state['sum']
+            count += state['count']
+
+        return {
+            'count': count,
+            'avg': round(total / count, 4) if count else 0,
+            'p50': self._quantile(buckets, count, 0.5),
+            'p95': self._quantile(buckets, count, 0.95),
+            'p99': self._quantile(buckets, count, 0.99)
+        }
+
+    def _quantile(self, buckets, count, q):
+        """在分桶内线性插值估算分位数，落在最后一个有限分桶之外时返回该分桶上界"""
+        if not count:
+            return 0
+        rank = q * count
+        cumulative = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets, buckets):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if bound == float('inf'):
+                    return lower
+                return round(lower + (bound - lower) * (rank - cumulative) / bucket_count, 4)
+            cumulative += bucket_count
+            if bound != float('inf'):
+                lower = bound
+        return lower
+
+
+class MetricsRegistry:
+    """指标注册表，同名指标只创建一次"""
+
+    def __init__(self, prefix='xxjob_'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def _register(self, cls, name, documentation, labels, **kwargs):
+        """获取或创建指标"""
+        name = self.prefix + name
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, documentation, labels, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labels=()):
+        """获取或创建计数器"""
+        return self._register(Counter, name, documentation, labels)
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        """获取或创建直方图"""
+        return self._register(Histogram, name, documentation, labels, buckets=buckets)
+
+    def remove(self, name, value):
+        """从所有指标中移除某个标签取值的序列"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            metric.remove(name, value)
+
+    def render(self):
+        """全部指标的 Prometheus 文本格式"""
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# 全局注册表，各模块在导入时声明自己的指标
+registry = MetricsRegistry()
+
+TASK_RUNS = registry.counter('task_runs_total', '任务执行次数', ('task_id', 'status'))
+TASK_SKIPPED = registry.counter('task_skipped_total', '因并发限制跳过的触发次数', ('task_id',))
+TASK_DURATION = registry.histogram('task_duration_seconds', '调用链执行耗时', ('task_id',))
+TASK_QUEUE_WAIT = registry.histogram('task_queue_wait_seconds', '触发到开始执行的排队等待时间', ('task_id',))
+STEP_REQUESTS = registry.counter('step_requests_total', '步骤执行次数，重试另计', ('task_id', 'step', 'status'))
+STEP_RETRIES = registry.counter('step_retries_total', '步骤重试次数', ('task_id', 'step'))
+STEP_PHASE = registry.histogram(
+    'step_phase_seconds', '步骤各阶段耗时: dns 域名解析, connect 建立连接, ttfb 首字节, total 总耗时',
+    ('task_id', 'step', 'phase')
+)
+SCHEDULER_LOCK_WAIT = registry.histogram(
+    'scheduler_lock_wait_seconds', '调度器并发状态锁的等待时间',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+)
+LOG_WRITE = registry.histogram('log_write_seconds', '每批日志写入存储的耗时')
+LOGS_WRITTEN = registry.counter('logs_written_total', '写入存储的日志条数')
+
+
+def summary():
+    """自进程启动以来的主要指标汇总，用于 /api/stats"""
+    runs = {}
+    for (_, status), count in TASK_RUNS.samples():
+        runs[status] = runs.get(status, 0) + count
+    return {
+        'task_runs': runs,
+        'task_skipped': TASK_SKIPPED.total(),
+        'step_retries': STEP_RETRIES.total(),
+        'task_duration': TASK_DURATION.summary(),
+        'queue_wait': TASK_QUEUE_WAIT.summary(),
+        'step_connect': STEP_PHASE.summary(phase='connect'),
+        'step_ttfb': STEP_PHASE.summary(phase='ttfb'),
+        'step_total': STEP_PHASE.summary(phase='total'),
+        'lock_wait': SCHEDULER_LOCK_WAIT.summary(),
+        'log_write': LOG_WRITE.summary()
+    }
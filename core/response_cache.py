@@ -0,0 +1,191 @@
+# 响应缓存模块，在内存中缓存幂等 GET 步骤的响应，按 Cache-Control 判断新鲜度，过期后用 ETag 条件请求重新验证
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from core.metrics import registry
+
+CACHE_LOOKUPS = registry.counter(
+    'response_cache_lookups_total',
+    '响应缓存查询次数: hit 命中, revalidated 条件请求确认未变化, miss 未命中或响应已变化',
+    ('result',)
+)
+
+
+def parse_cache_control(value):
+    """解析 Cache-Control 头为 {指令: 值}，没有值的指令为 True"""
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, arg = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip().strip('"') if arg else True
+    return directives
+
+
+class CachedResponse:
+    """缓存的响应内容和验证信息，创建后不再修改，多个线程可以同时读取"""
+
+    __slots__ = ('status_code', 'content_type', 'text', 'etag', 'last_modified', 'expires', 'size')
+
+    def __init__(self, status_code, content_type, text, etag, last_modified, expires):
+        self.status_code = status_code
+        self.content_type = content_type
+        self.text = text
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires  # time.monotonic() 时间，之后需要重新验证
+        self.size = len(text.encode('utf-8'))
+
+    def fresh(self):
+        """是否在有效期内，可以不经验证直接使用"""
+        return time.monotonic() < self.expires
+
+    def validatable(self):
+        """是否可以用条件请求重新验证"""
+        return bool(self.etag or self.last_modified)
+
+    def conditional_headers(self, headers):
+        """在请求头中加入条件请求头，服务端确认未变化时返回 304"""
+        headers = dict(headers or {})
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    进程内共享的 GET 响应缓存
+
+    步骤配置 cache 字段开启，如 true 或 {"ttl": 300, "vary": ["Authorization"]}：
+    ttl 为缓存有效期(秒)，响应的 Cache-Control: max-age 更短时以 max-age 为准，no-cache 表示每次都要
+    重新验证，no-store 表示不缓存；vary 为参与缓存键的请求头，默认为全部请求头。缓存键由请求方法、
+    渲染后的URL、查询参数和这些请求头组成，不同任务的相同请求共用缓存。
+
+    只缓存 200 响应。过期后带 ETag 或 Last-Modified 的响应通过条件请求重新验证，服务端返回 304 时
+    继续使用缓存内容；没有验证信息的过期响应直接丢弃。条目数超过 max_entries 或总大小超过
+    max_bytes 时淘汰最久未使用的响应。
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=32 * 1024 * 1024, default_ttl=60):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # {缓存键: CachedResponse}
+        self.size = 0
+
+    def options(self, step, method):
+        """步骤的缓存设置 {'ttl', 'vary'}，未开启缓存或请求不可缓存(非 GET、流式模式)时返回 None"""
+        options = step.get('cache')
+        if not options or method != 'GET' or step.get('stream'):
+            return None
+        if not isinstance(options, dict):
+            options = {}
+        return {'ttl': float(options.get('ttl', self.default_ttl)), 'vary': options.get('vary')}
+
+    def key(self, method, url, params, headers, vary=None):
+        """缓存键，请求头名称不区分大小写，vary 为空时使用全部请求头"""
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+        if vary is not None:
+            names = {name.lower() for name in vary}
+            headers = {name: value for name, value in headers.items() if name in names}
+        return json.dumps([method, url, params, headers], sort_keys=True, ensure_ascii=False, default=str)
+
+    def get(self, key):
+        """查找缓存的响应，可能已过期需要重新验证；过期且无法验证时删除并返回 None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if not entry.fresh() and not entry.validatable():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def _expires(self, response_headers, ttl):
+        """按步骤的有效期和响应的 Cache-Control 计算到期时间，不应缓存时返回 None"""
+        directives = parse_cache_control(response_headers.get('cache-control'))
+        if 'no-store' in directives:
+            return None
+        if 'no-cache' in directives:
+            ttl = 0
+        elif 'max-age' in directives:
+            try:
+                ttl = min(ttl, max(int(directives['max-age']), 0))
+            except (TypeError, ValueError):
+                pass
+        return time.monotonic() + ttl
+
+    def store(self, key, status_code, content_type, text, response_headers, ttl):
+        """缓存成功的响应，返回是否已缓存"""
+        expires = self._expires(response_headers, ttl)
+        if status_code != 200 or expires is None:
+            self.discard(key)
+            return False
+        entry = CachedResponse(
+            status_code, content_type, text,
+            response_headers.get('etag'), response_headers.get('last-modified'), expires
+        )
+        if (not entry.fresh() and not entry.validatable()) or entry.size > self.max_bytes:
+            self.discard(key)
+            return False
+
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = entry
+            self.size += entry.size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+        return True
+
+    def revalidate(self, key, entry, response_headers, ttl):
+        """服务端返回 304 后按新的响应头延长有效期，返回更新后的缓存响应"""
+        expires = self._expires(response_headers, ttl)
+        if expires is None:
+            self.discard(key)
+            return entry
+        updated = CachedResponse(
+            entry.status_code, entry.content_type, entry.text,
+            response_headers.get('etag') or entry.etag,
+            response_headers.get('last-modified') or entry.last_modified,
+            expires
+        )
+        with self.lock:
+            if self.entries.get(key) is entry:
+                self.entries[key] = updated
+                self.entries.move_to_end(key)
+        return updated
+
+    def discard(self, key):
+        """删除缓存的响应"""
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        """删除条目，调用方需持有锁"""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def clear(self):
+        """清空缓存"""
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """缓存的条目数和大小，缓存键可能包含认证信息，不对外展示"""
+        with self.lock:
+            fresh = sum(1 for entry in self.entries.values() if entry.fresh())
+            return {
+                'entries': len(self.entries),
+                'fresh': fresh,
+                'bytes': self.size,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes
+            }
@@ -0,0 +1,185 @@
+# 重试模块，按步骤配置指数退避和可重试条件，并以全局重试预算限制重试流量
+
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from core import config
+from core.diagnostics import get_logger
+from core.metrics import registry
+
+log = get_logger('retry')
+
+RETRY_DENIED = registry.counter('retry_budget_exhausted_total', '因重试预算耗尽而放弃的重试次数')
+
+
+def _parse_list(value, item_type=str):
+    """逗号分隔的配置值转换为元组"""
+    if isinstance(value, str):
+        value = value.split(',')
+    return tuple(item_type(item.strip()) if isinstance(item, str) else item_type(item)
+                 for item in value or () if str(item).strip())
+
+
+class RetryPolicy:
+    """
+    步骤的重试策略
+
+    第 n 次重试(从 0 开始)前等待 [0, min(max_delay, base_delay * multiplier^n)] 秒内的随机时间
+    (jitter 关闭时取上界)，随机化避免大量任务在下游故障时同步重试。只有可重试的失败才重试：
+    HTTP 错误看状态码，其他错误看错误类型，如 4xx 参数错误重试也不会成功，直接放弃。
+    """
+
+    def __init__(self, max_retries=1, base_delay=1.0, max_delay=30.0, multiplier=2.0, jitter=True,
+                 status_codes=(), errors=()):
+        self.max_retries = max(int(max_retries), 0)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.status_codes = frozenset(_parse_list(status_codes, int))
+        self.errors = frozenset(_parse_list(errors))
+
+    @classmethod
+    def for_step(cls, step, retry_times=1):
+        """
+        步骤的重试策略，默认值取自配置，步骤的 retry 字段可以覆盖，如
+        {"max_retries": 3, "base_delay": 0.5, "max_delay": 10, "status_codes": [429, 503], "errors": ["timeout"]}
+
+        参数:
+            retry_times: 任务的失败重试次数，步骤未设置 max_retries 时使用
+        """
+        options = step.get('retry') or {}
+        return cls(
+            max_retries=options.get('max_retries', retry_times),
+            base_delay=float(options.get('base_delay', config.RETRY_BASE_DELAY)),
+            max_delay=float(options.get('max_delay', config.RETRY_MAX_DELAY)),
+            multiplier=float(options.get('multiplier', 2.0)),
+            jitter=bool(options.get('jitter', True)),
+            status_codes=options.get('status_codes', config.RETRY_STATUS_CODES),
+            errors=options.get('errors', config.RETRY_ERRORS)
+        )
+
+    def retryable(self, step_result):
+        """失败是否值得重试，收到非 2xx 响应时按状态码判断，否则按错误类型判断"""
+        status_code = step_result.get('status_code')
+        if status_code is not None and not 200 <= status_code < 300:
+            return status_code in self.status_codes
+        return step_result.get('error_type') in self.errors
+
+    def delay(self, retry):
+        """第 retry 次重试(从 0 开始)前的等待时间(秒)"""
+        ceiling = min(self.max_delay, self.base_delay * self.multiplier ** retry)
+        return random.uniform(0, ceiling) if self.jitter else ceiling
+
+    def should_retry(self, step_result, retry, budget=None):
+        """
+        失败的步骤是否进行第 retry 次重试，预算耗尽时放弃并在结果中注明
+
+        参数:
+            budget: 重试预算，默认为全局预算
+        """
+        if retry >= self.max_retries or not self.retryable(step_result):
+            return False
+        if not (budget or retry_budget).withdraw():
+            RETRY_DENIED.inc()
+            step_result['retry_denied'] = True
+            return False
+        return True
+
+
+class RetryBudget:
+    """
+    全局重试预算(令牌桶)
+
+    每个步骤首次请求存入 ratio 个令牌，每次重试取出 1 个，另外每秒补充 min_per_second 个，
+    令牌最多累积 capacity 个。下游整体故障时所有请求都失败，重试流量被限制在正常流量的
+    ratio 比例左右，不会成倍放大；偶发的失败不受影响。capacity 为 0 时不限制。
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=1.0, capacity=100):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        """按时间补充令牌，调用方需持有锁"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.min_per_second)
+        self.updated = now
+
+    def deposit(self):
+        """记录一次首次请求"""
+        if not self.capacity:
+            return
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self):
+        """申请一次重试，预算不足时返回 False"""
+        if not self.capacity:
+            return True
+        with self.lock:
+            self._refill()
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class RetryTimer:
+    """
+    重试等待定时器
+
+    所有等待中的重试共用一个后台线程，到期后调用回调(回调应尽快返回，如把后续执行
+    投递到线程池)，等待期间不占用工作线程。
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.queue = []  # [(到期时间, 序号, 回调), ...] 小顶堆
+        self.counter = itertools.count()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name='retry-timer', daemon=True)
+        self.thread.start()
+
+    def call_later(self, delay, callback):
+        """delay 秒后调用 callback，已关闭时立即调用"""
+        with self.condition:
+            if not self.closed:
+                heapq.heappush(self.queue, (time.monotonic() + delay, next(self.counter), callback))
+                self.condition.notify()
+                return
+        callback()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.closed and (not self.queue or self.queue[0][0] > time.monotonic()):
+                    self.condition.wait(self.queue[0][0] - time.monotonic() if self.queue else None)
+                if self.closed and not self.queue:
+                    return
+                _, _, callback = heapq.heappop(self.queue)
+            try:
+                callback()
+            except Exception:
+                log.exception('重试回调执行失败')
+
+    def close(self):
+        """不再等待，立即调用所有未到期的回调"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+
+# 全局重试预算，同一进程内所有调用链共享
+retry_budget = RetryBudget(
+    config.RETRY_BUDGET_RATIO, config.RETRY_BUDGET_MIN_PER_SECOND, config.RETRY_BUDGET_CAPACITY
+)
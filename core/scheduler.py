@@ -3,36 +3,109 @@
 
 import threading
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from datetime import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 
+from core.metrics import (
+    SCHEDULER_LOCK_WAIT, STEP_PHASE, STEP_REQUESTS, STEP_RETRIES, TASK_DURATION, TASK_QUEUE_WAIT, TASK_RUNS,
+    TASK_SKIPPED, registry
+)
+from core.retry import RetryTimer
+
 class TaskScheduler:
-    def __init__(self, storage, api_client, logger):
+    # 同一任务上一次执行尚未结束时再次触发的处理方式
+    OVERLAP_POLICIES = ('skip', 'queue', 'allow')
+
+    def __init__(self, storage, api_client, logger, max_workers=20, max_pending=100, async_client=None,
+                 cluster=None, worker_pool=None, events=None):
         self.storage = storage
         self.api_client = api_client
         self.logger = logger
+        self.async_client = async_client  # 异步执行引擎，为空时在工作线程中同步执行
+        self.worker_pool = worker_pool  # 多进程执行引擎，调用链在工作进程中执行
+        self.events = events  # 事件总线，任务变更推送给页面
+        self.cluster = cluster  # 集群节点，为空时单机运行
         self.scheduler = BackgroundScheduler()
         self.scheduler.start()
         self.running = False
+        self.stopping = False  # 关闭中不再放行排队的执行
+
+        # 任务在全局工作线程池中执行，调度线程只负责投递，不会被慢任务阻塞
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='task-worker')
+        self.retry_timer = RetryTimer()  # 等待重试的调用链到期后再投递到线程池
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+
+        # 每个任务的并发状态和排队等待统计，由锁保护
         self.lock = threading.Lock()
+        self.task_states = {}
+        self.in_flight = set()  # 尚未完成的调用链 Future，包括等待重试中的
+
+        # 每个任务预先编译好的步骤模板 {任务ID: (步骤配置, 调试开关, 编译结果)}，任务更新或删除时失效；
+        # 与失效次数 {任务ID: 次数} 一起由锁保护
+        self.compiled_steps = {}
+        self.compiled_generations = {}
 
-        # 加载并启动所有活跃任务
-        self._load_and_start_tasks()
+        # 已加入定时调度的任务 {任务ID: 调度时的任务配置}
+        self.scheduled_tasks = {}
+
+        if cluster is not None:
+            # 集群模式下由主节点调度定时触发，各节点认领执行
+            cluster.start(self)
+        else:
+            # 加载并启动所有活跃任务
+            self._load_and_start_tasks()
 
     def _load_and_start_tasks(self):
         """加载并启动所有活跃任务"""
-        tasks = self.storage.load_tasks()
+        tasks = self.storage.list_tasks()
         for task in tasks:
             if task['status'] == 'active':
                 self._schedule_task(task)
 
+    def _get_compiled_steps(self, task):
+        """获取任务编译后的步骤，尚未编译或配置已变化(如被其他节点修改)时重新编译并缓存"""
+        task_id = task['id']
+        steps = task.get('steps', [])
+        debug = task.get('debug', False)
+        with self._state_lock():
+            cached = self.compiled_steps.get(task_id)
+            if cached is not None and cached[0] == steps and cached[1] == debug:
+                return cached[2]
+            generation = self.compiled_generations.get(task_id, 0)
+
+        compiled = self.api_client.compile_steps(steps, debug)
+
+        # 编译期间任务被更新或删除时不写入缓存，执行中的旧配置不会覆盖新的编译结果
+        with self._state_lock():
+            if self.compiled_generations.get(task_id, 0) == generation:
+                self.compiled_steps[task_id] = (steps, debug, compiled)
+        return compiled
+
+    def _invalidate_compiled_steps(self, task_id):
+        """丢弃任务的编译结果，正在编译的旧配置也不再写入缓存"""
+        with self._state_lock():
+            self.compiled_steps.pop(task_id, None)
+            self.compiled_generations[task_id] = self.compiled_generations.get(task_id, 0) + 1
+
     def _schedule_task(self, task):
-        """调度单个任务"""
+        """调度单个任务，集群模式下只有主节点调度"""
         task_id = task['id']
         task_name = task['name']
 
+        # 调度时预先编译步骤模板和提取路径，执行时直接使用
+        self._invalidate_compiled_steps(task_id)
+        self._get_compiled_steps(task)
+
+        if self.cluster is not None and not self.cluster.is_leader:
+            return
+        self.scheduled_tasks[task_id] = task
+
         if task['type'] == 'cron':
             # Cron表达式任务
             cron_expr = task.get('cron_expression', '')
@@ -48,7 +121,7 @@ class TaskScheduler:
                 # 解析Cron表达式
                 trigger = CronTrigger.from_crontab(cron_expr)
                 self.scheduler.add_job(
-                    func=self._execute_task,
+                    func=self._on_trigger,
                     trigger=trigger,
                     args=[task],
                     id=f"task_{task_id}",
@@ -68,7 +141,7 @@ class TaskScheduler:
             try:
                 trigger = IntervalTrigger(seconds=interval_seconds)
                 self.scheduler.add_job(
-                    func=self._execute_task,
+                    func=self._on_trigger,
                     trigger=trigger,
                     args=[task],
                     id=f"task_{task_id}",
@@ -82,60 +155,316 @@ class TaskScheduler:
                     {"task": task}
                 )
 
-    def _execute_task(self, task):
-        """执行任务"""
+    def _unschedule_task(self, task_id):
+        """从定时调度中移除任务"""
+        self.scheduled_tasks.pop(task_id, None)
+        try:
+            self.scheduler.remove_job(f"task_{task_id}")
+        except:
+            pass
+
+    def sync_jobs(self):
+        """集群主节点：按任务文件的最新内容增加、更新或移除定时触发"""
+        active = {task['id']: task for task in self.storage.list_tasks() if task['status'] == 'active'}
+        for task_id in list(self.scheduled_tasks):
+            if task_id not in active:
+                self._unschedule_task(task_id)
+        for task_id, task in active.items():
+            if self.scheduled_tasks.get(task_id) != task:
+                self._schedule_task(task)
+
+    def clear_jobs(self):
+        """集群节点失去主节点租约时移除所有定时触发"""
+        for task_id in list(self.scheduled_tasks):
+            self._unschedule_task(task_id)
+
+    def _on_trigger(self, task):
+        """定时触发：集群模式下写入触发队列由各节点认领，否则直接在本节点投递"""
+        if self.cluster is not None:
+            self.cluster.enqueue(task, task.get('overlap_policy', 'skip'))
+        else:
+            self._dispatch_task(task)
+
+    def free_slots(self):
+        """本节点还能同时执行的任务数，集群节点按此认领触发"""
+        if self.worker_pool is not None:
+            capacity = self.worker_pool.processes
+        elif self.async_client is not None:
+            capacity = self.async_client.max_concurrency
+        else:
+            capacity = self.max_workers
+        with self.lock:
+            busy = sum(state['running'] + len(state['pending']) for state in self.task_states.values())
+        return capacity - busy
+
+    def run_firing(self, firing_id, task_id):
+        """执行从集群触发队列认领的一次触发，并发限制已在认领时按全集群判断"""
+        task = self.storage.get_task(task_id)
+        if task is None:
+            self.cluster.finish(firing_id, 'failed')
+            return
+        self._dispatch_task(task, overlap_policy='allow', on_finish=lambda state: self.cluster.finish(firing_id, state))
+
+    @contextmanager
+    def _state_lock(self):
+        """获取并发状态锁，记录等待时间"""
+        start = time.perf_counter()
+        with self.lock:
+            SCHEDULER_LOCK_WAIT.observe(time.perf_counter() - start)
+            yield
+
+    def _get_task_state(self, task_id):
+        """获取任务的并发状态，调用方需持有锁"""
+        if task_id not in self.task_states:
+            self.task_states[task_id] = {
+                'running': 0,
+                'pending': deque(),
+                'executions': 0,
+                'skipped': 0,
+                'wait_total': 0.0,
+                'wait_max': 0.0,
+                'wait_last': 0.0
+            }
+        return self.task_states[task_id]
+
+    def _dispatch_task(self, task, overlap_policy=None, on_finish=None):
+        """
+        按任务的并发配置投递一次执行
+
+        max_instances 限制同一任务同时执行的实例数，达到上限后按
+        overlap_policy 处理: skip 跳过本次触发, queue 排队等待,
+        allow 不限制并发。返回本次触发是否被接受。
+        on_finish(state) 在本次执行结束后以 'done' 调用，排队中的执行在关闭时被丢弃则以 'abandoned' 调用。
+        """
+        task_id = task['id']
+        max_instances = max(int(task.get('max_instances', 1) or 1), 1)
+        policy = overlap_policy or task.get('overlap_policy', 'skip')
+        if policy not in self.OVERLAP_POLICIES:
+            policy = 'skip'
+        enqueued_at = time.monotonic()
+
+        with self._state_lock():
+            state = self._get_task_state(task_id)
+            if policy != 'allow' and state['running'] >= max_instances:
+                if policy == 'queue' and len(state['pending']) < self.max_pending:
+                    state['pending'].append((task, enqueued_at, on_finish))
+                    return True
+                state['skipped'] += 1
+                TASK_SKIPPED.inc(task_id=task_id)
+                return False
+            state['running'] += 1
+
+        self.executor.submit(self._run_task, task, enqueued_at, on_finish)
+        return True
+
+    def _run_task(self, task, enqueued_at, on_finish=None):
+        """在工作线程中执行任务，结束后放行同一任务排队中的下一次执行"""
+        task_id = task['id']
+        wait = time.monotonic() - enqueued_at
+        TASK_QUEUE_WAIT.observe(wait, task_id=task_id)
+        with self._state_lock():
+            state = self._get_task_state(task_id)
+            state['executions'] += 1
+            state['wait_total'] += wait
+            state['wait_max'] = max(state['wait_max'], wait)
+            state['wait_last'] = wait
+
+        # 调用链交给事件循环或工作进程执行，或在等待重试时让出工作线程，完成后再放行下一次执行
+        if self.async_client is not None or self.worker_pool is not None:
+            future = self._execute_task_async(task)
+        else:
+            future = self._execute_task(task)
+        if future is None:
+            self._finish_run(task_id, on_finish)
+            return
+        with self._state_lock():
+            self.in_flight.add(future)
+        future.add_done_callback(lambda _: self._finish_async_run(future, task_id, on_finish))
+
+    def _finish_run(self, task_id, on_finish=None):
+        """一次执行结束，放行同一任务排队中的下一次执行，关闭中则丢弃排队的执行"""
+        if on_finish is not None:
+            on_finish('done')
+
+        next_run = None
+        dropped = []
+        with self._state_lock():
+            state = self._get_task_state(task_id)
+            if state['pending'] and not self.stopping:
+                next_run = state['pending'].popleft()
+            else:
+                state['running'] -= 1
+                dropped = list(state['pending'])
+                state['pending'].clear()
+        if next_run:
+            self.executor.submit(self._run_task, *next_run)
+        # 丢弃的执行同样通知调用方，集群触发随之结束，不会一直处于已认领状态
+        for _, _, dropped_finish in dropped:
+            if dropped_finish is not None:
+                dropped_finish('abandoned')
+
+    def _finish_async_run(self, future, task_id, on_finish=None):
+        """以 Future 跟踪的一次执行结束"""
+        with self._state_lock():
+            self.in_flight.discard(future)
+        self._finish_run(task_id, on_finish)
+
+    def _begin_task(self, task):
+        """记录任务开始，返回要执行的步骤，没有步骤时记录失败并返回None"""
         task_id = task['id']
         task_name = task['name']
 
-        # 使用锁确保任务不会并发执行
-        with self.lock:
-            # 记录任务开始
-            log_id = self.logger.log_task_start(task_id, task_name)
+        # 记录任务开始
+        self.logger.log_task_start(task_id, task_name)
 
-            try:
-                # 执行API调用链
-                steps = task.get('steps', [])
-                retry_times = task.get('retry_times', 1)
-
-                if not steps:
-                    self.logger.log_task_failure(
-                        task_id, task_name, 
-                        "任务没有配置API步骤", 
-                        {"task": task}
-                    )
-                    return
-
-                # 执行API链
-                result = self.api_client.execute_chain(steps, retry_times)
-
-                # 记录每个步骤的执行情况
-                for step_result in result['steps']:
-                    self.logger.log_step_execution(
-                        task_id, task_name,
-                        step_result['step_index'],
-                        step_result['step_name'],
-                        step_result['result']
-                    )
-
-                # 记录任务最终结果
-                if result['success']:
-                    self.logger.log_task_success(
-                        task_id, task_name,
-                        {"execution_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-                    )
-                else:
-                    self.logger.log_task_failure(
-                        task_id, task_name, 
-                        result['error'], 
-                        {"steps": result['steps']}
-                    )
+        if not task.get('steps'):
+            self.logger.log_task_failure(
+                task_id, task_name, 
+                "任务没有配置API步骤", 
+                {"task": task}
+            )
+            return None
+        return self._get_compiled_steps(task)
 
+    def _record_metrics(self, task, result, duration):
+        """按任务和步骤记录执行次数、重试次数和各阶段耗时"""
+        task_id = task['id']
+        TASK_RUNS.inc(task_id=task_id, status='success' if result['success'] else 'failure')
+        TASK_DURATION.observe(duration, task_id=task_id)
+
+        for step_result in result['steps']:
+            step = step_result['step_index']
+            step_data = step_result['result']
+            STEP_REQUESTS.inc(task_id=task_id, step=step, status='success' if step_data['success'] else 'failure')
+            retries = step_result.get('attempts', 1) - 1
+            if retries:
+                STEP_RETRIES.inc(retries, task_id=task_id, step=step)
+            for phase, value in step_data.get('timings', {}).items():
+                STEP_PHASE.observe(value, task_id=task_id, step=step, phase=phase)
+
+    def _complete_task(self, task, result, duration=0):
+        """记录每个步骤的执行情况和任务最终结果"""
+        task_id = task['id']
+        task_name = task['name']
+        self._record_metrics(task, result, duration)
+
+        # 记录每个步骤的执行情况
+        for step_result in result['steps']:
+            self.logger.log_step_execution(
+                task_id, task_name,
+                step_result['step_index'],
+                step_result['step_name'],
+                step_result['result']
+            )
+
+        # 记录任务最终结果
+        if result['success']:
+            self.logger.log_task_success(
+                task_id, task_name,
+                {"execution_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+            )
+        else:
+            self.logger.log_task_failure(
+                task_id, task_name, 
+                result['error'], 
+                {"steps": result['steps']}
+            )
+
+    def _fail_task(self, task, error):
+        """记录任务执行异常"""
+        TASK_RUNS.inc(task_id=task['id'], status='failure')
+        self.logger.log_task_failure(
+            task['id'], task['name'], 
+            f"任务执行异常: {str(error)}", 
+            {"task": task}
+        )
+
+    def _parallelism(self, task):
+        """任务调用链内同时执行的步骤数，默认 1 即按顺序执行"""
+        return max(int(task.get('parallelism', 1) or 1), 1)
+
+    def _execute_task(self, task):
+        """
+        在工作线程中执行任务，返回 Future，没有可执行步骤时返回None
+
+        调用链以生成器方式执行，需要等待重试时交给重试定时器，到期后再投递到线程池继续，
+        等待期间不占用工作线程。
+        """
+        try:
+            steps = self._begin_task(task)
+            if steps is None:
+                return None
+            start = time.perf_counter()
+            chain = self.api_client.run_chain(
+                steps, task.get('retry_times', 1), self._parallelism(task), task.get('timeout')
+            )
+        except Exception as e:
+            self._fail_task(task, e)
+            return None
+
+        future = Future()
+        future.set_running_or_notify_cancel()
+
+        def resume():
+            try:
+                delay = next(chain)
+            except StopIteration as stop:
+                self._complete_task(task, stop.value, time.perf_counter() - start)
+                future.set_result(stop.value)
             except Exception as e:
-                self.logger.log_task_failure(
-                    task_id, task_name, 
-                    f"任务执行异常: {str(e)}", 
-                    {"task": task}
+                self._fail_task(task, e)
+                future.set_result(None)
+            else:
+                self.retry_timer.call_later(delay, lambda: self._submit(resume))
+
+        resume()
+        return future
+
+    def _submit(self, fn):
+        """投递到工作线程池，关闭过程中线程池不再接收时在当前线程执行"""
+        try:
+            self.executor.submit(fn)
+        except RuntimeError:
+            fn()
+
+    def _execute_task_async(self, task):
+        """在异步引擎或工作进程中执行任务，返回 Future，没有可执行步骤时返回None"""
+        try:
+            steps = self._begin_task(task)
+            if steps is None:
+                return None
+            start = time.perf_counter()
+            if self.worker_pool is not None:
+                # 编译结果不能跨进程传递，投递原始步骤配置，由工作进程编译
+                future = self.worker_pool.submit_chain(
+                    task['steps'], task.get('debug', False), task.get('retry_times', 1), self._parallelism(task),
+                    task.get('timeout')
+                )
+            else:
+                future = self.async_client.submit_chain(
+                    steps, task.get('retry_times', 1), self._parallelism(task), task.get('timeout')
                 )
+        except Exception as e:
+            self._fail_task(task, e)
+            return None
+
+        def on_done(future):
+            try:
+                self._complete_task(task, future.result(), time.perf_counter() - start)
+            except Exception as e:
+                self._fail_task(task, e)
+
+        future.add_done_callback(on_done)
+        return future
+
+    def _publish_task(self, action, task_id):
+        """推送任务变更事件，删除的任务只带ID"""
+        if self.events is not None:
+            self.events.publish('task', {
+                'action': action,
+                'task_id': task_id,
+                'task': self.storage.get_task(task_id)
+            })
 
     def add_task(self, task):
         """添加新任务"""
@@ -145,17 +474,16 @@ class TaskScheduler:
         if task['status'] == 'active':
             self._schedule_task(task)
 
+        self._publish_task('created', task_id)
         return task_id
 
     def update_task(self, task_id, updated_task):
         """更新任务"""
         # 先从调度器中移除旧任务
-        try:
-            self.scheduler.remove_job(f"task_{task_id}")
-        except:
-            pass
+        self._unschedule_task(task_id)
 
-        # 更新任务数据
+        # 更新任务数据，旧的编译结果随之失效
+        self._invalidate_compiled_steps(task_id)
         success = self.storage.update_task(task_id, updated_task)
 
         if success:
@@ -163,30 +491,33 @@ class TaskScheduler:
             task = self.storage.get_task(task_id)
             if task and task['status'] == 'active':
                 self._schedule_task(task)
+            self._publish_task('updated', task_id)
 
         return success
 
     def delete_task(self, task_id):
         """删除任务"""
         # 先从调度器中移除任务
-        try:
-            self.scheduler.remove_job(f"task_{task_id}")
-        except:
-            pass
+        self._unschedule_task(task_id)
 
         # 更新任务状态为已删除
-        return self.storage.delete_task(task_id)
+        self._invalidate_compiled_steps(task_id)
+        success = self.storage.delete_task(task_id)
+        if success:
+            registry.remove('task_id', task_id)
+            self._publish_task('deleted', task_id)
+        return success
 
     def pause_task(self, task_id):
         """暂停任务"""
         # 先从调度器中移除任务
-        try:
-            self.scheduler.remove_job(f"task_{task_id}")
-        except:
-            pass
+        self._unschedule_task(task_id)
 
         # 更新任务状态为暂停
-        return self.storage.update_task(task_id, {'status': 'paused'})
+        success = self.storage.update_task(task_id, {'status': 'paused'})
+        if success:
+            self._publish_task('paused', task_id)
+        return success
 
     def resume_task(self, task_id):
         """恢复任务"""
@@ -198,6 +529,7 @@ class TaskScheduler:
             task = self.storage.get_task(task_id)
             if task:
                 self._schedule_task(task)
+            self._publish_task('resumed', task_id)
 
         return success
 
@@ -205,10 +537,11 @@ class TaskScheduler:
         """立即运行任务"""
         task = self.storage.get_task(task_id)
         if task:
-            # 在新线程中执行任务，避免阻塞
-            thread = threading.Thread(target=self._execute_task, args=[task])
-            thread.daemon = True
-            thread.start()
+            # 手动触发的执行不丢弃，上一次未结束时排队等待；集群模式下由任意节点认领执行
+            if self.cluster is not None:
+                self.cluster.enqueue(task, 'queue', fenced=False)
+            else:
+                self._dispatch_task(task, overlap_policy='queue')
             return True
         return False
 
@@ -220,6 +553,40 @@ class TaskScheduler:
         """获取单个任务"""
         return self.storage.get_task(task_id)
 
+    def get_metrics(self):
+        """获取每个任务的并发状态和排队等待时间统计(秒)"""
+        with self.lock:
+            metrics = {}
+            for task_id, state in self.task_states.items():
+                executions = state['executions']
+                metrics[task_id] = {
+                    'running': state['running'],
+                    'pending': len(state['pending']),
+                    'executions': executions,
+                    'skipped': state['skipped'],
+                    'queue_wait_avg': round(state['wait_total'] / executions, 4) if executions else 0,
+                    'queue_wait_max': round(state['wait_max'], 4),
+                    'queue_wait_last': round(state['wait_last'], 4)
+                }
+            return metrics
+
     def shutdown(self):
-        """关闭调度器"""
+        """关闭调度器，等待执行中的任务结束，排队中的执行被丢弃"""
+        with self.lock:
+            self.stopping = True
+        if self.cluster is not None:
+            self.cluster.stop()
         self.scheduler.shutdown()
+        # 等待重试的调用链不再等待，立即重试
+        self.retry_timer.close()
+        self.executor.shutdown(wait=True)
+        # 工作线程只负责投递，还要等交给异步引擎或工作进程的调用链执行完
+        with self.lock:
+            in_flight = list(self.in_flight)
+        wait(in_flight)
+        if self.async_client is not None:
+            self.async_client.close()
+        if self.worker_pool is not None:
+            self.worker_pool.close()
+        if self.cluster is not None:
+            self.cluster.close()
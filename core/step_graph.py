@@ -0,0 +1,147 @@
+# 调用链按参数依赖并行执行时的调度状态，同步和异步执行引擎共用
+
+import time
+
+from core.retry import RetryPolicy, retry_budget
+from core.template import step_dependencies
+
+
+class StepGraph:
+    """
+    按参数依赖并行执行调用链的调度状态
+
+    只决定哪些步骤可以开始、失败的步骤何时重试、何时停止，并汇总结果，不执行请求:
+    执行引擎用 start() 取出可以开始的步骤，在线程池或事件循环中执行后用 finish() 报告结果，
+    没有执行中的步骤可等时用 timeout() 得到需要等待的时间。
+
+    依赖的步骤全部成功后才开始执行，同时执行的步骤不超过 parallelism 个。主机限流需要等待的步骤
+    和失败后等待重试的步骤一样进入等待，到期后再开始，等待期间不占用执行引擎的线程。某个步骤
+    最终失败或超过调用链截止时间后不再开始新的步骤，等待重试的步骤以上次的结果记为失败，首次
+    执行前等待限流的步骤记为未执行，已开始的步骤执行完毕。
+    """
+
+    def __init__(self, api_client, steps, retry_times, parallelism, timeouts):
+        self.api_client = api_client
+        self.steps = steps
+        self.parallelism = parallelism
+        self.timeouts = timeouts
+        self.dependencies = step_dependencies(steps)
+        if api_client._debug_enabled(steps[0]):
+            api_client._log_dependencies(steps, self.dependencies)
+
+        self.policies = [RetryPolicy.for_step(step, retry_times) for step in steps]
+        self.results = {}  # {步骤序号: (步骤结果, 执行次数)}
+        self.pending = list(range(len(steps)))  # 尚未开始的步骤
+        self.running = set()  # 执行中的步骤
+        # 等待重试或限流的步骤 {步骤序号: (到期时间, 上次的步骤结果, 是否已预约限流令牌)}
+        self.waiting = {}
+        self.contexts = {}  # {步骤序号: 执行时的上下文参数}
+        self.attempts = dict.fromkeys(range(len(steps)), 0)
+        self.failed = None  # 最终失败的步骤中序号最小的
+        self.expired = False
+
+    def unfinished(self):
+        """是否还有未开始、执行中或等待中的步骤"""
+        return bool(self.pending or self.running or self.waiting)
+
+    def start(self):
+        """返回现在可以开始执行的 [(步骤序号, 上下文参数)]，这些步骤记为执行中"""
+        if self.failed is None and not self.expired:
+            self.expired = self.timeouts.expired()
+        if self.failed is not None or self.expired:
+            # 不再重试，等待重试的步骤以上次的结果记为失败，首次执行前等待限流的步骤放回未开始
+            for i, (_, step_result, _) in self.waiting.items():
+                if step_result is None:
+                    self.pending.append(i)
+                    continue
+                self.results[i] = (step_result, self.attempts[i])
+                if self.failed is None or (self.expired and i < self.failed):
+                    self.failed = i
+            self.waiting.clear()
+            return []
+
+        now = time.monotonic()
+        slots = max(self.parallelism - len(self.running), 0)
+        due = sorted(i for i, (at, _, _) in self.waiting.items() if at <= now)[:slots]
+        started = []
+        for i in due:
+            _, step_result, reserved = self.waiting.pop(i)
+            if reserved or self._reserve(i, step_result, now):
+                started.append(i)
+        for i in self._ready_steps(slots - len(due)):
+            self.contexts[i] = self._chain_context(i)
+            retry_budget.deposit()
+            self.pending.remove(i)
+            if self._reserve(i, None, now):
+                started.append(i)
+        self.running.update(started)
+        return [(i, self.contexts[i]) for i in started]
+
+    def timeout(self):
+        """有空位且有等待中的步骤时，返回到最早的等待到期需要的秒数，否则返回 None"""
+        if not self.waiting or len(self.running) >= self.parallelism:
+            return None
+        due = min(due for due, _, _ in self.waiting.values())
+        return self.timeouts.cap(max(due - time.monotonic(), 0))
+
+    def finish(self, i, step_result):
+        """步骤执行完毕，可重试的失败按重试策略进入等待，否则记录结果"""
+        self.running.discard(i)
+        retry = self.attempts[i]
+        self.attempts[i] += 1
+        if not step_result['success'] and self.failed is None:
+            delay = self.api_client._retry_delay(self.policies[i], step_result, retry, self.timeouts)
+            if delay is not None:
+                self.waiting[i] = (time.monotonic() + delay, step_result, False)
+                return
+        self.results[i] = (step_result, self.attempts[i])
+        if not step_result['success'] and (self.failed is None or i < self.failed):
+            self.failed = i
+
+    def result(self):
+        """汇总步骤结果，结构与顺序执行相同，步骤按序号排列，错误信息取序号最小的失败步骤"""
+        cancelled = len(self.pending)
+        result = {
+            'success': self.failed is None and not cancelled,
+            'steps': [self.api_client._step_entry(self.steps, i, *self.results[i]) for i in sorted(self.results)],
+            'error': None
+        }
+        if self.failed is not None:
+            result['error'] = f"步骤{self.failed+1}失败: {self.results[self.failed][0]['error']}"
+        elif cancelled:
+            # 没有步骤失败却有步骤未执行，只可能是超过了调用链截止时间
+            result['error'] = self.timeouts.cancelled(cancelled)
+        return result
+
+    def _reserve(self, i, step_result, now):
+        """
+        为步骤预约主机限流令牌，可以立即执行时返回 True
+
+        需要等待时进入等待，到期后不再预约；排队超过上限时以限流失败结束本次执行，按重试策略处理。
+        step_result 为上次执行的结果，首次执行时为 None。
+        """
+        wait, rejected = self.api_client._reserve_host(self.steps[i], self.contexts[i])
+        if rejected is not None:
+            self.finish(i, rejected)
+            return False
+        if wait:
+            self.waiting[i] = (now + wait, step_result, True)
+            return False
+        return True
+
+    def _ready_steps(self, slots):
+        """依赖的步骤均已成功、可以开始执行的步骤序号，最多 slots 个"""
+        ready = []
+        for i in self.pending:
+            if len(ready) >= slots:
+                break
+            if all(j in self.results and self.results[j][0]['success'] for j in self.dependencies[i]):
+                ready.append(i)
+        return ready
+
+    def _chain_context(self, i):
+        """按步骤顺序合并所依赖步骤提取的参数，与顺序执行时该步骤看到的参数一致"""
+        context = {}
+        for j in self.dependencies[i]:
+            context.update(self.results[j][0]['extracted_params'])
+        return context
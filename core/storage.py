@@ -3,100 +3,463 @@
 
 import json
 import os
-from datetime import datetime
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，共享任务文件时无法跨进程加锁
+    fcntl = None
+
+from core.blob_store import BlobStore, resolve
+from core.fileutil import atomic_write_json, remove_stale_temp
+from core.log_index import LogIndex
+from core.log_store import LogStore
 
 class Storage:
-    def __init__(self, data_dir="data"):
+    def __init__(self, data_dir="data", log_segment_max_bytes=8 * 1024 * 1024, log_fsync=True,
+                 log_segment_max_age=0, blob_compress=True, log_data_dir=None, shared_tasks=False,
+                 blob_orphan_grace=600, read_only=False):
+        """
+        参数:
+            log_data_dir: 日志、日志索引和大对象的存放目录，默认与 data_dir 相同；
+                集群模式下每个节点使用各自的目录
+            shared_tasks: 任务文件是否由多个进程共享，开启后读取前检查文件是否被其他进程修改，
+                修改时加跨进程文件锁
+            blob_orphan_grace: 不再被引用的大对象在最近一次保存后至少保留的秒数，见 BlobStore
+            read_only: 只读查询其他进程写入的日志(集群中其他节点的日志目录)，不加载任务、不修复或重建索引，
+                只能调用日志查询方法
+        """
         self.data_dir = data_dir
+        log_data_dir = log_data_dir or data_dir
         self.tasks_file = os.path.join(data_dir, "tasks.json")
-        self.logs_file = os.path.join(data_dir, "logs.json")
+        self.logs_file = os.path.join(log_data_dir, "logs.json")  # 旧版日志文件，仅用于迁移
+        self.logs_dir = os.path.join(log_data_dir, "logs")
+        self.log_index_file = os.path.join(log_data_dir, "logs_index.db")
+        self.blobs_dir = os.path.join(log_data_dir, "blobs")
+        self.compaction_marker = os.path.join(self.logs_dir, "compaction.pending")  # 分段重写进行中的标记
+        self.shared_tasks = shared_tasks
+        self.read_only = read_only
+
+        if read_only:
+            self.log_store = LogStore(self.logs_dir, read_only=True)
+            self.log_index = LogIndex(self.log_index_file, read_only=True)
+            self.compaction_lock = threading.Lock()
+            self.blob_store = BlobStore(self.blobs_dir)
+            return
 
         # 确保数据目录存在
-        if not os.path.exists(data_dir):
-            os.makedirs(data_dir)
+        for directory in (data_dir, log_data_dir):
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+
+        # 初始化任务文件，清理上次写入中断遗留的临时文件；共享任务文件时其他进程可能正在写临时文件，
+        # 持有跨进程文件锁时再清理
+        with self._tasks_file_lock():
+            remove_stale_temp(self.tasks_file)
+            if not os.path.exists(self.tasks_file):
+                atomic_write_json(self.tasks_file, [])
 
-        # 初始化任务和日志文件
-        if not os.path.exists(self.tasks_file):
-            with open(self.tasks_file, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False, indent=2)
+        # 任务常驻内存，按ID索引，修改时写穿到文件；已删除的任务不进入热数据
+        self.tasks_lock = threading.RLock()
+        self.tasks = {}
+        self.deleted_tasks = {}
+        self.tasks_stamp = None  # 最近一次读写时任务文件的 (修改时间, 大小)
+        self._load_task_registry()
 
+        # 日志以追加写入的分段文件保存
+        self.log_store = LogStore(
+            self.logs_dir, segment_max_bytes=log_segment_max_bytes, fsync=log_fsync,
+            segment_max_age=log_segment_max_age
+        )
+        self.log_index = LogIndex(self.log_index_file)
+        self.compaction_lock = threading.Lock()  # 替换分段期间阻止按旧位置读取日志
+        self.blob_store = BlobStore(  # 超过内联上限的日志字段
+            self.blobs_dir, compress=blob_compress, orphan_grace=blob_orphan_grace
+        )
+        self.pending_orphans = set()  # 宽限期内暂未删除、不再被引用的大对象，下次压缩时再检查
+        self._migrate_legacy_logs()
+        self._sync_log_index()
+
+    def _migrate_legacy_logs(self):
+        """将旧版 logs.json 一次性迁移到分段日志存储"""
         if not os.path.exists(self.logs_file):
-            with open(self.logs_file, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False, indent=2)
+            return
 
-    def load_tasks(self):
-        """加载所有任务"""
+        try:
+            with open(self.logs_file, 'r', encoding='utf-8') as f:
+                content = f.read().strip()
+                logs = json.loads(content) if content else []
+        except json.JSONDecodeError:
+            logs = []
+
+        # 迁移在启动时、写入任何新日志之前完成，旧文件仍在说明上次迁移被中断，
+        # 清空后重新导入即可
+        self.log_store.clear()
+        self.log_index.clear()
+
+        # 旧文件按写入顺序追加，保持原有先后关系
+        locations = self.log_store.import_logs(logs)
+        self.log_index.add_many(zip(logs, locations))
+
+        # 保留旧文件作为备份，避免重复迁移
+        os.replace(self.logs_file, self.logs_file + '.migrated')
+
+    def _sync_log_index(self):
+        """让索引与分段文件保持一致，补齐缺失的索引或整体重建"""
+        last_store_id = self.log_store.next_id - 1
+        last_index_id = self.log_index.last_id()
+
+        if os.path.exists(self.compaction_marker):
+            # 分段重写到一半时进程退出，索引中的位置可能已失效，按现有分段整体重建
+            self.log_index.clear()
+            last_index_id = -1
+            os.remove(self.compaction_marker)
+
+        if last_index_id == last_store_id:
+            return
+
+        if last_index_id > last_store_id:
+            # 分段文件被删除或替换过，索引整体作废
+            self.log_index.clear()
+            last_index_id = -1
+
+        # 从最新分段向前扫描，只补齐尚未建立索引的日志；日志ID随分段递增，
+        # 某个分段的最大ID已建立索引时更早的分段也都已建立，空分段(如刚滚动的新分段)跳过继续向前
+        for segment in reversed(self.log_store.segments):
+            scanned = [
+                (log, (segment, offset, length))
+                for log, offset, length in self.log_store.scan_segment(segment)
+            ]
+            if not scanned:
+                continue
+            if max(log.get('id', 0) for log, _ in scanned) <= last_index_id:
+                break
+            self.log_index.add_many([entry for entry in scanned if entry[0].get('id', 0) > last_index_id])
+
+    def _tasks_file_stamp(self):
+        """任务文件的 (修改时间, 大小)，用于判断是否被其他进程修改"""
+        stat = os.stat(self.tasks_file)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load_task_registry(self):
+        """读取任务文件，建立内存索引"""
         with open(self.tasks_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+            tasks = json.load(f)
+
+        self.tasks = {}
+        self.deleted_tasks = {}
+        for task in tasks:
+            if task.get('status') == 'deleted':
+                self.deleted_tasks[task['id']] = task
+            else:
+                self.tasks[task['id']] = task
+        self.tasks_stamp = self._tasks_file_stamp()
+
+    def _refresh_tasks(self):
+        """共享任务文件被其他进程修改过时重新加载，调用方需持有锁"""
+        if self.shared_tasks and self._tasks_file_stamp() != self.tasks_stamp:
+            self._load_task_registry()
+
+    @contextmanager
+    def _tasks_file_lock(self):
+        """共享任务文件时持有跨进程文件锁，否则不加锁"""
+        if not self.shared_tasks or fcntl is None:
+            yield
+            return
+
+        with open(self.tasks_file + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _tasks_write(self):
+        """修改任务前加锁，共享任务文件时同时持有跨进程文件锁并先加载最新内容"""
+        with self.tasks_lock, self._tasks_file_lock():
+            if self.shared_tasks:
+                self._refresh_tasks()
+            yield
+
+    def _persist_tasks(self):
+        """将内存中的任务写入临时文件后原子替换任务文件，调用方需持有锁"""
+        tasks = sorted(list(self.tasks.values()) + list(self.deleted_tasks.values()), key=lambda t: t['id'])
+        atomic_write_json(self.tasks_file, tasks)
+        self.tasks_stamp = self._tasks_file_stamp()
+
+    def load_tasks(self):
+        """加载所有任务(包含已删除的任务)"""
+        with self.tasks_lock:
+            self._refresh_tasks()
+            tasks = list(self.tasks.values()) + list(self.deleted_tasks.values())
+        return sorted((dict(task) for task in tasks), key=lambda t: t['id'])
+
+    def list_tasks(self):
+        """获取所有未删除的任务"""
+        with self.tasks_lock:
+            self._refresh_tasks()
+            tasks = [dict(task) for task in self.tasks.values()]
+        return sorted(tasks, key=lambda t: t['id'])
 
     def save_tasks(self, tasks):
         """保存任务列表"""
-        with open(self.tasks_file, 'w', encoding='utf-8') as f:
-            json.dump(tasks, f, ensure_ascii=False, indent=2)
+        with self._tasks_write():
+            self.tasks = {}
+            self.deleted_tasks = {}
+            for task in tasks:
+                if task.get('status') == 'deleted':
+                    self.deleted_tasks[task['id']] = task
+                else:
+                    self.tasks[task['id']] = task
+            self._persist_tasks()
 
     def add_task(self, task):
         """添加新任务"""
-        tasks = self.load_tasks()
-        task['id'] = len(tasks) + 1
-        task['created_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        task['status'] = 'active'  # active, paused, deleted
-        tasks.append(task)
-        self.save_tasks(tasks)
-        return task['id']
+        with self._tasks_write():
+            task['id'] = max(list(self.tasks) + list(self.deleted_tasks) + [0]) + 1
+            task['created_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            task['status'] = 'active'  # active, paused, deleted
+            self.tasks[task['id']] = task
+            self._persist_tasks()
+            return task['id']
 
     def update_task(self, task_id, updated_task):
         """更新任务"""
-        tasks = self.load_tasks()
-        for i, task in enumerate(tasks):
-            if task['id'] == task_id:
-                tasks[i] = {**tasks[i], **updated_task}
-                self.save_tasks(tasks)
-                return True
-        return False
+        with self._tasks_write():
+            if task_id not in self.tasks:
+                return False
+            self.tasks[task_id] = {**self.tasks[task_id], **updated_task}
+            self._persist_tasks()
+            return True
 
     def delete_task(self, task_id):
         """删除任务"""
-        tasks = self.load_tasks()
-        for i, task in enumerate(tasks):
-            if task['id'] == task_id:
-                tasks[i]['status'] = 'deleted'
-                self.save_tasks(tasks)
-                return True
-        return False
+        with self._tasks_write():
+            if task_id not in self.tasks:
+                return False
+            task = self.tasks.pop(task_id)
+            self.deleted_tasks[task_id] = {**task, 'status': 'deleted'}
+            self._persist_tasks()
+            return True
 
     def get_task(self, task_id):
         """获取单个任务"""
-        tasks = self.load_tasks()
-        for task in tasks:
-            if task['id'] == task_id and task['status'] != 'deleted':
-                return task
-        return None
+        with self.tasks_lock:
+            self._refresh_tasks()
+            task = self.tasks.get(task_id)
+            return dict(task) if task else None
 
     def load_logs(self, task_id=None, limit=100):
         """加载日志，可按任务ID过滤"""
-        try:
-            with open(self.logs_file, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                if not content:
-                    return []
-                logs = json.loads(content)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        return self.query_logs(task_id=task_id, limit=limit)[0]
+
+    def _fetch_logs(self, fields=None, **query):
+        """
+        按索引查询读取日志，调用方需持有 compaction_lock
+
+        参数:
+            fields: 只返回这些字段，都是索引中的摘要字段时直接从索引读取，不读取分段文件
+            query: 传给 LogIndex.query 的过滤和分页条件
+        """
+        if fields and set(fields) <= set(LogIndex.SUMMARY_FIELDS):
+            columns = [field for field in LogIndex.SUMMARY_FIELDS if field in fields]
+            return [dict(zip(columns, row)) for row in self.log_index.query(columns=columns, **query)]
+
+        if self.read_only:
+            # 写入方压缩分段时不持有本进程的锁，按旧位置读到的日志ID不符时丢弃
+            rows = self.log_index.query(columns=('id', 'segment', 'offset', 'length'), **query)
+            ids = {row[0] for row in rows}
+            logs = [log for log in self.log_store.read_many([row[1:] for row in rows]) if log.get('id') in ids]
+        else:
+            logs = self.log_store.read_many(self.log_index.query(**query))
+        if fields:
+            logs = [{field: log[field] for field in fields if field in log} for log in logs]
+        return logs
+
+    def query_logs(self, task_id=None, status=None, page=1, limit=20, fields=None):
+        """按任务ID和状态分页查询日志，返回 (当前页日志, 总条数)"""
+        with self.compaction_lock:
+            logs = self._fetch_logs(fields, task_id=task_id, status=status, limit=limit, offset=(page - 1) * limit)
+            return logs, self.log_index.count(task_id, status)
+
+    def scan_logs(self, task_id=None, status=None, before_id=None, after_id=None, limit=20, fields=None):
+        """
+        按日志ID游标读取一页日志(按ID倒序)，不统计总数，翻页代价与页码无关
+
+        参数:
+            before_id: 只返回ID小于它的日志(向更早翻页)，与 after_id 都为空时从最新一条开始
+            after_id: 只返回ID大于它的日志中紧接着的一页(向更新翻页)
+            fields: 只返回这些字段
 
-        if task_id:
-            logs = [log for log in logs if log['task_id'] == task_id]
+        返回:
+            (日志列表, 翻页方向上是否还有更多)
+        """
+        with self.compaction_lock:
+            logs = self._fetch_logs(
+                fields, task_id=task_id, status=status, limit=limit + 1, before_id=before_id, after_id=after_id
+            )
+        has_more = len(logs) > limit
+        if has_more:
+            logs = logs[1:] if after_id and not before_id else logs[:limit]
+        return logs, has_more
 
-        # 按时间倒序排序，并限制数量
-        logs.sort(key=lambda x: x['timestamp'], reverse=True)
-        return logs[:limit]
+    def count_logs(self, task_id=None, status=None):
+        """按任务ID和状态统计日志条数"""
+        return self.log_index.count(task_id, status)
+
+    def get_log(self, log_id):
+        """按ID获取单条日志"""
+        with self.compaction_lock:
+            location = self.log_index.locate(log_id)
+            if not location:
+                return None
+            log = self.log_store.read_at(*location)
+        if self.read_only and log and log.get('id') != log_id:
+            return None
+        return log
+
+    def resolve_log(self, log):
+        """还原日志详情中移入大对象存储的字段"""
+        if log and isinstance(log.get('details'), dict):
+            log['details'] = resolve(log['details'], self.blob_store)
+        return log
+
+    def get_log_stats(self, day):
+        """获取某天各状态的日志条数"""
+        return self.log_index.daily_counts(day)
 
     def add_log(self, log):
         """添加日志"""
-        logs = self.load_logs()
-        log['id'] = len(logs) + 1
         log['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        logs.append(log)
+        location = self.log_store.append(log)
+        self.log_index.add(log, location)
+
+    def add_logs(self, logs):
+        """批量添加日志，整批只写一次文件和一次索引"""
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for log in logs:
+            log.setdefault('timestamp', now)
+        locations = self.log_store.append_many(logs)
+        self.log_index.add_many(zip(logs, locations))
+
+    def allocate_log_id(self):
+        """预先分配日志ID"""
+        return self.log_store.allocate_id()
+
+    def clear_logs(self):
+        """清除所有日志，日志ID继续递增；经 LogWriter 写入时应调用 LogWriter.clear_logs"""
+        with self.compaction_lock:
+            self.log_store.clear()
+            self.log_index.clear()
+            self.blob_store.clear()
+            self.pending_orphans = set()
+
+    def compact_logs(self, max_age_days=0, max_per_task=0, max_bytes=0, compress=True):
+        """
+        按保留策略清理已封存的日志分段，并压缩归档
+
+        参数:
+            max_age_days: 日志最长保留天数，0 表示不限
+            max_per_task: 每个任务最多保留的日志条数，0 表示不限
+            max_bytes: 日志分段总大小上限(字节)，超出时从最旧的分段整段删除，0 表示不限
+            compress: 是否将封存的分段压缩为 .jsonl.gz
+
+        只处理已封存的分段，正在写入的最新分段不受影响，因此日志ID不会回退。
+
+        返回:
+            {'segments': 重写或删除的分段数, 'removed': 清理的日志条数, 'bytes': 分段总大小}
+        """
+        sealed = self.log_store.sealed_segments()
+        before = None
+        if max_age_days:
+            before = (datetime.now() - timedelta(days=max_age_days)).strftime('%Y-%m-%d %H:%M:%S')
+        expired = self.log_index.expired_ids(sealed, before, max_per_task)
+
+        # 总大小超限时从最旧的分段开始整段删除
+        dropped_segments = set()
+        if max_bytes:
+            total = self.log_store.total_size()
+            for segment in sealed:
+                if total <= max_bytes:
+                    break
+                dropped_segments.add(segment)
+                total -= self.log_store.segment_size(segment)
+
+        summary = {'segments': 0, 'removed': 0}
+        orphans = set(self.pending_orphans)
+        for segment in sealed:
+            expired_ids = expired.get(segment, set())
+            if segment in dropped_segments:
+                keep = lambda log: False
+            elif expired_ids or (segment in self.log_store.archived) != compress:
+                keep = lambda log: log.get('id') not in expired_ids
+            else:
+                continue
+
+            tmp_path, kept, removed = self.log_store.rewrite_segment(segment, keep, compress)
+
+            # 先写标记再替换分段，进程在两者之间退出时启动时会重建索引
+            with self.compaction_lock:
+                with open(self.compaction_marker, 'w') as f:
+                    f.write(str(segment))
+                self.log_store.commit_rewrite(segment, tmp_path)
+                orphans.update(self.log_index.relocate(kept, removed))
+                os.remove(self.compaction_marker)
+
+            summary['segments'] += 1
+            summary['removed'] += len(removed)
+
+        # 宽限期内被新日志复用的对象已重新计入引用，不再删除
+        orphans -= self.log_index.referenced(orphans)
+        self.pending_orphans = set(self.blob_store.delete(orphans))
+        summary['bytes'] = self.log_store.total_size()
+        return summary
+
+
+class NodeLogs:
+    """
+    集群各节点的日志
+
+    集群模式下每个节点的日志写在 data_dir/nodes/<节点标识>/ 下，由该节点独占写入。
+    本节点直接使用自己的 Storage，其他节点的日志目录按需以只读方式打开，
+    供日志列表、详情和统计按节点查看；不会修改其他节点的日志。
+    """
+
+    def __init__(self, data_dir, node_id, storage):
+        self.nodes_dir = os.path.join(data_dir, 'nodes')
+        self.node_id = node_id
+        self.storage = storage
+        self.lock = threading.Lock()
+        self.readers = {}  # {节点标识: 只读 Storage}
+
+    def nodes(self):
+        """已写入过日志的节点标识，包含本节点"""
+        nodes = {self.node_id}
+        if os.path.isdir(self.nodes_dir):
+            for name in os.listdir(self.nodes_dir):
+                if os.path.exists(os.path.join(self.nodes_dir, name, 'logs_index.db')):
+                    nodes.add(name)
+        return sorted(nodes)
+
+    def get(self, node_id=None):
+        """节点的日志存储，为空时返回本节点；节点不存在时返回 None"""
+        if not node_id or node_id == self.node_id:
+            return self.storage
+        with self.lock:
+            reader = self.readers.get(node_id)
+            if reader is None:
+                if node_id not in self.nodes():
+                    return None
+                reader = Storage(self.nodes_dir, log_data_dir=os.path.join(self.nodes_dir, node_id), read_only=True)
+                self.readers[node_id] = reader
+            return reader
 
-        # 保存日志
-        with open(self.logs_file, 'w', encoding='utf-8') as f:
-            json.dump(logs, f, ensure_ascii=False, indent=2)
+    def close(self):
+        """关闭已打开的其他节点日志"""
+        with self.lock:
+            for reader in self.readers.values():
+                reader.log_index.close()
+            self.readers = {}
@@ -0,0 +1,201 @@
+# 流式响应模块，边接收边解析JSON响应，只保留参数提取路径上的值
+
+import json
+import re
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:  # 未安装时在缓冲上限内缓冲全部内容再整体解析，启动时由 check_streaming 警告
+    ijson = None
+
+from core.diagnostics import get_logger
+from core.template import jsonpath_cache, normalize_path
+
+log = get_logger('stream')
+
+# 简单路径的组成部分: .name、[0]、['name']
+PATH_TOKEN = re.compile(r"\.([^.\[\]*?@()]+)|\[(\d+)\]|\['([^']+)'\]|\[\"([^\"]+)\"\]")
+
+
+class ResponseTooLarge(Exception):
+    """响应内容超过大小上限"""
+
+
+def parse_simple_path(path):
+    """
+    将只包含字段名和数组下标的JSON路径解析为键序列
+
+    如 $.data.items[0].id 解析为 ('data', 'items', 0, 'id')，
+    包含通配符、递归下降、过滤表达式等复杂语法时返回 None。
+    """
+    path = normalize_path(path)
+    if not path.startswith('$'):
+        return None
+
+    keys = []
+    position = 1
+    while position < len(path):
+        match = PATH_TOKEN.match(path, position)
+        if not match:
+            return None
+        name, index, single_quoted, double_quoted = match.groups()
+        keys.append(int(index) if index is not None else name or single_quoted or double_quoted)
+        position = match.end()
+    return tuple(keys)
+
+
+def check_streaming(buffer_max_bytes):
+    """启动时检查是否可以流式解析，未安装 ijson 时记录一次警告，返回是否可用"""
+    if ijson is None:
+        log.warning(
+            '未安装 ijson，流式解析退化为缓冲全部响应后整体解析，超过缓冲上限的响应将失败',
+            extra={'fields': {'buffer_max_bytes': buffer_max_bytes}}
+        )
+    return ijson is not None
+
+
+def read_limited(chunks, max_bytes):
+    """读取全部内容，超过 max_bytes 时抛出 ResponseTooLarge"""
+    data = bytearray()
+    for chunk in chunks:
+        data += chunk
+        if max_bytes and len(data) > max_bytes:
+            raise ResponseTooLarge(f'响应超过大小上限({max_bytes}字节)')
+    return bytes(data)
+
+
+class StreamExtractor:
+    """
+    流式JSON提取器
+
+    按块喂入响应内容，累计超过 max_bytes 时抛出 ResponseTooLarge。
+    安装了 ijson 且提取路径都是简单路径时，边解析边只构建路径上的值，
+    内存占用与响应大小无关，所有路径找到后即可停止读取；
+    否则缓冲全部内容，结束时整体解析后按路径提取，缓冲的内容不超过 buffer_max_bytes。
+    """
+
+    def __init__(self, paths, max_bytes=0, buffer_max_bytes=0):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.values = {}  # {原始路径: 值}，同一路径只取第一个匹配
+
+        self.targets = {}  # {键序列: [原始路径, ...]}
+        for path in paths:
+            keys = parse_simple_path(path)
+            if keys is None:
+                self.targets = None
+                break
+            self.targets.setdefault(keys, []).append(path)
+
+        self.paths = list(paths)
+        self.streaming = ijson is not None and self.targets is not None
+        if self.streaming:
+            self.events = ijson.sendable_list()
+            self.parser = ijson.parse_coro(self.events, use_float=True)
+            self.stack = []  # 当前所在容器 [类型, 当前键或下标]
+            self.depths = {len(keys) for keys in self.targets}  # 目标路径的深度，其他深度无需比较路径
+            self.builders = []  # 正在构建的值 [键序列, 构建器, 嵌套深度]
+            self.found = set()
+        else:
+            self.chunks = []
+            if buffer_max_bytes and (not max_bytes or buffer_max_bytes < max_bytes):
+                self.max_bytes = buffer_max_bytes
+
+    @property
+    def done(self):
+        """所有路径都已找到，剩余内容无需再读"""
+        return self.streaming and len(self.found) == len(self.targets)
+
+    def feed(self, chunk):
+        """喂入一块响应内容"""
+        self.size += len(chunk)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise ResponseTooLarge(f'响应超过大小上限({self.max_bytes}字节)')
+
+        if not self.streaming:
+            self.chunks.append(chunk)
+            return
+
+        try:
+            self.parser.send(chunk)
+        except ijson.JSONError as e:
+            raise json.JSONDecodeError(str(e), '', 0)
+        self._process_events()
+
+    def close(self):
+        """结束解析，返回 {路径: 值}"""
+        if not self.streaming:
+            response = json.loads(b''.join(self.chunks))
+            self.chunks = []
+            for path in self.paths:
+                try:
+                    matches = jsonpath_cache.get(path).find(response)
+                except Exception:
+                    continue
+                if matches:
+                    self.values[path] = matches[0].value
+            return self.values
+
+        if not self.done:
+            try:
+                self.parser.close()
+            except ijson.JSONError as e:
+                raise json.JSONDecodeError(str(e), '', 0)
+            self._process_events()
+        return self.values
+
+    def _process_events(self):
+        """处理已解析出的事件，跟踪当前路径并构建目标路径上的值"""
+        stack = self.stack
+        for _, event, value in self.events:
+            if event == 'end_map' or event == 'end_array':
+                if self.builders:
+                    self._feed_builders(event, value, -1)
+                stack.pop()
+                continue
+
+            if event == 'map_key':
+                if self.builders:
+                    self._feed_builders(event, value, 0)
+                stack[-1][1] = value
+                continue
+
+            # 一个值的开始: 标量或容器
+            if stack and stack[-1][0] == 'array':
+                stack[-1][1] += 1
+            starts = event == 'start_map' or event == 'start_array'
+            if self.builders:
+                self._feed_builders(event, value, 1 if starts else 0)
+
+            keys = tuple(frame[1] for frame in stack) if len(stack) in self.depths else None
+            if keys in self.targets and keys not in self.found:
+                if starts:
+                    builder = ObjectBuilder()
+                    builder.event(event, value)
+                    self.builders.append([keys, builder, 1])
+                else:
+                    self._found(keys, value)
+
+            if event == 'start_map':
+                stack.append(['map', None])
+            elif event == 'start_array':
+                stack.append(['array', -1])
+
+        del self.events[:]
+
+    def _feed_builders(self, event, value, depth_change):
+        """把事件交给正在构建的值，容器结束时记录结果"""
+        for entry in list(self.builders):
+            keys, builder, depth = entry
+            builder.event(event, value)
+            entry[2] = depth + depth_change
+            if entry[2] == 0:
+                self.builders.remove(entry)
+                self._found(keys, builder.value)
+
+    def _found(self, keys, value):
+        """记录目标路径上的值"""
+        self.found.add(keys)
+        for path in self.targets[keys]:
+            self.values[path] = value
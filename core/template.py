@@ -0,0 +1,267 @@
+# 模板模块，将步骤中的占位符和参数提取路径预先编译，执行时直接使用
+
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from jsonpath_ng import parse
+
+from core import config
+
+# 标准格式 ${param} 与假设性格式 $param
+PLACEHOLDER_PATTERN = re.compile(r'\$\{([^}]+)\}|\$(\w+)')
+
+
+class Template:
+    """
+    编译后的字符串模板
+
+    解析时把文本切分为字面量和占位符片段，渲染时按顺序拼接，
+    开销与模板长度成正比，与上下文参数数量无关。
+    占位符在上下文中不存在时保留原文。
+    """
+
+    __slots__ = ('text', 'parts', 'names')
+
+    def __init__(self, text, authorization=False):
+        self.text = text
+        self.parts = []  # 字面量为 str，占位符为 (参数名, 原文)
+        self.names = set()
+
+        last = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            name = match.group(1) or match.group(2)
+            if match.group(2) and not self._bare_allowed(text, name, authorization):
+                continue
+
+            if match.start() > last:
+                self.parts.append(text[last:match.start()])
+            self.parts.append((name, match.group(0)))
+            self.names.add(name)
+            last = match.end()
+
+        if last < len(text):
+            self.parts.append(text[last:])
+
+    @staticmethod
+    def _bare_allowed(text, name, authorization):
+        """
+        判断假设性格式 $param 是否需要替换
+
+        与标准格式同名时不替换；Authorization 请求头中的 $token 总是替换；
+        其他情况只在 JSON 值的位置替换，如 "$name" 或 :$name，避免误替换普通文本。
+        """
+        if f'${{{name}}}' in text:
+            return False
+        if authorization and name == 'token':
+            return True
+        escaped = re.escape(name)
+        return bool(re.search(r'[\"\']\s*\$' + escaped + r'\s*[\"\']', text) or
+                    re.search(r':\s*\$' + escaped, text))
+
+    def render(self, context):
+        """使用上下文参数渲染模板"""
+        if not self.names:
+            return self.text
+
+        output = []
+        for part in self.parts:
+            if isinstance(part, str):
+                output.append(part)
+            else:
+                name, raw = part
+                output.append(str(context[name]) if name in context else raw)
+        return ''.join(output)
+
+    def missing(self, context):
+        """模板中引用但上下文里不存在的参数"""
+        return [name for name in self.names if name not in context]
+
+
+class DictTemplate:
+    """编译后的字典模板，如请求头和请求体"""
+
+    __slots__ = ('items', 'names')
+
+    def __init__(self, data):
+        self.items = [(key, compile_value(value, key)) for key, value in data.items()]
+        self.names = set()
+        for _, value in self.items:
+            self.names |= template_names(value)
+
+    def render(self, context):
+        return {key: render_value(value, context) for key, value in self.items}
+
+
+class ListTemplate:
+    """编译后的列表模板"""
+
+    __slots__ = ('items', 'names')
+
+    def __init__(self, data):
+        self.items = [compile_value(item) for item in data]
+        self.names = set()
+        for item in self.items:
+            self.names |= template_names(item)
+
+    def render(self, context):
+        return [render_value(item, context) for item in self.items]
+
+
+TEMPLATE_TYPES = (Template, DictTemplate, ListTemplate)
+
+
+def compile_value(value, key=None):
+    """递归编译字符串、字典和列表，其他类型原样保留"""
+    if isinstance(value, dict):
+        return DictTemplate(value)
+    if isinstance(value, list):
+        return ListTemplate(value)
+    if isinstance(value, str):
+        return compile_template(value, key == 'Authorization')
+    return value
+
+
+@lru_cache(maxsize=4096)
+def compile_template(text, authorization=False):
+    """编译字符串模板，相同文本只解析一次"""
+    return Template(text, authorization)
+
+
+def render_value(compiled, context):
+    """渲染编译后的值"""
+    if isinstance(compiled, TEMPLATE_TYPES):
+        return compiled.render(context)
+    return compiled
+
+
+def template_names(compiled):
+    """编译后的值中引用的所有参数名"""
+    if isinstance(compiled, TEMPLATE_TYPES):
+        return compiled.names
+    return set()
+
+
+def normalize_path(path):
+    """规范化JSON路径，如 $data.token 转换为 $.data.token"""
+    if path.startswith('$') and not path.startswith('$.'):
+        return '$.' + path[1:]
+    return path
+
+
+class JsonPathCache:
+    """
+    有界的JSON路径编译缓存
+
+    jsonpath_ng 每次 parse 都要构建解析器，开销较大；提取路径属于静态配置，
+    按规范化后的路径缓存编译结果，超过容量时淘汰最久未使用的路径。
+    同一路径可能被多个任务共用，任务更新或删除时不主动移除，由容量上限淘汰；
+    编译好的步骤自己持有表达式，路径被淘汰后仍然可用。
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.expressions = OrderedDict()
+
+    def get(self, path):
+        """获取路径的编译结果，路径无效时抛出解析异常(无效路径同样缓存，避免反复解析)"""
+        path = normalize_path(path)
+        with self.lock:
+            expr = self.expressions.get(path)
+            if expr is not None:
+                self.expressions.move_to_end(path)
+
+        if expr is None:
+            try:
+                expr = parse(path)
+            except Exception as e:
+                expr = e
+            with self.lock:
+                self.expressions[path] = expr
+                while len(self.expressions) > self.maxsize:
+                    self.expressions.popitem(last=False)
+
+        if isinstance(expr, Exception):
+            raise expr
+        return expr
+
+    def clear(self):
+        """清空缓存"""
+        with self.lock:
+            self.expressions.clear()
+
+
+jsonpath_cache = JsonPathCache(config.JSONPATH_CACHE_SIZE)
+
+
+class CompiledStep:
+    """
+    编译后的API步骤
+
+    保存 url、请求头、请求体的编译模板以及参数提取路径的编译结果，
+    同时可以像原始步骤字典一样通过 get / [] / in 访问步骤配置。
+    """
+
+    def __init__(self, step, debug=False):
+        self.step = step
+        self.debug = debug  # 任务是否开启调试诊断
+        self.method = step.get('method', 'GET').upper()
+        self.url = compile_template(step.get('url', '') or '')
+        self.headers = compile_value(step.get('headers', {}))
+        self.body = compile_value(step.get('body', {}))
+        self.names = self.url.names | template_names(self.headers) | template_names(self.body)
+
+        # 参数提取路径，无效路径留空，执行时再报告错误
+        self.extract_exprs = {}
+        for param in step.get('extract_params') or []:
+            path = param.get('path')
+            if path and path not in self.extract_exprs:
+                try:
+                    self.extract_exprs[path] = jsonpath_cache.get(path)
+                except Exception:
+                    pass
+
+    def get(self, key, default=None):
+        return self.step.get(key, default)
+
+    def __getitem__(self, key):
+        return self.step[key]
+
+    def __contains__(self, key):
+        return key in self.step
+
+
+def compile_steps(steps, debug=False):
+    """编译步骤列表，已编译的步骤原样返回"""
+    return [step if isinstance(step, CompiledStep) else CompiledStep(step, debug) for step in steps]
+
+
+def step_dependencies(steps):
+    """
+    分析调用链中步骤之间的参数依赖
+
+    步骤 j 的 url、请求头或请求体引用了参数 name 时，依赖它之前所有在
+    extract_params 中提取 name 的步骤；引用的参数没有任何前序步骤提取时
+    不产生依赖(与顺序执行一样保留占位符原文)。依赖具有传递性，返回每个
+    步骤直接或间接依赖的步骤序号(升序元组)，没有依赖关系的步骤可以并行执行。
+
+    参数:
+        steps: compile_steps 的结果
+    """
+    producers = {}  # {参数名: [提取该参数的步骤序号, ...]}
+    dependencies = []
+    for j, step in enumerate(steps):
+        direct = set()
+        for name in step.names:
+            direct.update(producers.get(name, ()))
+        closure = set(direct)
+        for i in direct:
+            closure.update(dependencies[i])
+        dependencies.append(tuple(sorted(closure)))
+
+        for param in step.get('extract_params') or []:
+            if param.get('name') and param.get('path'):
+                producers.setdefault(param['name'], []).append(j)
+    return dependencies
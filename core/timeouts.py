@@ -0,0 +1,103 @@
+# 超时模块，按全局配置、任务和步骤的 timeout 字段计算每次请求的超时，并控制调用链的截止时间
+
+import time
+
+from core import config
+
+REQUEST_TIMEOUTS = ('connect', 'read', 'total')
+
+
+def _seconds(value):
+    """超时配置转换为秒数，0 或空表示不限制"""
+    value = float(value or 0)
+    return value if value > 0 else 0
+
+
+def _options(value):
+    """timeout 字段转换为字典，数字表示连接和读取超时相同，与旧版的单一超时一致"""
+    if isinstance(value, dict):
+        return value
+    if value in (None, ''):
+        return {}
+    return {'connect': value, 'read': value}
+
+
+class ChainTimeouts:
+    """
+    一次调用链执行的超时设置
+
+    connect: 建立连接(含域名解析和TLS握手)的超时
+    read: 等待响应数据的超时，即两次收到数据之间的最长间隔
+    total: 单次请求从发出到读完响应的总时间，0 表示不限制
+    chain: 整个调用链(含重试和限流等待)的截止时间，0 表示不限制；超过后不再开始剩余的步骤，
+        执行中的请求的总超时被截短到截止时间
+
+    请求超时的优先级: 步骤的 timeout 字段 > 任务的 timeout 字段 > 全局配置，如
+    {"connect": 3, "read": 10, "total": 15}，任务的 timeout 字段还可以设置 chain。
+    """
+
+    def __init__(self, options=None):
+        options = _options(options)
+        self.defaults = {
+            'connect': _seconds(options.get('connect', config.REQUEST_CONNECT_TIMEOUT)),
+            'read': _seconds(options.get('read', config.REQUEST_READ_TIMEOUT)),
+            'total': _seconds(options.get('total', config.REQUEST_TOTAL_TIMEOUT))
+        }
+        self.chain = _seconds(options.get('chain', config.CHAIN_TIMEOUT))
+        # 执行开始时计时，调用链以生成器执行时在首次 next() 时创建
+        self.deadline = time.monotonic() + self.chain if self.chain else None
+
+    def remaining(self):
+        """距调用链截止时间的秒数，没有截止时间时返回 None"""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0)
+
+    def expired(self):
+        """调用链是否已超过截止时间"""
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def allows(self, delay):
+        """等待 delay 秒后是否仍在截止时间之前，用于判断是否值得重试"""
+        return self.deadline is None or time.monotonic() + delay < self.deadline
+
+    def cap(self, delay):
+        """等待时间不超过调用链剩余时间"""
+        remaining = self.remaining()
+        return delay if remaining is None else min(delay, remaining)
+
+    def for_step(self, step):
+        """
+        步骤本次请求的实际超时 {'connect': 秒, 'read': 秒, 'total': 秒}，0 表示不限制
+
+        总超时不超过调用链的剩余时间，请求开始前计算，记录在步骤结果中。
+        """
+        options = _options(step.get('timeout'))
+        timeouts = {name: _seconds(options.get(name, self.defaults[name])) for name in REQUEST_TIMEOUTS}
+        remaining = self.remaining()
+        if remaining is not None and (not timeouts['total'] or remaining < timeouts['total']):
+            timeouts['total'] = max(round(remaining, 3), 0.001)
+        return timeouts
+
+    def cancelled(self, count):
+        """调用链超时、剩余 count 个步骤取消时的错误信息"""
+        return f"调用链执行超过 {self.chain:g} 秒，剩余 {count} 个步骤已取消"
+
+
+def request_timeout(timeouts):
+    """requests 的 (连接超时, 读取超时)，均不超过总超时"""
+    total = timeouts['total']
+    connect, read = timeouts['connect'], timeouts['read']
+    if total:
+        connect = min(connect, total) if connect else total
+        read = min(read, total) if read else total
+    return connect or None, read or None
+
+
+
+def timeout_error(phase, timeouts, started):
+    """请求超时的错误信息，连接或读取超时被截短到总超时时按总时间超时说明"""
+    total = timeouts['total']
+    if total and time.monotonic() - started >= total:
+        return f"请求超时(总时间超过 {total:g} 秒)"
+    return f"请求超时({phase})"
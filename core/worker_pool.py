@@ -0,0 +1,247 @@
+# 多进程执行模块，调用链在独立的工作进程中执行，不与Web请求和调度线程争用GIL
+
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from multiprocessing import connection
+
+from core.api_client import ApiClient
+from core.diagnostics import get_logger
+from core.http_pool import SessionPool
+from core.retry import RetryTimer
+
+log = get_logger('worker_pool')
+
+# 工作进程内的全局状态，由 _init_worker 在进程启动时创建
+_client = None
+_compiled = OrderedDict()  # {(步骤配置JSON, 调试开关): 编译结果}，按最近使用顺序淘汰
+_compiled_max = 256
+
+
+def _init_worker(pool_options, client_options):
+    """工作进程启动时创建自己的连接池和API客户端，Ctrl+C 由主进程统一处理"""
+    global _client
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _client = ApiClient(SessionPool(**pool_options), **client_options)
+
+
+def _compile(steps, debug):
+    """编译步骤并按配置内容缓存，同一任务多次执行只编译一次"""
+    key = (json.dumps(steps, sort_keys=True, ensure_ascii=False), debug)
+    compiled = _compiled.get(key)
+    if compiled is not None:
+        _compiled.move_to_end(key)
+        return compiled
+
+    compiled = _client.compile_steps(steps, debug)
+    _compiled[key] = compiled
+    if len(_compiled) > _compiled_max:
+        _compiled.popitem(last=False)
+    return compiled
+
+
+def _worker_main(conn, pool_options, client_options):
+    """
+    工作进程主循环：收到 (调用链ID, 参数) 时开始执行调用链，收到 (调用链ID, None) 时继续执行，
+    每次执行到调用链需要等待重试或结束为止，回复 (调用链ID, 'wait'/'done'/'error', 等待秒数/结果/异常)
+    """
+    _init_worker(pool_options, client_options)
+    chains = {}  # {调用链ID: run_chain 生成器}
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        chain_id, args = message
+        try:
+            if args is not None:
+                steps, debug, retry_times, parallelism, timeout = args
+                chains[chain_id] = _client.run_chain(_compile(steps, debug), retry_times, parallelism, timeout)
+            reply = (chain_id, 'wait', next(chains[chain_id]))
+        except StopIteration as stop:
+            reply = (chain_id, 'done', stop.value)
+        except Exception as e:
+            reply = (chain_id, 'error', e)
+        if reply[1] != 'wait':
+            chains.pop(chain_id, None)
+        try:
+            conn.send(reply)
+        except Exception as e:  # 结果或异常无法序列化
+            conn.send((chain_id, 'error', RuntimeError(f'执行结果无法回传主进程: {e}')))
+
+
+class _Worker:
+    """一个工作进程，以及交给它执行的调用链"""
+
+    def __init__(self, context, options):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, *options), name='chain-worker')
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.busy = False  # 已发出消息、尚未收到回复
+        self.chains = set()  # 在本进程中执行(含等待重试)的调用链ID
+        self.ready = deque()  # 重试等待到期、需要继续执行的调用链ID
+
+    def stop(self):
+        """通知工作进程退出并等待"""
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """
+    多进程调用链执行引擎
+
+    主进程只负责调度、并发控制和写日志，调用链(请求、JSON解析和参数提取)交给
+    工作进程执行，充分利用多核。任务以原始步骤配置投递，工作进程各自编译并缓存；
+    执行结果通过管道回传，与异步引擎一样以 concurrent.futures.Future 返回。
+
+    工作进程与线程执行引擎一样驱动 ApiClient.run_chain：调用链需要等待重试时把等待时间
+    交回主进程，由重试定时器到期后再交给同一个工作进程继续执行，等待期间工作进程执行其他
+    调用链，不被退避占用。
+
+    工作进程以 fork 方式在创建时全部启动，应在启动其他后台线程之前创建。
+    """
+
+    def __init__(self, processes=0, pool_options=None, client_options=None):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise RuntimeError('多进程执行引擎需要支持 fork 的平台(Linux/macOS)')
+        self.processes = processes or os.cpu_count() or 1
+        self.context = multiprocessing.get_context('fork')
+        self.options = (pool_options or {}, client_options or {})
+        self.workers = [_Worker(self.context, self.options) for _ in range(self.processes)]
+
+        self.lock = threading.Lock()
+        self.submitted = deque()  # 尚未交给工作进程的调用链 [(调用链ID, 参数)]
+        self.futures = {}  # {调用链ID: Future}
+        self.counter = itertools.count(1)
+        self.closed = False
+        self.woken = False  # 已唤醒分发线程、尚未处理
+        self.wake_reader, self.wake_writer = self.context.Pipe(duplex=False)
+        self.retry_timer = RetryTimer()
+        self.thread = threading.Thread(target=self._run, name='worker-pool', daemon=True)
+        self.thread.start()
+        log.info('工作进程已启动', extra={'fields': {'processes': self.processes}})
+
+    def submit_chain(self, steps, debug=False, retry_times=1, parallelism=1, timeout=None):
+        """
+        投递一次调用链，返回 concurrent.futures.Future
+
+        参数:
+            steps: 原始步骤配置(可序列化)，不能是编译结果
+            debug: 任务是否开启调试
+            retry_times: 失败重试次数
+            parallelism: 调用链内同时执行的步骤数上限
+            timeout: 任务的超时设置，调用链的截止时间从工作进程开始执行时计算
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError('多进程执行引擎已关闭')
+            chain_id = next(self.counter)
+            self.futures[chain_id] = future
+            self.submitted.append((chain_id, (steps, debug, retry_times, parallelism, timeout)))
+        self._wake()
+        return future
+
+    def _wake(self):
+        """唤醒分发线程，未处理的唤醒只保留一个"""
+        with self.lock:
+            if self.woken:
+                return
+            self.woken = True
+        self.wake_writer.send(None)
+
+    def _resume(self, worker, chain_id):
+        """重试等待到期，调用链排队等待所在的工作进程继续执行"""
+        with self.lock:
+            worker.ready.append(chain_id)
+        self._wake()
+
+    def _run(self):
+        """分发线程：把新的调用链和重试到期的调用链交给空闲的工作进程，接收执行结果"""
+        while True:
+            with self.lock:
+                self._assign()
+                if self.closed and not self.futures:
+                    break
+            conns = [worker.conn for worker in self.workers]
+            for conn in connection.wait(conns + [self.wake_reader]):
+                if conn is self.wake_reader:
+                    self.wake_reader.recv()
+                    with self.lock:
+                        self.woken = False
+                else:
+                    self._receive(self.workers[conns.index(conn)])
+        for worker in self.workers:
+            worker.stop()
+
+    def _assign(self):
+        """空闲的工作进程优先继续执行重试到期的调用链，其次开始新的调用链，调用方需持有锁"""
+        for worker in self.workers:
+            if worker.busy:
+                continue
+            if worker.ready:
+                worker.conn.send((worker.ready.popleft(), None))
+            elif self.submitted:
+                chain_id, args = self.submitted.popleft()
+                worker.chains.add(chain_id)
+                worker.conn.send((chain_id, args))
+            else:
+                continue
+            worker.busy = True
+
+    def _receive(self, worker):
+        """处理工作进程的回复，需要等待重试的调用链交给重试定时器"""
+        try:
+            chain_id, kind, value = worker.conn.recv()
+        except EOFError:
+            self._replace(worker)
+            return
+        worker.busy = False
+        if kind == 'wait':
+            self.retry_timer.call_later(value, lambda: self._resume(worker, chain_id))
+            return
+        worker.chains.discard(chain_id)
+        with self.lock:
+            future = self.futures.pop(chain_id)
+        if kind == 'done':
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+    def _replace(self, worker):
+        """工作进程异常退出，其中的调用链全部失败，启动新的工作进程代替"""
+        worker.process.join()
+        log.error('工作进程异常退出', extra={'fields': {
+            'pid': worker.process.pid, 'exitcode': worker.process.exitcode, 'chains': len(worker.chains)
+        }})
+        worker.conn.close()
+        with self.lock:
+            futures = [self.futures.pop(chain_id) for chain_id in worker.chains]
+            self.workers[self.workers.index(worker)] = _Worker(self.context, self.options)
+        for future in futures:
+            future.set_exception(RuntimeError('工作进程异常退出'))
+
+    def close(self):
+        """停止接收新的调用链，等待重试的调用链立即重试，等已投递的执行完毕后退出工作进程"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.retry_timer.close()
+        self._wake()
+        self.thread.join()
@@ -5,11 +5,13 @@ document.addEventListener('DOMContentLoaded', function() {
     // 初始化页面
     loadTasks();
     loadLogs();
+    loadLogNodes(document.getElementById('node-filter'));
 
     // 绑定事件
     document.getElementById('refresh-btn').addEventListener('click', loadLogs);
     document.getElementById('task-filter').addEventListener('change', loadLogs);
     document.getElementById('status-filter').addEventListener('change', loadLogs);
+    document.getElementById('node-filter').addEventListener('change', loadLogs);
     document.getElementById('prev-page').addEventListener('click', goToPrevPage);
     document.getElementById('next-page').addEventListener('click', goToNextPage);
 
@@ -19,6 +21,14 @@ document.addEventListener('DOMContentLoaded', function() {
         clearLogsBtn.addEventListener('click', clearAllLogs);
     }
 
+    // 订阅推送，新日志直接加入列表，无需整页刷新
+    subscribeEvents({
+        log: onLogEvent,
+        task: loadTasks,
+        logs_cleared: loadLogs,
+        reset: loadLogs
+    });
+
     // 初始化模态框
     const modal = document.getElementById('log-detail-modal');
     modal.querySelector('.close').addEventListener('click', function() {
@@ -33,9 +43,18 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
-// 当前页码
+// 当前页码，翻页时以当前页首尾的日志ID为游标，只读取一页
 let currentPage = 1;
 const pageSize = 20;
+let firstLogId = null;
+let lastLogId = null;
+let hasOlder = false;
+
+// 列表只需要摘要字段，日志详情在点击时再加载
+const listFields = 'id,task_id,task_name,status,message,timestamp';
+
+// 当前筛选条件下的日志总数，收到推送的新日志时累加
+let totalCount = 0;
 
 // 加载任务列表（用于筛选）
 function loadTasks() {
@@ -43,6 +62,7 @@ function loadTasks() {
         .then(response => response.json())
         .then(tasks => {
             const taskFilter = document.getElementById('task-filter');
+            const selected = taskFilter.value;
 
             // 保留"所有任务"选项
             taskFilter.innerHTML = '<option value="">所有任务</option>';
@@ -54,6 +74,9 @@ function loadTasks() {
                 option.textContent = task.name;
                 taskFilter.appendChild(option);
             });
+
+            // 任务变更后重新加载时保持当前筛选
+            taskFilter.value = selected;
         })
         .catch(error => {
             console.error('Error loading tasks:', error);
@@ -61,25 +84,43 @@ function loadTasks() {
         });
 }
 
-// 加载日志列表
+// 选中的节点，空字符串为本节点
+function selectedNode() {
+    return document.getElementById('node-filter').value;
+}
+
+// 加载最新一页日志，同时统计总数
 function loadLogs() {
+    currentPage = 1;
+    fetchLogPage({before_id: ''}, true);
+}
+
+// 按游标加载一页日志，cursor 为 {before_id} 或 {after_id}
+function fetchLogPage(cursor, withCount) {
     const taskId = document.getElementById('task-filter').value;
     const status = document.getElementById('status-filter').value;
 
     // 构建查询参数
     const params = new URLSearchParams({
-        page: currentPage,
-        limit: pageSize
+        ...cursor,
+        limit: pageSize,
+        fields: listFields
     });
 
+    if (withCount) params.append('count', 1);
     if (taskId) params.append('task_id', taskId);
     if (status) params.append('status', status);
+    if (selectedNode()) params.append('node', selectedNode());
 
     fetch(`/api/logs?${params}`)
         .then(response => response.json())
         .then(data => {
             displayLogs(data.logs);
-            updatePagination(data.page, data.total_pages, data.total_count);
+            updatePageCursor();
+            // 向更新方向翻页时，离开的那一页就是更早的日志
+            hasOlder = 'before_id' in cursor ? data.has_more : true;
+            if (data.total_count !== undefined) totalCount = data.total_count;
+            updatePagination();
         })
         .catch(error => {
             console.error('Error loading logs:', error);
@@ -99,30 +140,82 @@ function displayLogs(logs) {
     logsContainer.innerHTML = '';
 
     logs.forEach(log => {
-        const logItem = document.createElement('div');
-        logItem.className = 'log-item';
-        logItem.addEventListener('click', () => showLogDetail(log.id));
-
-        // 状态样式
-        const statusClass = {
-            'success': 'status-success',
-            'failure': 'status-failure',
-            'running': 'status-running'
-        }[log.status] || '';
-
-        logItem.innerHTML = `
-            <div class="log-header">
-                <div class="log-timestamp">${formatDateTime(log.timestamp)}</div>
-                <div class="log-status ${statusClass}">${getStatusText(log.status)}</div>
-            </div>
-            <div class="log-message">${log.message}</div>
-            <div class="log-task">任务: ${log.task_name} (ID: ${log.task_id})</div>
-        `;
-
-        logsContainer.appendChild(logItem);
+        logsContainer.appendChild(createLogItem(log));
     });
 }
 
+// 创建日志列表项
+function createLogItem(log) {
+    const logItem = document.createElement('div');
+    logItem.className = 'log-item';
+    logItem.dataset.logId = log.id;
+    logItem.addEventListener('click', () => showLogDetail(log.id));
+
+    // 状态样式
+    const statusClass = {
+        'success': 'status-success',
+        'failure': 'status-failure',
+        'running': 'status-running'
+    }[log.status] || '';
+
+    logItem.innerHTML = `
+        <div class="log-header">
+            <div class="log-timestamp">${formatDateTime(log.timestamp)}</div>
+            <div class="log-status ${statusClass}">${getStatusText(log.status)}</div>
+        </div>
+        <div class="log-message">${log.message}</div>
+        <div class="log-task">任务: ${log.task_name} (ID: ${log.task_id})</div>
+    `;
+    return logItem;
+}
+
+// 收到推送的新日志：符合筛选条件时计入总数，位于第一页时插入列表顶部
+function onLogEvent(log) {
+    // 只推送本节点的日志，查看其他节点时忽略
+    if (selectedNode()) {
+        return;
+    }
+
+    const taskId = document.getElementById('task-filter').value;
+    const status = document.getElementById('status-filter').value;
+    if ((taskId && String(log.task_id) !== taskId) || (status && log.status !== status)) {
+        return;
+    }
+
+    // 首次加载与推送之间的日志可能已经在列表中
+    const logsContainer = document.getElementById('logs-container');
+    if (logsContainer.querySelector(`[data-log-id="${log.id}"]`)) {
+        return;
+    }
+
+    totalCount++;
+    if (currentPage !== 1) {
+        updatePagination();
+        return;
+    }
+
+    if (!logsContainer.querySelector('.log-item')) {
+        logsContainer.innerHTML = '';
+    }
+    logsContainer.insertBefore(createLogItem(log), logsContainer.firstChild);
+
+    // 保持每页条数，挤出的日志留到下一页
+    const items = logsContainer.querySelectorAll('.log-item');
+    for (let i = pageSize; i < items.length; i++) {
+        items[i].remove();
+        hasOlder = true;
+    }
+    updatePageCursor();
+    updatePagination();
+}
+
+// 记录当前页首尾的日志ID
+function updatePageCursor() {
+    const items = document.querySelectorAll('#logs-container .log-item');
+    firstLogId = items.length ? Number(items[0].dataset.logId) : null;
+    lastLogId = items.length ? Number(items[items.length - 1].dataset.logId) : null;
+}
+
 // 获取状态文本
 function getStatusText(status) {
     return {
@@ -133,31 +226,40 @@ function getStatusText(status) {
 }
 
 // 更新分页信息
-function updatePagination(page, totalPages, totalCount) {
-    currentPage = page;
+function updatePagination() {
+    const totalPages = Math.max(Math.ceil(totalCount / pageSize), 1);
 
-    document.getElementById('page-info').textContent = `第 ${page} 页 (共 ${totalPages} 页, ${totalCount} 条记录)`;
+    document.getElementById('page-info').textContent = `第 ${currentPage} 页 (共 ${totalPages} 页, ${totalCount} 条记录)`;
 
-    document.getElementById('prev-page').disabled = page <= 1;
-    document.getElementById('next-page').disabled = page >= totalPages;
+    document.getElementById('prev-page').disabled = currentPage <= 1;
+    document.getElementById('next-page').disabled = !hasOlder || lastLogId === null;
 }
 
-// 上一页
+// 上一页(更新的日志)
 function goToPrevPage() {
-    if (currentPage > 1) {
-        currentPage--;
+    if (currentPage <= 2 || firstLogId === null) {
         loadLogs();
+        return;
     }
+    currentPage--;
+    fetchLogPage({after_id: firstLogId}, false);
 }
 
-// 下一页
+// 下一页(更早的日志)
 function goToNextPage() {
+    if (!hasOlder || lastLogId === null) {
+        return;
+    }
     currentPage++;
-    loadLogs();
+    fetchLogPage({before_id: lastLogId}, false);
 }
 
 // 清除所有日志
 function clearAllLogs() {
+    if (selectedNode()) {
+        showNotification('只能清除本节点的日志', 'error');
+        return;
+    }
     if (confirm('确定要清除所有日志吗？此操作不可恢复。')) {
         fetch('/api/logs', {
             method: 'DELETE'
@@ -173,7 +275,6 @@ function clearAllLogs() {
         .then(data => {
             showNotification('所有日志已清除', 'success');
             // 重新加载日志列表
-            currentPage = 1;
             loadLogs();
         })
         .catch(error => {
@@ -185,7 +286,8 @@ function clearAllLogs() {
 
 // 显示日志详情
 function showLogDetail(logId) {
-    fetch(`/api/logs/${logId}`)
+    const query = selectedNode() ? `?node=${encodeURIComponent(selectedNode())}` : '';
+    fetch(`/api/logs/${logId}${query}`)
         .then(response => {
             if (!response.ok) {
                 return response.json().then(data => {
@@ -307,6 +409,16 @@ function showLogDetail(logId) {
                         `;
                     }
 
+                    // 各阶段耗时
+                    if (details.timings && Object.keys(details.timings).length > 0) {
+                        html += `
+                            <div class="detail-item">
+                                <span class="detail-label">耗时(秒):</span>
+                                <div class="detail-value">${JSON.stringify(details.timings, null, 2)}</div>
+                            </div>
+                        `;
+                    }
+
                     // 提取的参数
                     if (details.extracted_params !== undefined && details.extracted_params !== null && Object.keys(details.extracted_params).length > 0) {
                         html += `
@@ -114,3 +114,43 @@ function confirmAction(message, callback) {
         callback();
     }
 }
+
+// 订阅服务端推送的新日志和任务变更，handlers 按事件类型(log/task/logs_cleared/reset)处理
+// 断线后浏览器自动重连并带上最后收到的事件ID，服务端从该位置继续推送；
+// 无法接续时推送 reset 事件，页面需重新全量加载
+function subscribeEvents(handlers) {
+    if (!window.EventSource) {
+        return null;
+    }
+
+    const source = new EventSource('/api/events');
+    Object.keys(handlers).forEach(type => {
+        source.addEventListener(type, event => handlers[type](JSON.parse(event.data)));
+    });
+    return source;
+}
+
+// 集群模式下填充节点选择框并显示其所在的筛选项，各节点的日志分别保存，按节点查看；
+// 非集群模式保持隐藏。返回本节点标识(非集群模式为 null)
+function loadLogNodes(select) {
+    return fetch('/api/cluster')
+        .then(response => response.json())
+        .then(data => {
+            if (!data.enabled) {
+                return null;
+            }
+            select.innerHTML = '';
+            data.log_nodes.forEach(node => {
+                const option = document.createElement('option');
+                option.value = node === data.node_id ? '' : node;
+                option.textContent = node === data.node_id ? `${node} (本节点)` : node;
+                select.appendChild(option);
+            });
+            select.closest('.node-filter').style.display = '';
+            return data.node_id;
+        })
+        .catch(error => {
+            console.error('Error loading cluster nodes:', error);
+            return null;
+        });
+}
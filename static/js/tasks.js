@@ -2,8 +2,12 @@
 // 任务管理页面JavaScript
 
 document.addEventListener('DOMContentLoaded', function() {
-    // 初始化任务列表
+    // 初始化任务列表，之后通过推送只更新变化的任务
     loadTasks();
+    subscribeEvents({
+        task: onTaskEvent,
+        reset: loadTasks
+    });
 
     // 绑定事件
     document.getElementById('add-task-btn').addEventListener('click', showAddTaskModal);
@@ -38,59 +42,12 @@ function loadTasks() {
             tbody.innerHTML = '';
 
             if (tasks.length === 0) {
-                tbody.innerHTML = '<tr><td colspan="7" style="text-align: center;">暂无任务</td></tr>';
+                showEmptyTasks();
                 return;
             }
 
             tasks.forEach(task => {
-                const row = document.createElement('tr');
-
-                // 状态样式
-                let statusClass = '';
-                let statusText = '';
-
-                switch(task.status) {
-                    case 'active':
-                        statusClass = 'status-active';
-                        statusText = '运行中';
-                        break;
-                    case 'paused':
-                        statusClass = 'status-paused';
-                        statusText = '已暂停';
-                        break;
-                    case 'deleted':
-                        statusClass = 'status-deleted';
-                        statusText = '已删除';
-                        break;
-                }
-
-                // 调度规则显示
-                let scheduleText = '';
-                if (task.type === 'cron') {
-                    scheduleText = task.cron_expression;
-                } else {
-                    scheduleText = `每 ${task.interval_seconds} 秒`;
-                }
-
-                row.innerHTML = `
-                    <td>${task.id}</td>
-                    <td>${task.name}</td>
-                    <td>${task.type === 'cron' ? '定时任务' : '循环任务'}</td>
-                    <td>${scheduleText}</td>
-                    <td><span class="status-badge ${statusClass}">${statusText}</span></td>
-                    <td>${formatDateTime(task.created_at)}</td>
-                    <td class="task-actions">
-                        ${task.status === 'active' ? 
-                            `<button class="btn btn-secondary btn-sm" onclick="pauseTask(${task.id})">暂停</button>` :
-                            `<button class="btn btn-secondary btn-sm" onclick="resumeTask(${task.id})">恢复</button>`
-                        }
-                        <button class="btn btn-secondary btn-sm" onclick="runTaskNow(${task.id})">立即执行</button>
-                        <button class="btn btn-primary btn-sm" onclick="editTask(${task.id})">编辑</button>
-                        <button class="btn btn-danger btn-sm" onclick="deleteTask(${task.id})">删除</button>
-                    </td>
-                `;
-
-                tbody.appendChild(row);
+                tbody.appendChild(createTaskRow(task));
             });
         })
         .catch(error => {
@@ -99,6 +56,88 @@ function loadTasks() {
         });
 }
 
+// 没有任务时显示提示
+function showEmptyTasks() {
+    document.getElementById('tasks-tbody').innerHTML = '<tr><td colspan="7" style="text-align: center;">暂无任务</td></tr>';
+}
+
+// 创建任务行
+function createTaskRow(task) {
+    const row = document.createElement('tr');
+    row.dataset.taskId = task.id;
+
+    // 状态样式
+    let statusClass = '';
+    let statusText = '';
+
+    switch(task.status) {
+        case 'active':
+            statusClass = 'status-active';
+            statusText = '运行中';
+            break;
+        case 'paused':
+            statusClass = 'status-paused';
+            statusText = '已暂停';
+            break;
+        case 'deleted':
+            statusClass = 'status-deleted';
+            statusText = '已删除';
+            break;
+    }
+
+    // 调度规则显示
+    let scheduleText = '';
+    if (task.type === 'cron') {
+        scheduleText = task.cron_expression;
+    } else {
+        scheduleText = `每 ${task.interval_seconds} 秒`;
+    }
+
+    row.innerHTML = `
+        <td>${task.id}</td>
+        <td>${task.name}</td>
+        <td>${task.type === 'cron' ? '定时任务' : '循环任务'}</td>
+        <td>${scheduleText}</td>
+        <td><span class="status-badge ${statusClass}">${statusText}</span></td>
+        <td>${formatDateTime(task.created_at)}</td>
+        <td class="task-actions">
+            ${task.status === 'active' ? 
+                `<button class="btn btn-secondary btn-sm" onclick="pauseTask(${task.id})">暂停</button>` :
+                `<button class="btn btn-secondary btn-sm" onclick="resumeTask(${task.id})">恢复</button>`
+            }
+            <button class="btn btn-secondary btn-sm" onclick="runTaskNow(${task.id})">立即执行</button>
+            <button class="btn btn-primary btn-sm" onclick="editTask(${task.id})">编辑</button>
+            <button class="btn btn-danger btn-sm" onclick="deleteTask(${task.id})">删除</button>
+        </td>
+    `;
+    return row;
+}
+
+// 收到推送的任务变更，只更新对应的行
+function onTaskEvent(change) {
+    const tbody = document.getElementById('tasks-tbody');
+    const row = tbody.querySelector(`tr[data-task-id="${change.task_id}"]`);
+
+    if (!change.task) {
+        if (row) row.remove();
+        if (!tbody.querySelector('tr[data-task-id]')) showEmptyTasks();
+        return;
+    }
+
+    const newRow = createTaskRow(change.task);
+    if (row) {
+        tbody.replaceChild(newRow, row);
+        return;
+    }
+    if (!tbody.querySelector('tr[data-task-id]')) {
+        tbody.innerHTML = '';
+    }
+    // 按任务ID顺序插入
+    const next = Array.from(tbody.querySelectorAll('tr[data-task-id]'))
+        .find(item => Number(item.dataset.taskId) > change.task_id);
+    tbody.insertBefore(newRow, next || null);
+}
+
 // 显示添加任务模态框
 function showAddTaskModal() {
     document.getElementById('modal-title').textContent = '创建新任务';
@@ -136,6 +175,14 @@ function editTask(taskId) {
             }
 
             document.getElementById('retry-times').value = task.retry_times;
+            document.getElementById('max-instances').value = task.max_instances || 1;
+            document.getElementById('parallelism').value = task.parallelism || 1;
+            TIMEOUT_FIELDS.forEach(field => {
+                const value = (task.timeout || {})[field];
+                document.getElementById(`timeout-${field}`).value = value === undefined ? '' : value;
+            });
+            document.getElementById('overlap-policy').value = task.overlap_policy || 'skip';
+            document.getElementById('task-debug').checked = !!task.debug;
 
             // 切换任务类型显示
             toggleTaskType();
@@ -152,6 +199,7 @@ function editTask(taskId) {
                     stepElement.querySelector('.step-name').value = step.name || '';
                     stepElement.querySelector('.step-method').value = step.method || 'GET';
                     stepElement.querySelector('.step-url').value = step.url || '';
+                    stepElement.querySelector('.step-stream').checked = !!step.stream;
 
                     // 确保请求头和请求体中的引用值被正确保留
                     // 特别注意处理像 "Authorization": "Bearer ${token}" 这样的引用
@@ -356,6 +404,20 @@ function updateCurlPreview(stepElement) {
 }
 
 // 收集步骤数据
+// 任务超时设置，留空的字段使用全局配置
+const TIMEOUT_FIELDS = ['connect', 'read', 'total', 'chain'];
+
+function collectTimeoutData() {
+    const timeout = {};
+    TIMEOUT_FIELDS.forEach(field => {
+        const value = document.getElementById(`timeout-${field}`).value;
+        if (value !== '') {
+            timeout[field] = parseFloat(value);
+        }
+    });
+    return timeout;
+}
+
 function collectStepsData() {
     const steps = [];
     const stepElements = document.querySelectorAll('#steps-container .step-config');
@@ -371,6 +433,10 @@ function collectStepsData() {
             extract_params: []
         };
 
+        if (stepElement.querySelector('.step-stream').checked) {
+            step.stream = true;
+        }
+
         console.log(`步骤 ${index + 1} 基本数据:`, {
             name: step.name,
             method: step.method,
@@ -435,6 +501,11 @@ function saveTask(e) {
         name: document.getElementById('task-name').value,
         type: taskType,
         retry_times: parseInt(document.getElementById('retry-times').value),
+        max_instances: parseInt(document.getElementById('max-instances').value) || 1,
+        parallelism: parseInt(document.getElementById('parallelism').value) || 1,
+        timeout: collectTimeoutData(),
+        overlap_policy: document.getElementById('overlap-policy').value,
+        debug: document.getElementById('task-debug').checked,
         steps: collectStepsData()
     };
 
@@ -0,0 +1,157 @@
+# 测试公共夹具
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.storage import Storage
+
+
+def make_log(i, size=10):
+    """构造一条步骤日志"""
+    return {
+        'task_id': i % 10 + 1,
+        'task_name': f'task-{i % 10 + 1}',
+        'event': 'step',
+        'status': 'success' if i % 7 else 'failure',
+        'message': f'步骤 {i} 执行成功',
+        'details': {'response': {'data': {'token': 'x' * size}}}
+    }
+
+
+def close_storage(storage):
+    """关闭存储打开的分段文件和索引连接"""
+    storage.log_store.close()
+    storage.log_index.close()
+
+
+def wait_for(condition, timeout=10):
+    """轮询直到 condition() 为真，超时则测试失败"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, '等待超时'
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def open_storage(tmp_path):
+    """在临时目录打开存储，可重复打开模拟重启，测试结束时全部关闭"""
+    opened = []
+
+    def factory(**options):
+        storage = Storage(str(tmp_path / 'data'), **options)
+        opened.append(storage)
+        return storage
+
+    yield factory
+    for storage in opened:
+        try:
+            close_storage(storage)
+        except Exception:
+            pass
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """导入 app 模块(整个测试过程只导入一次)，数据目录指向临时目录"""
+    from core import config
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(config, 'DATA_DIR', str(tmp_path_factory.mktemp('app') / 'data'))
+        import app
+    return app
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    """
+    测试用的下游接口，按路径返回不同的响应
+
+    /ok: 返回 200 和请求次数
+    /flaky/<键>/<次数>: 前 <次数> 次返回 503，之后返回 200
+    /error: 总是返回 503
+    /cached: 带 ETag 和 Cache-Control 的 200，条件请求匹配时返回 304，查询参数 max_age 设置有效期，
+        cache_control 替换整个 Cache-Control 头
+    /slow: 按查询参数 delay(秒)延迟后返回 200
+    /drip: 先返回响应头，再每隔 interval 秒发送一个字节，共 size 个字节
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload=None, headers=None):
+        data = json.dumps(payload if payload is not None else {}).encode('utf-8') if status != 304 else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):  # 客户端超时后断开
+            pass
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = {name: values[0] for name, values in parse_qs(parts.query).items()}
+        server = self.server
+        with server.lock:
+            server.hits[parts.path] += 1
+            count = server.hits[parts.path]
+
+        if parts.path.startswith('/flaky/'):
+            failures = int(parts.path.rsplit('/', 1)[1])
+            if count <= failures:
+                return self._reply(503, {'error': 'unavailable'})
+            return self._reply(200, {'count': count})
+        if parts.path == '/error':
+            return self._reply(503, {'error': 'unavailable'})
+        if parts.path == '/cached':
+            etag = '"v1"'
+            headers = {'ETag': etag, 'Cache-Control': query.get('cache_control', f"max-age={query.get('max_age', 60)}")}
+            if self.headers.get('If-None-Match') == etag:
+                return self._reply(304, headers=headers)
+            return self._reply(200, {'value': 'cached', 'count': count}, headers)
+        if parts.path == '/drip':
+            size = int(query.get('size', 10))
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+            try:
+                for _ in range(size):
+                    time.sleep(float(query.get('interval', 0.05)))
+                    self.wfile.write(b'x')
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):  # 客户端超时后断开
+                pass
+            return
+        if parts.path == '/slow':
+            time.sleep(float(query.get('delay', 0.1)))
+        return self._reply(200, {'count': count, 'query': query, 'token': f'token-{count}'})
+
+
+@pytest.fixture
+def api_server():
+    """在本地随机端口启动测试接口，返回服务对象，server.url 为根地址，server.hits 为各路径的请求次数"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeApiHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.hits = Counter()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
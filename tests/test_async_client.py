@@ -0,0 +1,108 @@
+# 异步执行引擎测试：重试、重试预算、熔断、限流和响应缓存与同步执行引擎一致
+
+import pytest
+
+pytest.importorskip('httpx')
+
+from core.api_client import ApiClient
+from core.async_client import AsyncApiClient
+from core.host_guard import HostGuard
+from core.response_cache import ResponseCache
+from core import retry
+
+FAST_RETRY = {'max_retries': 3, 'base_delay': 0.01, 'max_delay': 0.01, 'jitter': False}
+
+
+@pytest.fixture(params=['thread', 'async'])
+def engine(request):
+    """
+    按执行引擎返回 (执行调用链的函数, ApiClient)，两种引擎共用同一个 ApiClient 的
+    熔断器和响应缓存，测试按参数各跑一次
+    """
+    api_client = ApiClient(
+        host_guard=HostGuard(breaker=True, window=4, min_requests=4, failure_rate=0.5, open_seconds=60),
+        response_cache=ResponseCache()
+    )
+    if request.param == 'thread':
+        yield api_client.execute_chain, api_client
+    else:
+        async_client = AsyncApiClient(api_client)
+        yield (lambda *args, **kwargs: async_client.submit_chain(*args, **kwargs).result()), api_client
+        async_client.close()
+    api_client.close()
+
+
+@pytest.fixture
+def unlimited_budget(monkeypatch):
+    """不限制重试预算，避免测试之间互相影响"""
+    monkeypatch.setattr(retry.retry_budget, 'capacity', 0)
+
+
+def test_retry_until_success(engine, api_server, unlimited_budget):
+    run_chain, _ = engine
+    steps = [{'name': 'flaky', 'url': f'{api_server.url}/flaky/a/2', 'method': 'GET', 'retry': FAST_RETRY}]
+    result = run_chain(steps)
+    assert result['success']
+    assert result['steps'][0]['attempts'] == 3
+    assert api_server.hits['/flaky/a/2'] == 3
+
+
+def test_retry_budget_exhausted(engine, api_server, monkeypatch):
+    run_chain, _ = engine
+    monkeypatch.setattr(retry, 'retry_budget', retry.RetryBudget(ratio=0, min_per_second=0, capacity=1))
+    steps = [{'name': 'error', 'url': f'{api_server.url}/error', 'method': 'GET', 'retry': FAST_RETRY}]
+    result = run_chain(steps)
+    assert not result['success']
+    # 预算只够重试一次
+    assert result['steps'][0]['attempts'] == 2
+    assert result['steps'][0]['result']['retry_denied']
+
+
+def test_graph_stops_retrying_after_failure(engine, api_server, unlimited_budget):
+    run_chain, _ = engine
+    steps = [
+        {'name': 'broken', 'url': f'{api_server.url}/ok', 'method': 'POST', 'retry': FAST_RETRY},
+        {'name': 'flaky', 'url': f'{api_server.url}/flaky/b/100', 'method': 'GET',
+         'retry': dict(FAST_RETRY, base_delay=0.2, max_delay=0.2)}
+    ]
+    # 测试接口不支持 POST，第一个步骤失败且不可重试，第二个步骤不再重试
+    result = run_chain(steps, parallelism=2)
+    assert not result['success']
+    assert result['error'].startswith('步骤1失败')
+    assert [entry['attempts'] for entry in result['steps']] == [1, 1]
+
+
+def test_circuit_opens_for_failing_host(engine, api_server, unlimited_budget):
+    run_chain, api_client = engine
+    step = {'name': 'error', 'url': f'{api_server.url}/error', 'method': 'GET', 'retry': {'max_retries': 0}}
+    for _ in range(4):
+        run_chain([step])
+    result = run_chain([step])
+    assert result['steps'][0]['result']['error_type'] == 'circuit_open'
+    assert api_server.hits['/error'] == 4
+    assert api_client.host_guard.stats()[0]['circuit']['state'] == 'open'
+
+
+def test_rate_limited_when_wait_too_long(engine, api_server):
+    run_chain, api_client = engine
+    api_client.host_guard = HostGuard(rate=1, burst=1, max_wait=0.5, breaker=False)
+    step = {'name': 'ok', 'url': f'{api_server.url}/ok', 'method': 'GET', 'retry': {'max_retries': 0}}
+    assert run_chain([step])['success']
+    # 令牌已用完，下一个令牌要等约 1 秒，超过最长等待时间直接失败
+    result = run_chain([step])
+    assert result['steps'][0]['result']['error_type'] == 'rate_limited'
+    assert api_server.hits['/ok'] == 1
+
+
+def test_response_cache_hit_and_revalidate(engine, api_server):
+    run_chain, _ = engine
+    fresh = {'name': 'fresh', 'url': f'{api_server.url}/cached?max_age=60', 'method': 'GET', 'cache': True,
+             'extract_params': [{'name': 'value', 'path': '$.value'}]}
+    statuses = [run_chain([fresh])['steps'][0]['result']['cache'] for _ in range(2)]
+    assert statuses == ['miss', 'hit']
+
+    stale = dict(fresh, url=f'{api_server.url}/cached?max_age=0')
+    results = [run_chain([stale])['steps'][0]['result'] for _ in range(2)]
+    assert [result['cache'] for result in results] == ['miss', 'revalidated']
+    assert results[1]['extracted_params'] == {'value': 'cached'}
+    assert api_server.hits['/cached'] == 3
@@ -0,0 +1,100 @@
+# 大对象存储测试：引用计数、压缩清理和复用对象的宽限期
+
+import os
+import time
+
+from core.blob_store import BLOB_KEY, blob_refs, resolve, spill
+
+
+def spilled_log(storage, task_id, token):
+    """构造详情字段被移入大对象存储的日志"""
+    details = spill({'response': {'token': token * 100}}, storage.blob_store, max_bytes=50)
+    return {'task_id': task_id, 'task_name': 'task', 'event': 'step', 'status': 'success',
+            'message': 'ok', 'details': details}
+
+
+def blob_path(storage, log):
+    return storage.blob_store._path(blob_refs(log)[0])
+
+
+def age(path, seconds=3600):
+    """把对象的修改时间改到 seconds 秒之前，模拟宽限期已过"""
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def seal(storage):
+    """滚动出新分段，之前的日志所在分段被封存"""
+    storage.log_store.segment_max_bytes = 1
+    storage.add_logs([{'task_id': 99, 'event': 'step', 'status': 'success', 'details': {}}])
+    storage.log_store.segment_max_bytes = 8 * 1024 * 1024
+
+
+def test_shared_blob_kept_until_last_reference_removed(open_storage):
+    storage = open_storage(blob_orphan_grace=0)
+    first = spilled_log(storage, 1, 'a')
+    second = spilled_log(storage, 2, 'a')
+    assert blob_refs(first) == blob_refs(second)
+    storage.add_logs([first])
+    seal(storage)
+    storage.add_logs([second, {'task_id': 1, 'event': 'step', 'status': 'success', 'details': {}}])
+    seal(storage)
+    path = blob_path(storage, first)
+
+    # 每个任务只保留最新的 1 条，第一个任务引用对象的旧日志被清理，第二个任务的日志仍引用对象
+    storage.compact_logs(max_per_task=1)
+    assert storage.get_log(first['id']) is None
+    assert os.path.exists(path)
+
+    storage.compact_logs(max_bytes=1)
+    assert storage.get_log(second['id']) is None
+    assert not os.path.exists(path)
+
+
+def test_reused_blob_not_deleted_before_log_indexed(open_storage):
+    storage = open_storage(blob_orphan_grace=60)
+    old = spilled_log(storage, 1, 'b')
+    storage.add_logs([old])
+    seal(storage)
+    path = blob_path(storage, old)
+    age(path)
+
+    # 新日志复用了对象但还在写入队列中，此时压缩删除了引用该对象的唯一一条日志
+    queued = spilled_log(storage, 1, 'b')
+    storage.compact_logs(max_bytes=1)
+    assert storage.get_log(old['id']) is None
+    assert os.path.exists(path)
+    assert storage.pending_orphans == set(blob_refs(old))
+
+    # 新日志写入后对象重新被引用，下次压缩不会删除
+    storage.add_logs([queued])
+    age(path)
+    storage.compact_logs()
+    assert os.path.exists(path)
+    assert storage.pending_orphans == set()
+    details = resolve(storage.get_log(queued['id'])['details'], storage.blob_store)
+    assert details['response']['token'] == 'b' * 100
+
+
+def test_unreferenced_blob_deleted_after_grace(open_storage):
+    storage = open_storage(blob_orphan_grace=60)
+    log = spilled_log(storage, 1, 'c')
+    storage.add_logs([log])
+    seal(storage)
+    path = blob_path(storage, log)
+
+    storage.compact_logs(max_bytes=1)
+    assert os.path.exists(path)
+
+    age(path)
+    storage.compact_logs()
+    assert not os.path.exists(path)
+    assert storage.pending_orphans == set()
+
+
+def test_spill_reference_format(open_storage):
+    storage = open_storage()
+    log = spilled_log(storage, 1, 'd')
+    reference = log['details']['response']
+    assert set(reference) == {BLOB_KEY, 'size', 'preview'}
+    assert storage.blob_store.get(reference[BLOB_KEY]) is not None
@@ -0,0 +1,60 @@
+# 调用链按参数依赖并行执行的测试
+
+import time
+
+from core.api_client import ApiClient
+from core.template import compile_steps, step_dependencies
+
+
+def step(name, url, extract=None):
+    """构造一个 GET 步骤，extract 为 {参数名: 路径}"""
+    return {
+        'name': name, 'url': url, 'method': 'GET', 'retry': {'max_retries': 0},
+        'extract_params': [{'name': key, 'path': path} for key, path in (extract or {}).items()]
+    }
+
+
+def test_dependencies_are_transitive():
+    steps = compile_steps([
+        step('login', 'http://a/login', {'token': '$.token'}),
+        step('other', 'http://a/other'),
+        step('user', 'http://a/user?t=${token}', {'user_id': '$.id'}),
+        step('orders', 'http://a/orders/${user_id}'),
+        step('unknown', 'http://a/x/${missing}')
+    ])
+    assert step_dependencies(steps) == [(), (), (0,), (0, 2), ()]
+
+
+def test_independent_steps_run_in_parallel(api_server):
+    api_client = ApiClient()
+    steps = [
+        step('login', f'{api_server.url}/slow?delay=0.3&token=abc', {'token': '$.query.token'}),
+        step('other', f'{api_server.url}/slow?delay=0.3'),
+        step('user', f'{api_server.url}/ok?t=${{token}}', {'t': '$.query.t'})
+    ]
+    started = time.monotonic()
+    result = api_client.execute_chain(steps, parallelism=3)
+    elapsed = time.monotonic() - started
+    api_client.close()
+
+    assert result['success']
+    assert [entry['step_name'] for entry in result['steps']] == ['login', 'other', 'user']
+    # 依赖的步骤成功后才执行，并拿到它提取的参数
+    assert result['steps'][2]['result']['extracted_params'] == {'t': 'abc'}
+    assert elapsed < 0.55
+
+
+def test_dependent_steps_skipped_after_failure(api_server):
+    api_client = ApiClient()
+    steps = [
+        step('login', f'{api_server.url}/error', {'token': '$.token'}),
+        step('other', f'{api_server.url}/ok'),
+        step('user', f'{api_server.url}/slow?t=${{token}}')
+    ]
+    result = api_client.execute_chain(steps, parallelism=3)
+    api_client.close()
+
+    assert not result['success']
+    assert result['error'].startswith('步骤1失败')
+    assert 2 not in [entry['step_index'] for entry in result['steps']]
+    assert api_server.hits['/slow'] == 0
@@ -0,0 +1,126 @@
+# 集群模式测试：主节点租约、触发队列认领，以及按节点查看日志
+
+import os
+import time
+
+import pytest
+
+from core.cluster import ClusterStore
+from core.storage import NodeLogs, Storage
+from conftest import close_storage, make_log
+
+
+@pytest.fixture
+def stores(tmp_path):
+    """共享同一个集群数据库的两个节点"""
+    db_path = str(tmp_path / 'cluster.db')
+    opened = [ClusterStore(db_path, 'node-a', lease_seconds=1), ClusterStore(db_path, 'node-b', lease_seconds=1)]
+    for store in opened:
+        store.heartbeat()
+    yield opened
+    for store in opened:
+        store.close()
+
+
+def test_only_one_node_holds_leadership(stores):
+    a, b = stores
+    assert a.acquire_leadership()
+    assert not b.acquire_leadership()
+    assert a.acquire_leadership()  # 续约
+    assert a.stats()['leader'] == 'node-a'
+
+
+def test_leadership_moves_after_release_or_expiry(stores):
+    a, b = stores
+    assert a.acquire_leadership()
+    a.release_leadership()
+    assert b.acquire_leadership()
+
+    time.sleep(1.1)
+    assert a.acquire_leadership()
+    assert not b.acquire_leadership()
+
+
+def test_timer_firings_require_leadership(stores):
+    a, b = stores
+    task = {'id': 1, 'max_instances': 1}
+    assert a.acquire_leadership()
+    assert not b.enqueue(task, 'queue')
+    assert b.enqueue(task, 'queue', fenced=False)
+    assert a.enqueue(task, 'queue')
+
+
+def test_each_firing_is_claimed_once(stores):
+    a, b = stores
+    assert a.acquire_leadership()
+    for task_id in (1, 2, 3):
+        assert a.enqueue({'id': task_id, 'max_instances': 0}, 'allow')
+
+    claimed = a.claim(2) + b.claim(5)
+    assert sorted(firing_id for firing_id, _ in claimed) == [1, 2, 3]
+    assert not a.claim(5) and not b.claim(5)
+
+
+def test_recover_abandons_firings_of_dead_nodes(stores):
+    a, b = stores
+    assert a.acquire_leadership()
+    assert a.enqueue({'id': 1, 'max_instances': 0}, 'allow')
+    assert b.claim(1)
+
+    time.sleep(1.1)
+    a.heartbeat()
+    a.recover()
+    assert a.stats()['firings'] == {'abandoned': 1}
+
+
+def open_node(tmp_path, node_id, **options):
+    """按集群模式的目录结构打开一个节点的存储"""
+    data_dir = str(tmp_path / 'data')
+    return Storage(data_dir, log_data_dir=os.path.join(data_dir, 'nodes', node_id), shared_tasks=True, **options)
+
+
+def test_node_logs_reads_other_nodes(tmp_path):
+    local = open_node(tmp_path, 'node-a')
+    other = open_node(tmp_path, 'node-b')
+    try:
+        local.add_logs([make_log(1)])
+        other.add_logs([make_log(i) for i in range(1, 6)])
+
+        node_logs = NodeLogs(str(tmp_path / 'data'), 'node-a', local)
+        assert node_logs.nodes() == ['node-a', 'node-b']
+        assert node_logs.get() is local
+        assert node_logs.get('node-c') is None
+        assert node_logs.get('..') is None
+
+        reader = node_logs.get('node-b')
+        logs, total = reader.query_logs(limit=10)
+        assert total == 5 and [log['id'] for log in logs] == [5, 4, 3, 2, 1]
+        assert reader.get_log(3)['message'] == '步骤 3 执行成功'
+        assert sum(reader.get_log_stats(logs[0]['timestamp'][:10]).values()) == 5
+
+        # 对方之后写入的日志也能读到
+        other.add_logs([make_log(6)])
+        page, has_more = reader.scan_logs(before_id=None, limit=2)
+        assert [log['id'] for log in page] == [6, 5] and has_more
+        node_logs.close()
+    finally:
+        close_storage(local)
+        close_storage(other)
+
+
+def test_node_reader_follows_rewritten_segments(tmp_path):
+    other = open_node(tmp_path, 'node-b', log_segment_max_bytes=300)
+    try:
+        other.add_logs([make_log(i) for i in range(1, 21)])
+        reader = NodeLogs(str(tmp_path / 'data'), 'node-a', None).get('node-b')
+        assert reader.count_logs() == 20
+
+        # 对方按保留策略重写并归档分段后，读取方按新的文件和位置读取
+        other.compact_logs(max_per_task=1, compress=True)
+        logs, _ = reader.query_logs(limit=50)
+        assert logs and all(reader.get_log(log['id'])['id'] == log['id'] for log in logs)
+        assert [log['id'] for log in logs] == sorted((log['id'] for log in logs), reverse=True)
+        assert not os.path.exists(os.path.join(reader.logs_dir, 'compaction.pending'))
+        close_storage(reader)
+    finally:
+        close_storage(other)
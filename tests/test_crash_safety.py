@@ -0,0 +1,285 @@
+# 崩溃安全测试：在追加日志、分段滚动、分段压缩和写任务文件的指定位置杀死写入进程，
+# 重新打开存储后检查已提交的数据全部恢复
+#
+# 写入进程是以本文件为脚本启动的子进程，在注入点用 SIGKILL 杀死自己，不执行任何清理。
+
+import json
+import os
+import signal
+import subprocess
+import sys
+
+import pytest
+
+if __name__ != '__main__':
+    from conftest import close_storage, make_log
+
+    from core.storage import Storage
+
+pytestmark = pytest.mark.skipif(not hasattr(signal, 'SIGKILL'), reason='需要 SIGKILL')
+
+SEGMENT_BYTES = 4096
+
+
+def crash():
+    """立即杀死当前进程，模拟断电或被 OOM 杀死"""
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def commit_logs(storage, count):
+    """写入一批日志，写完(已 fsync)后报告提交的最大日志ID"""
+    logs = [make_log(i) for i in range(count)]
+    storage.add_logs(logs)
+    print(json.dumps({'log_id': logs[-1]['id']}), flush=True)
+
+
+def crash_on_call(owner, name, call=1, after=False):
+    """第 call 次调用 owner.name 时(之前或之后)杀死进程"""
+    original = getattr(owner, name)
+    calls = []
+
+    def wrapper(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == call and not after:
+            crash()
+        result = original(*args, **kwargs)
+        if len(calls) == call:
+            crash()
+        return result
+
+    setattr(owner, name, wrapper)
+
+
+def writer_append(storage):
+    """一批日志写到一半时被杀死，最后一行只写了一半"""
+    from core.log_store import LogStore
+
+    for _ in range(3):
+        commit_logs(storage, 20)
+
+    original = LogStore._write
+
+    def torn_write(self, log):
+        if log.get('message') == 'crash':
+            f = self._open_segment()
+            line = json.dumps(log).encode('utf-8')
+            f.write(line[:len(line) // 2])
+            f.flush()
+            crash()
+        return original(self, log)
+
+    LogStore._write = torn_write
+    storage.add_logs([make_log(1), make_log(2), dict(make_log(3), message='crash')])
+
+
+def writer_rotation(storage, torn):
+    """滚动到新分段时被杀死，新分段为空或只有半行"""
+    from core.log_store import LogStore
+
+    commit_logs(storage, 20)
+    original = LogStore._open_segment
+
+    def open_and_crash(self):
+        count = len(self.segments)
+        f = original(self)
+        if len(self.segments) > count:
+            if torn:
+                f.write(b'{"id": ')
+            f.flush()
+            crash()
+        return f
+
+    LogStore._open_segment = open_and_crash
+    while True:
+        commit_logs(storage, 5)
+
+
+def writer_compaction(storage, point):
+    """按保留策略压缩分段时被杀死: 写完临时文件后、替换分段前，或替换分段后、更新索引前"""
+    from core.log_index import LogIndex
+    from core.log_store import LogStore
+
+    for _ in range(6):
+        commit_logs(storage, 10)
+    assert len(storage.log_store.sealed_segments()) >= 3
+
+    if point == 'rewrite':
+        crash_on_call(LogStore, 'rewrite_segment', call=2, after=True)
+    elif point == 'commit':
+        crash_on_call(LogStore, 'commit_rewrite', call=2)
+    else:
+        crash_on_call(LogIndex, 'relocate', call=2)
+    storage.compact_logs(max_per_task=3, compress=True)
+
+
+def writer_tasks(storage):
+    """写完任务临时文件、替换任务文件前被杀死"""
+    for i in range(3):
+        task_id = storage.add_task({'name': f'task-{i}', 'steps': []})
+        print(json.dumps({'task_id': task_id}), flush=True)
+
+    os.replace = lambda src, dst: crash()
+    storage.add_task({'name': 'lost', 'steps': []})
+
+
+def writer_task_lock(storage):
+    """持有任务文件的跨进程锁时被杀死"""
+    with storage._tasks_write():
+        print(json.dumps({'locked': True}), flush=True)
+        crash()
+
+
+def writer_add_tasks(storage, prefix):
+    """与其他进程同时新增任务"""
+    for i in range(20):
+        storage.add_task({'name': f'{prefix}-{i}', 'steps': []})
+
+
+def run_writer(data_dir, scenario, *args):
+    """启动写入子进程并等待它在注入点被杀死，返回报告的提交进度列表"""
+    child = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), data_dir, scenario, *args],
+        stdout=subprocess.PIPE, text=True, timeout=60
+    )
+    assert child.returncode == -signal.SIGKILL, '写入进程没有在注入点被杀死'
+    return [json.loads(line) for line in child.stdout.splitlines()]
+
+
+def scan_ids(storage):
+    """按分段顺序扫描出的全部日志ID"""
+    return [
+        record['id']
+        for segment in storage.log_store.segments
+        for record, _, _ in storage.log_store.scan_segment(segment)
+    ]
+
+
+def check_logs(data_dir, required):
+    """
+    重新打开存储，检查 required 中已提交的日志全部恢复、ID不重复不乱序、索引与分段一致，
+    之后写入的日志ID不回退且再次重启后仍可读取，返回恢复后的日志ID
+    """
+    storage = Storage(data_dir, log_segment_max_bytes=SEGMENT_BYTES)
+    try:
+        assert not [name for name in os.listdir(storage.logs_dir) if name.endswith('.tmp')]
+        assert not os.path.exists(storage.compaction_marker)
+
+        ids = scan_ids(storage)
+        assert ids == sorted(set(ids)), '日志ID重复或乱序'
+        assert set(required) <= set(ids), '已提交的日志丢失'
+
+        assert storage.log_index.count() == len(ids)
+        assert storage.log_index.last_id() == ids[-1]
+        for log_id in ids:
+            assert storage.get_log(log_id)['id'] == log_id
+
+        log = make_log(0)
+        storage.add_log(log)
+        assert log['id'] == ids[-1] + 1
+    finally:
+        close_storage(storage)
+
+    storage = Storage(data_dir, log_segment_max_bytes=SEGMENT_BYTES)
+    try:
+        assert scan_ids(storage) == ids + [log['id']]
+    finally:
+        close_storage(storage)
+    return ids
+
+
+def test_crash_mid_append(tmp_path):
+    data_dir = str(tmp_path / 'data')
+    committed = run_writer(data_dir, 'append')
+    assert committed[-1]['log_id'] == 60
+
+    ids = check_logs(data_dir, range(1, 61))
+    # 同一批中完整写入的两条保留，只写了一半的一行被截掉
+    assert ids[-1] == 62
+
+
+@pytest.mark.parametrize('torn', [False, True], ids=['empty', 'torn'])
+def test_crash_mid_rotation(tmp_path, torn):
+    data_dir = str(tmp_path / 'data')
+    committed = run_writer(data_dir, 'rotation', str(int(torn)))
+
+    check_logs(data_dir, range(1, committed[-1]['log_id'] + 1))
+
+
+@pytest.mark.parametrize('point', ['rewrite', 'commit', 'relocate'])
+def test_crash_mid_compaction(tmp_path, point):
+    data_dir = str(tmp_path / 'data')
+    committed = run_writer(data_dir, 'compaction', point)
+    assert committed[-1]['log_id'] == 60
+
+    # 每批10条依次属于任务1到10，保留策略下每个任务最新的3条(ID 31到60)一定保留
+    ids = check_logs(data_dir, range(31, 61))
+    if point == 'relocate':
+        assert len(ids) < 60
+
+
+def test_crash_before_tasks_file_replaced(tmp_path):
+    data_dir = str(tmp_path / 'data')
+    committed = [entry['task_id'] for entry in run_writer(data_dir, 'tasks')]
+    assert [name for name in os.listdir(data_dir) if name.endswith('.tmp')]
+
+    with open(os.path.join(data_dir, 'tasks.json'), encoding='utf-8') as f:
+        assert [task['id'] for task in json.load(f)] == committed
+
+    storage = Storage(data_dir)
+    try:
+        assert not [name for name in os.listdir(data_dir) if name.endswith('.tmp')]
+        assert storage.add_task({'name': 'next', 'steps': []}) == committed[-1] + 1
+    finally:
+        close_storage(storage)
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='需要 fcntl')
+def test_task_lock_released_when_holder_killed(tmp_path):
+    import fcntl
+
+    data_dir = str(tmp_path / 'data')
+    assert run_writer(data_dir, 'task_lock') == [{'locked': True}]
+
+    with open(os.path.join(data_dir, 'tasks.json.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='需要 fcntl')
+def test_concurrent_task_writers_keep_every_task(tmp_path):
+    data_dir = str(tmp_path / 'data')
+    Storage(data_dir, shared_tasks=True)
+    children = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), data_dir, 'add_tasks', f'p{n}'])
+        for n in range(4)
+    ]
+    assert all(child.wait(timeout=60) == 0 for child in children)
+
+    storage = Storage(data_dir, shared_tasks=True)
+    try:
+        tasks = storage.list_tasks()
+        assert [task['id'] for task in tasks] == list(range(1, 81))
+        assert {task['name'] for task in tasks} == {f'p{n}-{i}' for n in range(4) for i in range(20)}
+    finally:
+        close_storage(storage)
+
+
+if __name__ == '__main__':
+    sys.path[:0] = [os.path.dirname(os.path.dirname(os.path.abspath(__file__))), os.path.dirname(__file__)]
+    from conftest import make_log
+
+    from core.storage import Storage
+
+    data_dir, scenario, *args = sys.argv[1:]
+    if scenario == 'append':
+        writer_append(Storage(data_dir, log_segment_max_bytes=SEGMENT_BYTES))
+    elif scenario == 'rotation':
+        writer_rotation(Storage(data_dir, log_segment_max_bytes=SEGMENT_BYTES), bool(int(args[0])))
+    elif scenario == 'compaction':
+        writer_compaction(Storage(data_dir, log_segment_max_bytes=SEGMENT_BYTES), args[0])
+    elif scenario == 'tasks':
+        writer_tasks(Storage(data_dir))
+    elif scenario == 'task_lock':
+        writer_task_lock(Storage(data_dir, shared_tasks=True))
+    elif scenario == 'add_tasks':
+        writer_add_tasks(Storage(data_dir, shared_tasks=True), args[0])
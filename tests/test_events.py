@@ -0,0 +1,120 @@
+# 实时推送测试：EventBus 的游标、重放和失效，以及 /api/events 的长轮询和 SSE 输出
+
+import json
+import threading
+import time
+
+import pytest
+
+from core import config
+from core.events import EventBus
+
+
+def test_read_replays_events_after_cursor():
+    bus = EventBus(capacity=10)
+    start = bus.last_id
+    ids = [bus.publish('log', {'n': n}) for n in range(3)]
+    assert ids == [start + 1, start + 2, start + 3] and bus.last_id == ids[-1]
+
+    events, reset = bus.read(start)
+    assert not reset and events == [(ids[0], 'log', {'n': 0}), (ids[1], 'log', {'n': 1}), (ids[2], 'log', {'n': 2})]
+    assert bus.read(ids[1]) == ([(ids[2], 'log', {'n': 2})], False)
+    assert bus.read(ids[2]) == ([], False)
+
+
+def test_stale_or_foreign_cursor_requires_reset():
+    bus = EventBus(capacity=3)
+    start = bus.last_id
+    for n in range(5):
+        bus.publish('log', {'n': n})
+
+    # 最早的两个事件已被挤出缓冲区，从 start 接续会漏事件
+    assert bus.read(start) == ([], True)
+    assert bus.read(start + 1) == ([], True)
+    events, reset = bus.read(start + 2)
+    assert not reset and [data['n'] for _, _, data in events] == [2, 3, 4]
+
+    # 上一次运行的游标(序号比当前大或早于启动时间)同样需要重新加载
+    assert bus.read(bus.last_id + 1) == ([], True)
+    assert bus.read(0) == ([], True)
+
+
+def test_read_waits_for_next_event():
+    bus = EventBus()
+    cursor = bus.last_id
+    timer = threading.Timer(0.1, bus.publish, ('task', {'action': 'created'}))
+    timer.start()
+    started = time.monotonic()
+    events, reset = bus.read(cursor, timeout=5)
+    assert not reset and events[0][1:] == ('task', {'action': 'created'})
+    assert time.monotonic() - started < 2
+    timer.join()
+
+    # 超时后返回空列表
+    assert bus.read(bus.last_id, timeout=0.05) == ([], False)
+
+
+def test_close_wakes_waiting_readers():
+    bus = EventBus()
+    threading.Timer(0.1, bus.close).start()
+    started = time.monotonic()
+    assert bus.read(bus.last_id, timeout=5) == ([], False)
+    assert time.monotonic() - started < 2
+    # 关闭后读取不再等待
+    assert bus.read(bus.last_id, timeout=5) == ([], False)
+
+
+@pytest.fixture
+def client(app_module, monkeypatch):
+    monkeypatch.setattr(config, 'EVENT_KEEPALIVE_INTERVAL', 0.05)
+    monkeypatch.setattr(config, 'EVENT_STREAM_TIMEOUT', 0.2)
+    return app_module.app.test_client()
+
+
+def test_poll_returns_events_and_next_cursor(app_module, client):
+    events = app_module.events
+    cursor = events.last_id
+    first = events.publish('log', {'id': 1, 'message': '步骤 1 执行成功'})
+    second = events.publish('task', {'action': 'created', 'task_id': 7})
+
+    body = client.get(f'/api/events?poll=1&cursor={cursor}').get_json()
+    assert body['reset'] is False and body['cursor'] == second
+    assert body['events'] == [
+        {'id': first, 'type': 'log', 'data': {'id': 1, 'message': '步骤 1 执行成功'}},
+        {'id': second, 'type': 'task', 'data': {'action': 'created', 'task_id': 7}}
+    ]
+
+    # Last-Event-ID 优先于 cursor 参数
+    body = client.get(f'/api/events?poll=1&cursor={cursor}', headers={'Last-Event-ID': str(first)}).get_json()
+    assert [event['id'] for event in body['events']] == [second]
+
+    # 没有新事件时等待后返回空列表，游标不变
+    body = client.get(f'/api/events?poll=1&cursor={second}').get_json()
+    assert body == {'cursor': second, 'reset': False, 'events': []}
+
+
+def test_poll_with_stale_cursor_resets(app_module, client):
+    body = client.get('/api/events?poll=1&cursor=1').get_json()
+    assert body['reset'] is True and body['events'] == []
+    assert body['cursor'] == app_module.events.last_id
+
+
+def test_stream_replays_from_last_event_id(app_module, client):
+    events = app_module.events
+    cursor = events.last_id
+    first = events.publish('log', {'id': 1})
+    second = events.publish('logs_cleared', {})
+
+    response = client.get('/api/events', headers={'Last-Event-ID': str(cursor)})
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    text = response.get_data(as_text=True)
+    assert text.startswith('retry: 3000\n\n')
+    assert f'id: {first}\nevent: log\ndata: {json.dumps({"id": 1})}\n\n' in text
+    assert f'id: {second}\nevent: logs_cleared\ndata: {{}}\n\n' in text
+    assert ': keepalive\n\n' in text
+
+
+def test_stream_sends_reset_for_stale_cursor(app_module, client):
+    text = client.get('/api/events?cursor=1').get_data(as_text=True)
+    assert '\nevent: reset\ndata: {}\n\n' in text
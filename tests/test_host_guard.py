@@ -0,0 +1,81 @@
+# 出站流量控制测试：熔断器状态切换、令牌桶限流和多进程共用
+
+import multiprocessing
+import time
+
+from core.host_guard import CircuitBreaker, HostGuard, HostGuardServer, RateLimiter
+
+
+def test_breaker_opens_and_recovers(monkeypatch):
+    breaker = CircuitBreaker('http://a', window=4, min_requests=4, failure_rate=0.5, open_seconds=10)
+    for failed in (False, True, False, True):
+        assert breaker.allow()
+        breaker.record(failed)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    # 熔断时间过后只放行一个试探请求，成功后恢复
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 11)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_reopens_on_failed_probe(monkeypatch):
+    breaker = CircuitBreaker('http://a', window=2, min_requests=2, failure_rate=1, open_seconds=10)
+    breaker.record(True)
+    breaker.record(True)
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 11)
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_breaker_needs_min_requests():
+    breaker = CircuitBreaker('http://a', window=10, min_requests=5, failure_rate=0.5)
+    for _ in range(4):
+        breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_rate_limiter_spreads_requests():
+    limiter = RateLimiter(rate=10, burst=2)
+    waits = [limiter.reserve(max_wait=1) for _ in range(4)]
+    assert waits[:2] == [0, 0]
+    assert 0.05 < waits[2] <= 0.1
+    assert 0.15 < waits[3] <= 0.2
+    # 排队超过最长等待时间时不预约
+    assert RateLimiter(rate=1, burst=1).reserve(0.5) == 0
+    limiter = RateLimiter(rate=1, burst=1)
+    limiter.reserve(0.5)
+    assert limiter.reserve(0.5) is None
+
+
+def _reserve_in_worker(guard, results):
+    results.put([guard.reserve('http://shared') for _ in range(3)])
+    for _ in range(2):
+        guard.record('http://shared', True)
+
+
+def test_worker_processes_share_guard():
+    guard = HostGuard(rate=0.001, burst=2, max_wait=1, window=4, min_requests=4, failure_rate=0.5)
+    server = HostGuardServer(guard)
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    workers = [context.Process(target=_reserve_in_worker, args=(server.client(), results)) for _ in range(2)]
+    server.start()
+    for worker in workers:
+        worker.start()
+    reserved = results.get(timeout=10) + results.get(timeout=10)
+    for worker in workers:
+        worker.join(10)
+
+    # 两个进程共用一个令牌桶，总共只有 burst 个请求被放行；失败次数合计达到熔断条件
+    assert sorted(wait for wait in reserved if wait is not None) == [0, 0]
+    hosts = guard.stats()
+    assert hosts[0]['circuit']['state'] == 'open'
+    assert server.client().stats()[0]['circuit']['state'] == 'open'
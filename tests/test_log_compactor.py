@@ -0,0 +1,169 @@
+# 日志压缩测试：按时间、按任务和按总大小的保留策略，gzip 归档，大对象引用计数，以及压缩后重新打开的一致性
+
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+from core.blob_store import blob_refs, spill
+from core.log_compactor import LogCompactor
+from conftest import close_storage, make_log
+
+SEGMENT_BYTES = 1024
+
+
+def open_segmented(open_storage, **options):
+    """分段很小的存储，几条日志就会滚动出新分段"""
+    return open_storage(log_segment_max_bytes=SEGMENT_BYTES, **options)
+
+
+def all_ids(storage):
+    """按分段顺序扫描出的全部日志ID"""
+    return [
+        record['id']
+        for segment in storage.log_store.segments
+        for record, _, _ in storage.log_store.scan_segment(segment)
+    ]
+
+
+def assert_readable(storage, ids):
+    """索引与分段一致，ids 中的日志都能按ID读回"""
+    assert all_ids(storage) == ids
+    assert storage.count_logs() == len(ids)
+    for log_id in ids:
+        assert storage.get_log(log_id)['id'] == log_id
+
+
+def blob_refcount(storage, digest):
+    with storage.log_index.lock:
+        row = storage.log_index.conn.execute('SELECT refs FROM blob_refs WHERE digest = ?', (digest,)).fetchone()
+    return row[0] if row else 0
+
+
+def test_age_retention(open_storage):
+    storage = open_segmented(open_storage)
+    old = (datetime.now() - timedelta(days=10)).strftime('%Y-%m-%d %H:%M:%S')
+    storage.add_logs([dict(make_log(i), timestamp=old) for i in range(10)])
+    storage.add_logs([make_log(i) for i in range(10, 30)])
+    first = storage.log_store.segments[0]
+
+    summary = storage.compact_logs(max_age_days=7, compress=False)
+    assert summary['removed'] == 10
+    assert_readable(storage, list(range(11, 31)))
+    assert storage.get_log(1) is None
+    # 只有过期日志的分段整段删除
+    assert first not in storage.log_store.segments
+
+
+def test_per_task_retention_spares_active_segment(open_storage):
+    storage = open_segmented(open_storage)
+    storage.add_logs([make_log(i) for i in range(40)])
+    active = storage.log_store.segments[-1]
+    active_ids = [record['id'] for record, _, _ in storage.log_store.scan_segment(active)]
+
+    storage.compact_logs(max_per_task=2, compress=False)
+    ids = all_ids(storage)
+    # make_log(i) 属于任务 i%10+1，日志ID为 i+1；已封存分段中每个任务只保留最新的 2 条，正在写入的分段不动
+    latest = {log_id for log_id in range(1, 41) if log_id > 20}
+    assert set(ids) == latest | set(active_ids)
+    assert_readable(storage, ids)
+
+
+def test_byte_budget_drops_oldest_segments(open_storage):
+    storage = open_segmented(open_storage)
+    storage.add_logs([make_log(i) for i in range(60)])
+    segments = list(storage.log_store.segments)
+    budget = SEGMENT_BYTES * 3
+
+    summary = storage.compact_logs(max_bytes=budget, compress=False)
+    assert summary['bytes'] <= budget
+    assert storage.log_store.segments == segments[-len(storage.log_store.segments):]
+    ids = all_ids(storage)
+    # 保留的是最新的一段连续日志
+    assert ids == list(range(ids[0], 61))
+    assert_readable(storage, ids)
+
+
+def test_gzip_archiving(open_storage):
+    storage = open_segmented(open_storage)
+    storage.add_logs([make_log(i) for i in range(30)])
+    sealed = storage.log_store.sealed_segments()
+
+    summary = storage.compact_logs(compress=True)
+    assert summary == {'segments': len(sealed), 'removed': 0, 'bytes': storage.log_store.total_size()}
+    assert storage.log_store.archived == set(sealed)
+    path = storage.log_store._segment_path(sealed[0])
+    assert path.endswith('.jsonl.gz')
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        assert json.loads(f.readline())['id'] == 1
+    assert_readable(storage, list(range(1, 31)))
+
+    # 已归档的分段不重复压缩，关闭压缩后解压回普通分段
+    assert storage.compact_logs(compress=True)['segments'] == 0
+    storage.compact_logs(compress=False)
+    assert storage.log_store.archived == set()
+    assert not [name for name in os.listdir(storage.logs_dir) if name.endswith('.gz')]
+    assert_readable(storage, list(range(1, 31)))
+
+
+def test_compacted_store_reads_back_after_reopen(open_storage):
+    storage = open_segmented(open_storage, blob_orphan_grace=0)
+    # 任务 1 的日志共用一个大对象，任务 2 的日志各自一个大对象
+    logs = []
+    for i in range(24):
+        task_id = i % 2 + 1
+        token = 'shared' if task_id == 1 else f'own-{i}'
+        details = spill({'response': {'token': token * 50}}, storage.blob_store, max_bytes=50)
+        logs.append({'task_id': task_id, 'task_name': f'task-{task_id}', 'event': 'step',
+                     'status': 'success' if i % 3 else 'failure', 'message': f'步骤 {i}', 'details': details})
+    storage.add_logs(logs)
+    day = logs[0]['timestamp'][:10]
+    counts = storage.get_log_stats(day)
+    shared = blob_refs(logs[0])[0]
+    own_paths = {log['id']: storage.blob_store._path(blob_refs(log)[0]) for log in logs if log['task_id'] == 2}
+    assert blob_refcount(storage, shared) == 12
+
+    storage.compact_logs(max_per_task=3, compress=True)
+    ids = all_ids(storage)
+    survivors = {log['id'] for log in logs if log['id'] in ids}
+    removed = [log for log in logs if log['id'] not in survivors]
+    assert removed and set(ids) == survivors
+
+    # 按天计数记录的是写入量，压缩不改变；引用计数按清理的日志减少，不再被引用的对象删除
+    assert storage.get_log_stats(day) == counts
+    shared_refs = sum(1 for log in logs if log['task_id'] == 1 and log['id'] in survivors)
+    assert blob_refcount(storage, shared) == shared_refs
+    for log_id, path in own_paths.items():
+        assert os.path.exists(path) == (log_id in survivors)
+    assert storage.log_store.archived == set(storage.log_store.sealed_segments())
+    assert_readable(storage, ids)
+
+    close_storage(storage)
+    reopened = open_segmented(open_storage, blob_orphan_grace=0)
+    assert reopened.log_store.archived == set(reopened.log_store.sealed_segments())
+    assert_readable(reopened, ids)
+    assert reopened.get_log_stats(day) == counts
+    assert blob_refcount(reopened, shared) == shared_refs
+
+    # 新写入的日志ID接着压缩前的最大ID
+    log = make_log(0)
+    reopened.add_log(log)
+    assert log['id'] == 25
+
+
+def test_compactor_records_last_run_and_survives_errors(open_storage, monkeypatch):
+    storage = open_segmented(open_storage)
+    storage.add_logs([make_log(i) for i in range(20)])
+    compactor = LogCompactor(storage, interval=3600, max_per_task=1)
+    try:
+        summary = compactor.compact()
+        assert summary['removed'] > 0 and compactor.stats() == summary
+
+        def broken(**options):
+            raise OSError('disk full')
+
+        monkeypatch.setattr(storage, 'compact_logs', broken)
+        assert compactor.compact() is None
+        assert compactor.stats() == summary
+    finally:
+        compactor.close()
@@ -0,0 +1,173 @@
+# 后台日志写入器测试：队列满时的处理方式、写入顺序和写入后推送
+
+import threading
+from datetime import datetime
+
+import pytest
+
+from conftest import close_storage, make_log
+from core import log_writer
+from core.log_writer import LogWriter
+from core.logger import TaskLogger
+
+
+class SlowStorage:
+    """记录写入顺序的存储，每批写入前可以被阻塞"""
+
+    def __init__(self):
+        self.next_id = 1
+        self.blob_store = None  # 不开启内联上限时不会用到
+        self.lock = threading.Lock()
+        self.written = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def allocate_log_id(self):
+        with self.lock:
+            log_id = self.next_id
+            self.next_id += 1
+            return log_id
+
+    def add_logs(self, logs):
+        self.gate.wait()
+        for log in logs:
+            if 'id' not in log:
+                log['id'] = self.allocate_log_id()
+            self.written.append(log['id'])
+
+    def add_log(self, log):
+        self.add_logs([log])
+
+
+def submit_concurrently(writer, threads=8, per_thread=200):
+    """多个线程同时提交日志"""
+    def worker():
+        for i in range(per_thread):
+            writer.submit(make_log(i))
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    return workers
+
+
+@pytest.mark.parametrize('backpressure', ['block', 'sync'])
+def test_logs_written_in_id_order(backpressure):
+    storage = SlowStorage()
+    writer = LogWriter(storage, batch_size=7, flush_interval=0.01, max_queue=5, backpressure=backpressure)
+    for thread in submit_concurrently(writer):
+        thread.join()
+    writer.close()
+
+    assert storage.written == list(range(1, 8 * 200 + 1))
+    assert writer.stats() == {'queue_size': 0, 'dropped': 0}
+
+
+def test_sync_waits_for_batch_in_progress():
+    storage = SlowStorage()
+    writer = LogWriter(storage, batch_size=2, flush_interval=0, max_queue=2, backpressure='sync')
+
+    # 后台线程取出的批次写到一半，队列满后提交线程写入的更大ID必须排在其后
+    storage.gate.clear()
+    for i in range(2):
+        writer.submit(make_log(i))
+    workers = submit_concurrently(writer, threads=2, per_thread=3)
+    storage.gate.set()
+    for thread in workers:
+        thread.join()
+    writer.close()
+
+    assert storage.written == list(range(1, 9))
+
+
+def test_drop_counts_dropped_logs():
+    storage = SlowStorage()
+    storage.gate.clear()
+    writer = LogWriter(storage, batch_size=1, flush_interval=0, max_queue=1, backpressure='drop')
+    ids = [writer.submit(make_log(i)) for i in range(10)]
+    storage.gate.set()
+    writer.close()
+
+    # 被丢弃的日志不分配ID，写入的日志ID连续
+    accepted = [log_id for log_id in ids if log_id is not None]
+    assert storage.written == accepted == list(range(1, len(accepted) + 1))
+    assert writer.stats()['dropped'] == ids.count(None) > 0
+
+
+def test_events_published_after_logs_written():
+    class Events:
+        def __init__(self):
+            self.published = []
+
+        def publish(self, event, data):
+            # 推送时日志必须已经写入存储
+            assert data['id'] in storage.written
+            self.published.append(data['id'])
+
+    storage = SlowStorage()
+    events = Events()
+    writer = LogWriter(storage, batch_size=10, flush_interval=0.01)
+    logger = TaskLogger(storage, writer, events=events)
+    log_ids = [logger.log_task_start(1, 'task') for _ in range(25)]
+    writer.flush()
+    assert events.published == log_ids
+    logger.close()
+
+
+def test_close_writes_remaining_logs():
+    storage = SlowStorage()
+    writer = LogWriter(storage, batch_size=1000, flush_interval=60)
+    for i in range(50):
+        writer.submit(make_log(i))
+    writer.close()
+    assert storage.written == list(range(1, 51))
+
+    # 关闭后同步写入
+    writer.submit(make_log(0))
+    assert storage.written[-1] == 51
+
+
+def test_submit_during_close_is_written(monkeypatch):
+    storage = SlowStorage()
+    writer = LogWriter(storage, batch_size=1000, flush_interval=60)
+    closer = threading.Thread(target=writer.close, daemon=True)
+
+    class ClosingClock:
+        """提交线程取时间戳时关闭写入器并等后台线程退出，模拟提交与关闭交错"""
+
+        @staticmethod
+        def now():
+            closer.start()
+            writer.thread.join()
+            return datetime.now()
+
+    monkeypatch.setattr(log_writer, 'datetime', ClosingClock)
+    assert writer.submit(make_log(0)) == 1
+
+    # 后台线程已退出，日志由提交线程写入，close 不会一直等待
+    closer.join(timeout=5)
+    assert not closer.is_alive()
+    assert storage.written == [1]
+
+
+def test_clear_logs_keeps_ids_increasing(open_storage):
+    storage = open_storage()
+    writer = LogWriter(storage, batch_size=1000, flush_interval=60)
+    for i in range(5):
+        writer.submit(make_log(i))
+    writer.clear_logs()
+    writer.flush()
+    ids = [writer.submit(make_log(i)) for i in range(5)]
+    writer.close()
+
+    # 清除前还在队列中的日志一并清除，之后的日志ID不与清除前分配的重复
+    assert ids == list(range(6, 11))
+    logs, total = storage.query_logs(limit=20)
+    assert total == 5 and [log['id'] for log in logs] == ids[::-1]
+    assert sum(storage.get_log_stats(logs[0]['timestamp'][:10]).values()) == 5
+
+    # 重启后ID同样不回退
+    close_storage(storage)
+    storage = open_storage()
+    storage.add_log(make_log(0))
+    assert storage.count_logs() == 6 and storage.log_store.next_id == 12
@@ -0,0 +1,107 @@
+# 指标测试：Prometheus 文本格式的计数器、直方图和标签转义，以及 /metrics 导出任务执行指标
+
+import re
+
+from core.api_client import ApiClient
+from core.logger import TaskLogger
+from core.metrics import MetricsRegistry, registry
+from core.scheduler import TaskScheduler
+from conftest import wait_for
+
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="([^"\\\n]|\\.)*",?)*\})? \S+$')
+
+
+def assert_exposition(text):
+    """每行都是 HELP、TYPE 注释或合法的样本行，每个指标先声明 HELP 和 TYPE"""
+    assert text.endswith('\n')
+    declared = set()
+    for line in text.splitlines():
+        if line.startswith('# HELP ') or line.startswith('# TYPE '):
+            declared.add(line.split()[2])
+            continue
+        assert SAMPLE.match(line), line
+        name = line.split('{')[0].split(' ')[0]
+        assert re.sub(r'_(bucket|sum|count)$', '', name) in declared | {name}, line
+
+
+def test_counter_and_histogram_exposition():
+    metrics = MetricsRegistry(prefix='test_')
+    runs = metrics.counter('runs_total', '执行次数', ('task_id', 'status'))
+    assert metrics.counter('runs_total', '执行次数', ('task_id', 'status')) is runs
+    runs.inc(task_id=1, status='success')
+    runs.inc(2, task_id=1, status='success')
+    runs.inc(task_id=2, status='failure')
+    duration = metrics.histogram('duration_seconds', '耗时', ('task_id',), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 3):
+        duration.observe(value, task_id=1)
+
+    text = metrics.render()
+    assert_exposition(text)
+    assert text.splitlines() == [
+        '# HELP test_duration_seconds 耗时',
+        '# TYPE test_duration_seconds histogram',
+        'test_duration_seconds_bucket{task_id="1",le="0.1"} 1',
+        'test_duration_seconds_bucket{task_id="1",le="1"} 3',
+        'test_duration_seconds_bucket{task_id="1",le="+Inf"} 4',
+        'test_duration_seconds_sum{task_id="1"} 4.05',
+        'test_duration_seconds_count{task_id="1"} 4',
+        '# HELP test_runs_total 执行次数',
+        '# TYPE test_runs_total counter',
+        'test_runs_total{task_id="1",status="success"} 3',
+        'test_runs_total{task_id="2",status="failure"} 1'
+    ]
+
+    # 删除任务后其序列不再导出
+    metrics.remove('task_id', 1)
+    assert 'task_id="1"' not in metrics.render()
+
+
+def test_label_values_are_escaped():
+    metrics = MetricsRegistry(prefix='test_')
+    metrics.counter('steps_total', '步骤', ('step',)).inc(step='say "hi"\\\nnow')
+    text = metrics.render()
+    assert_exposition(text)
+    assert 'test_steps_total{step="say \\"hi\\"\\\\\\nnow"} 1' in text
+
+
+def test_histogram_summary_quantiles():
+    metrics = MetricsRegistry(prefix='test_')
+    phase = metrics.histogram('phase_seconds', '阶段', ('phase',), buckets=(0.1, 0.2, 0.4))
+    for _ in range(10):
+        phase.observe(0.15, phase='total')
+    phase.observe(5, phase='dns')
+
+    summary = phase.summary(phase='total')
+    assert summary['count'] == 10 and summary['avg'] == 0.15
+    assert 0.1 < summary['p50'] <= 0.2 and summary['p99'] <= 0.2
+    # 落在最后一个有限分桶之外时取该分桶上界
+    assert phase.summary(phase='dns')['p99'] == 0.4
+
+
+def test_metrics_endpoint_exports_task_runs(app_module, open_storage, api_server):
+    storage = open_storage()
+    api_client = ApiClient()
+    scheduler = TaskScheduler(storage, api_client, TaskLogger(storage))
+    try:
+        task_id = scheduler.add_task({
+            'name': 'metrics', 'type': 'cron', 'cron_expression': '0 0 1 1 *', 'status': 'paused',
+            'steps': [{'name': 'fetch', 'url': f'{api_server.url}/ok', 'method': 'GET'}]
+        })
+        registry.remove('task_id', task_id)
+        assert scheduler.run_task_now(task_id)
+        wait_for(lambda: scheduler.get_metrics().get(task_id, {}).get('executions') == 1
+                 and scheduler.get_metrics()[task_id]['running'] == 0)
+    finally:
+        scheduler.shutdown()
+        api_client.close()
+
+    response = app_module.app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'text/plain; version=0.0.4; charset=utf-8'
+    text = response.get_data(as_text=True)
+    assert_exposition(text)
+    assert '# TYPE xxjob_task_runs_total counter' in text
+    assert f'xxjob_task_runs_total{{task_id="{task_id}",status="success"}} 1' in text
+    assert f'xxjob_step_requests_total{{task_id="{task_id}",step="0",status="success"}} 1' in text
+    assert f'xxjob_task_duration_seconds_count{{task_id="{task_id}"}} 1' in text
+    assert f'xxjob_step_phase_seconds_bucket{{task_id="{task_id}",step="0",phase="total",le="+Inf"}} 1' in text
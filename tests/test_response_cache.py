@@ -0,0 +1,96 @@
+# 线程执行引擎的 GET 响应缓存测试：有效期、Cache-Control 和 ETag 条件请求
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from core import response_cache
+from core.api_client import ApiClient
+from core.response_cache import ResponseCache
+
+
+@pytest.fixture
+def api_client():
+    client = ApiClient(response_cache=ResponseCache(default_ttl=60))
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可以拨快的缓存时钟，offset 为拨快的秒数"""
+    clock = SimpleNamespace(offset=0)
+    clock.monotonic = lambda: time.monotonic() + clock.offset
+    monkeypatch.setattr(response_cache, 'time', clock)
+    return clock
+
+
+def fetch(api_client, url, cache=True):
+    """执行开启缓存的 GET 步骤"""
+    step = {
+        'name': 'cached', 'url': url, 'method': 'GET', 'cache': cache,
+        'extract_params': [{'name': 'count', 'path': '$.count'}]
+    }
+    return api_client.execute_step(step)
+
+
+def test_max_age_serves_from_cache(api_client, api_server, clock):
+    url = f'{api_server.url}/cached?max_age=30'
+    first = fetch(api_client, url)
+    second = fetch(api_client, url)
+    assert first['cache'] == 'miss' and second['cache'] == 'hit'
+    assert second['status_code'] == 200 and second['response'] == first['response']
+    assert second['extracted_params'] == {'count': 1}
+    assert api_server.hits['/cached'] == 1
+
+    # max-age 比步骤的有效期(60秒)短，以 max-age 为准
+    clock.offset = 31
+    assert fetch(api_client, url)['cache'] == 'revalidated'
+    assert api_server.hits['/cached'] == 2
+
+
+def test_step_ttl_shorter_than_max_age(api_client, api_server, clock):
+    url = f'{api_server.url}/cached?max_age=60'
+    fetch(api_client, url, {'ttl': 5})
+    clock.offset = 3
+    assert fetch(api_client, url, {'ttl': 5})['cache'] == 'hit'
+    clock.offset = 6
+    assert fetch(api_client, url, {'ttl': 5})['cache'] == 'revalidated'
+
+
+def test_etag_revalidation_serves_304_from_cache(api_client, api_server):
+    url = f'{api_server.url}/cached?max_age=0'
+    first = fetch(api_client, url)
+    second = fetch(api_client, url)
+
+    # 过期的响应带 If-None-Match 重新验证，服务端返回 304，步骤结果使用缓存的内容
+    assert first['cache'] == 'miss' and second['cache'] == 'revalidated'
+    assert api_server.hits['/cached'] == 2
+    assert second['status_code'] == 200 and second['success']
+    assert second['response'] == first['response'] and second['extracted_params'] == {'count': 1}
+
+
+def test_no_cache_revalidates_every_time(api_client, api_server):
+    url = f'{api_server.url}/cached?cache_control=no-cache'
+    assert [fetch(api_client, url)['cache'] for _ in range(3)] == ['miss', 'revalidated', 'revalidated']
+    assert api_server.hits['/cached'] == 3
+
+
+def test_no_store_is_not_cached(api_client, api_server):
+    url = f'{api_server.url}/cached?cache_control=no-store'
+    first = fetch(api_client, url)
+    second = fetch(api_client, url)
+
+    # 没有缓存，第二次不带条件请求头，服务端返回完整响应
+    assert first['cache'] == second['cache'] == 'miss'
+    assert second['extracted_params'] == {'count': 2}
+    assert api_client.response_cache.stats()['entries'] == 0
+
+
+def test_only_enabled_get_steps_are_cached(api_client, api_server):
+    url = f'{api_server.url}/cached'
+    assert 'cache' not in fetch(api_client, url, cache=False)
+    assert 'cache' not in fetch(api_client, url, cache=False)
+    assert api_server.hits['/cached'] == 2
+    assert api_client.response_cache.stats()['entries'] == 0
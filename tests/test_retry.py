@@ -0,0 +1,81 @@
+# 线程执行引擎的重试测试：run_chain 把退避和限流等待交给调用方，RetryTimer 到期后继续执行
+
+import time
+
+import pytest
+
+from core import retry
+from core.api_client import ApiClient
+from core.host_guard import HostGuard
+from core.retry import RetryTimer
+
+
+@pytest.fixture(autouse=True)
+def unlimited_budget(monkeypatch):
+    """不限制重试预算，避免测试之间互相影响"""
+    monkeypatch.setattr(retry.retry_budget, 'capacity', 0)
+
+
+def drive(chain):
+    """像调度器一样驱动调用链，返回 (结果, yield 的等待时间, 在调用链内部花费的时间)"""
+    delays = []
+    inside = 0.0
+    while True:
+        started = time.monotonic()
+        try:
+            delay = next(chain)
+        except StopIteration as stop:
+            return stop.value, delays, inside + time.monotonic() - started
+        inside += time.monotonic() - started
+        delays.append(delay)
+        time.sleep(delay)
+
+
+def test_run_chain_yields_backoff(api_server):
+    api_client = ApiClient()
+    steps = [{
+        'name': 'flaky', 'url': f'{api_server.url}/flaky/backoff/2', 'method': 'GET',
+        'retry': {'max_retries': 3, 'base_delay': 0.1, 'max_delay': 1, 'jitter': False}
+    }]
+    result, delays, inside = drive(api_client.run_chain(steps))
+    api_client.close()
+
+    assert result['success'] and result['steps'][0]['attempts'] == 3
+    assert delays == [0.1, 0.2]
+    # 退避期间调用链没有在内部等待
+    assert inside < 0.2
+
+
+def test_parallel_rate_limit_wait_is_yielded(api_server):
+    api_client = ApiClient(host_guard=HostGuard(rate=4, burst=1, max_wait=5, breaker=False))
+    steps = [{'name': f'step{i}', 'url': f'{api_server.url}/ok', 'method': 'GET'} for i in range(2)]
+    result, delays, inside = drive(api_client.run_chain(steps, parallelism=2))
+    api_client.close()
+
+    assert result['success'] and api_server.hits['/ok'] == 2
+    # 第二个步骤要等 0.25 秒才有令牌，由调用方等待，不在步骤线程中 sleep
+    assert 0.2 < sum(delays) <= 0.25
+    assert inside < 0.2
+
+
+def test_retry_timer_runs_callbacks_when_due():
+    timer = RetryTimer()
+    called = []
+    timer.call_later(0.3, lambda: called.append('late'))
+    timer.call_later(0.05, lambda: called.append('early'))
+    time.sleep(0.15)
+    assert called == ['early']
+    time.sleep(0.3)
+    assert called == ['early', 'late']
+    timer.close()
+
+
+def test_retry_timer_close_runs_pending_callbacks():
+    timer = RetryTimer()
+    called = []
+    timer.call_later(30, lambda: called.append('pending'))
+    timer.close()
+    assert called == ['pending']
+    # 关闭后不再等待，立即调用
+    timer.call_later(30, lambda: called.append('after'))
+    assert called == ['pending', 'after']
@@ -0,0 +1,200 @@
+# 调度器测试：编译步骤缓存在任务更新时的一致性，重叠触发的并发策略，以及重试等待期间的并发控制
+
+import pytest
+
+from core import retry
+from core.api_client import ApiClient
+from core.cluster import ClusterNode, ClusterStore
+from core.logger import TaskLogger
+from core.scheduler import TaskScheduler
+from conftest import wait_for
+
+
+@pytest.fixture
+def scheduler(open_storage):
+    storage = open_storage()
+    api_client = ApiClient()
+    scheduler = TaskScheduler(storage, api_client, TaskLogger(storage))
+    yield scheduler
+    scheduler.shutdown()
+    api_client.close()
+
+
+def make_task(url):
+    return {
+        'name': 'task', 'type': 'cron', 'cron_expression': '0 0 1 1 *', 'status': 'active',
+        'steps': [{'name': 'step', 'url': url, 'method': 'GET'}]
+    }
+
+
+def test_update_recompiles_steps(scheduler):
+    task_id = scheduler.add_task(make_task('http://old'))
+    task = scheduler.get_task(task_id)
+    assert scheduler._get_compiled_steps(task)[0]['url'] == 'http://old'
+
+    scheduler.update_task(task_id, make_task('http://new'))
+    task = scheduler.get_task(task_id)
+    compiled = scheduler._get_compiled_steps(task)
+    assert compiled[0]['url'] == 'http://new'
+    assert scheduler._get_compiled_steps(task) is compiled
+
+
+def test_stale_compile_not_cached_after_update(scheduler, monkeypatch):
+    task_id = scheduler.add_task(make_task('http://old'))
+    stale = scheduler.get_task(task_id)
+    scheduler._invalidate_compiled_steps(task_id)
+
+    # 旧配置编译期间任务被更新，旧的编译结果照常返回给本次执行，但不能写入缓存
+    compile_steps = scheduler.api_client.compile_steps
+
+    def compile_during_update(steps, debug=False):
+        monkeypatch.setattr(scheduler.api_client, 'compile_steps', compile_steps)
+        scheduler.update_task(task_id, make_task('http://new'))
+        return compile_steps(steps, debug)
+
+    monkeypatch.setattr(scheduler.api_client, 'compile_steps', compile_during_update)
+    assert scheduler._get_compiled_steps(stale)[0]['url'] == 'http://old'
+    assert scheduler.compiled_steps[task_id][0][0]['url'] == 'http://new'
+
+    compiled = scheduler._get_compiled_steps(scheduler.get_task(task_id))
+    assert compiled[0]['url'] == 'http://new'
+    assert scheduler.compiled_steps[task_id][2] is compiled
+
+
+def test_next_firing_overlaps_retry_wait(open_storage, api_server, monkeypatch):
+    monkeypatch.setattr(retry.retry_budget, 'capacity', 0)
+    storage = open_storage()
+    api_client = ApiClient()
+    scheduler = TaskScheduler(storage, api_client, TaskLogger(storage), max_workers=1)
+    try:
+        flaky = make_task(f'{api_server.url}/flaky/overlap/1')
+        flaky['steps'][0]['retry'] = {'max_retries': 1, 'base_delay': 0.5, 'jitter': False}
+        flaky_id = scheduler.add_task(flaky)
+        other_id = scheduler.add_task(make_task(f'{api_server.url}/ok'))
+
+        assert scheduler._dispatch_task(scheduler.get_task(flaky_id))
+        wait_for(lambda: api_server.hits['/flaky/overlap/1'] == 1)
+
+        # 退避期间调用链仍算执行中，下一次触发按 skip 策略跳过
+        assert not scheduler._dispatch_task(scheduler.get_task(flaky_id))
+        # 唯一的工作线程没有被退避占用，其他任务照常执行
+        assert scheduler._dispatch_task(scheduler.get_task(other_id))
+        wait_for(lambda: scheduler.get_metrics()[other_id]['running'] == 0, timeout=0.4)
+        assert scheduler.get_metrics()[flaky_id]['running'] == 1
+
+        wait_for(lambda: scheduler.get_metrics()[flaky_id]['running'] == 0)
+        metrics = scheduler.get_metrics()[flaky_id]
+        assert metrics['executions'] == 1 and metrics['skipped'] == 1
+        assert api_server.hits['/flaky/overlap/1'] == 2
+        assert scheduler._dispatch_task(scheduler.get_task(flaky_id))
+    finally:
+        scheduler.shutdown()
+        api_client.close()
+
+
+def add_slow_task(scheduler, api_server, **options):
+    """添加一个执行约 0.3 秒的任务，返回任务配置"""
+    task = make_task(f'{api_server.url}/slow?delay=0.3')
+    task.update(options)
+    return scheduler.get_task(scheduler.add_task(task))
+
+
+def test_overlap_skip(scheduler, api_server):
+    task = add_slow_task(scheduler, api_server, overlap_policy='skip')
+    assert scheduler._dispatch_task(task)
+    assert not scheduler._dispatch_task(task)
+
+    wait_for(lambda: scheduler.get_metrics()[task['id']]['running'] == 0)
+    metrics = scheduler.get_metrics()[task['id']]
+    assert metrics['executions'] == 1 and metrics['skipped'] == 1
+    assert api_server.hits['/slow'] == 1
+
+
+def test_overlap_queue_runs_one_at_a_time(scheduler, api_server):
+    task = add_slow_task(scheduler, api_server, overlap_policy='queue')
+    assert all(scheduler._dispatch_task(task) for _ in range(3))
+    metrics = scheduler.get_metrics()[task['id']]
+    assert metrics['running'] == 1 and metrics['pending'] == 2
+
+    wait_for(lambda: scheduler.get_metrics()[task['id']]['executions'] == 2)
+    assert scheduler.get_metrics()[task['id']]['pending'] == 1
+    wait_for(lambda: scheduler.get_metrics()[task['id']]['running'] == 0)
+    metrics = scheduler.get_metrics()[task['id']]
+    assert metrics['executions'] == 3 and metrics['skipped'] == 0
+    # 排队的执行依次等待上一次结束
+    assert metrics['queue_wait_max'] >= 0.5
+
+
+def test_overlap_queue_limited_by_max_pending(open_storage, api_server):
+    storage = open_storage()
+    api_client = ApiClient()
+    scheduler = TaskScheduler(storage, api_client, TaskLogger(storage), max_pending=1)
+    try:
+        task = add_slow_task(scheduler, api_server, overlap_policy='queue')
+        assert [scheduler._dispatch_task(task) for _ in range(3)] == [True, True, False]
+        assert scheduler.get_metrics()[task['id']]['skipped'] == 1
+    finally:
+        scheduler.shutdown()
+        api_client.close()
+
+
+def test_overlap_allow_runs_concurrently(scheduler, api_server):
+    task = add_slow_task(scheduler, api_server, overlap_policy='allow')
+    assert all(scheduler._dispatch_task(task) for _ in range(3))
+    assert scheduler.get_metrics()[task['id']]['running'] == 3
+    wait_for(lambda: api_server.hits['/slow'] == 3, timeout=0.25)
+    wait_for(lambda: scheduler.get_metrics()[task['id']]['running'] == 0)
+
+
+def test_max_instances(scheduler, api_server):
+    task = add_slow_task(scheduler, api_server, overlap_policy='skip', max_instances=2)
+    assert [scheduler._dispatch_task(task) for _ in range(3)] == [True, True, False]
+    wait_for(lambda: api_server.hits['/slow'] == 2, timeout=0.25)
+    wait_for(lambda: scheduler.get_metrics()[task['id']]['running'] == 0)
+    assert scheduler.get_metrics()[task['id']]['executions'] == 2
+
+
+def test_manual_run_queues_behind_running_execution(scheduler, api_server):
+    task = add_slow_task(scheduler, api_server, overlap_policy='skip')
+    assert scheduler._dispatch_task(task)
+    # 手动触发不受 skip 策略影响，排队等待
+    assert scheduler.run_task_now(task['id'])
+    assert scheduler.get_metrics()[task['id']]['pending'] == 1
+    wait_for(lambda: scheduler.get_metrics()[task['id']]['executions'] == 2)
+    assert scheduler.get_metrics()[task['id']]['skipped'] == 0
+
+
+def test_shutdown_notifies_dropped_queued_runs(open_storage, api_server):
+    storage = open_storage()
+    api_client = ApiClient()
+    scheduler = TaskScheduler(storage, api_client, TaskLogger(storage))
+    finished = []
+    try:
+        task = add_slow_task(scheduler, api_server, overlap_policy='queue')
+        for i in range(3):
+            assert scheduler._dispatch_task(task, on_finish=lambda state, i=i: finished.append((i, state)))
+    finally:
+        scheduler.shutdown()
+        api_client.close()
+
+    # 执行中的正常结束，排队中的被丢弃，同样通知调用方
+    assert finished == [(0, 'done'), (1, 'abandoned'), (2, 'abandoned')]
+    assert api_server.hits['/slow'] == 1
+
+
+def test_cluster_firing_finished_after_run(open_storage, api_server, tmp_path):
+    storage = open_storage()
+    api_client = ApiClient()
+    store = ClusterStore(str(tmp_path / 'cluster.db'), 'node-a')
+    store.heartbeat()
+    scheduler = TaskScheduler(storage, api_client, TaskLogger(storage), cluster=ClusterNode(store))
+    try:
+        task = add_slow_task(scheduler, api_server)
+        assert store.enqueue(task, 'allow', fenced=False)
+        [(firing_id, task_id)] = store.claim(1)
+        scheduler.run_firing(firing_id, task_id)
+        assert store.stats()['firings'] == {'running': 1}
+        wait_for(lambda: store.stats()['firings'] == {'done': 1})
+    finally:
+        scheduler.shutdown()
+        api_client.close()
@@ -0,0 +1,90 @@
+# 存储模块测试：日志索引与分段文件的同步、按日志ID游标翻页
+
+import os
+
+from conftest import close_storage, make_log
+
+
+def indexed_ids(storage):
+    """索引中的全部日志ID，从小到大"""
+    return sorted(row[0] for row in storage.log_index.query(limit=-1, columns=('id',)))
+
+
+def stored_ids(storage):
+    """分段文件中的全部日志ID，按写入顺序"""
+    return [log['id'] for segment in storage.log_store.segments
+            for log, _, _ in storage.log_store.scan_segment(segment)]
+
+
+def test_sync_fills_missing_index_entries(open_storage):
+    storage = open_storage(log_segment_max_bytes=2048)
+    storage.add_logs([make_log(i) for i in range(30)])
+    # 模拟写完分段、还没写索引时进程退出
+    locations = storage.log_store.append_many([make_log(i) for i in range(30, 60)])
+    assert locations
+    close_storage(storage)
+
+    storage = open_storage(log_segment_max_bytes=2048)
+    assert indexed_ids(storage) == stored_ids(storage) == list(range(1, 61))
+
+
+def test_sync_skips_empty_newest_segment(open_storage):
+    storage = open_storage(log_segment_max_bytes=2048)
+    storage.add_logs([make_log(i) for i in range(30)])
+    storage.log_store.append_many([make_log(i) for i in range(30, 60)])
+    close_storage(storage)
+
+    # 滚动出的新分段还没有写入内容，不能据此认为索引已经完整
+    newest = storage.log_store.segments[-1] + 1
+    open(os.path.join(storage.logs_dir, f'segment-{newest:06d}.jsonl'), 'wb').close()
+
+    storage = open_storage(log_segment_max_bytes=2048)
+    assert storage.log_store.segments[-1] == newest
+    assert indexed_ids(storage) == stored_ids(storage) == list(range(1, 61))
+
+
+def test_sync_rebuilds_index_ahead_of_segments(open_storage):
+    storage = open_storage(log_segment_max_bytes=2048)
+    storage.add_logs([make_log(i) for i in range(30)])
+    close_storage(storage)
+
+    # 最新的分段被删除，索引中的ID超前于分段文件，按剩余分段整体重建
+    os.remove(storage.log_store._segment_path(storage.log_store.segments[-1]))
+    storage = open_storage(log_segment_max_bytes=2048)
+    remaining = stored_ids(storage)
+    assert 0 < len(remaining) < 30
+    assert indexed_ids(storage) == remaining
+
+
+def test_scan_logs_pages_by_id(open_storage):
+    storage = open_storage(log_segment_max_bytes=2048)
+    storage.add_logs([make_log(i) for i in range(45)])
+
+    # 从最新一条开始向更早翻页
+    pages = []
+    before_id, has_more = None, True
+    while has_more:
+        logs, has_more = storage.scan_logs(before_id=before_id, limit=20)
+        pages.append([log['id'] for log in logs])
+        before_id = logs[-1]['id']
+    assert pages == [list(range(45, 25, -1)), list(range(25, 5, -1)), list(range(5, 0, -1))]
+
+    # 从中间向更新翻页，返回紧接游标之后的一页，仍按ID倒序
+    logs, has_more = storage.scan_logs(after_id=5, limit=20)
+    assert [log['id'] for log in logs] == list(range(25, 5, -1)) and has_more
+    logs, has_more = storage.scan_logs(after_id=25, limit=20)
+    assert [log['id'] for log in logs] == list(range(45, 25, -1)) and not has_more
+
+
+def test_scan_logs_filters_and_projects_from_index(open_storage):
+    storage = open_storage()
+    storage.add_logs([make_log(i) for i in range(40)])
+
+    logs, has_more = storage.scan_logs(task_id=3, status='success', limit=2, fields=['id', 'status'])
+    assert logs == [{'id': 33, 'status': 'success'}, {'id': 23, 'status': 'success'}] and has_more
+    assert storage.count_logs(task_id=3, status='success') == 4
+
+    # 只取摘要字段时直接从索引读取，不读取分段文件
+    storage.log_store.read_many = None
+    logs, _ = storage.scan_logs(limit=1, fields=['id', 'task_name', 'message'])
+    assert logs == [{'id': 40, 'task_name': 'task-10', 'message': '步骤 39 执行成功'}]
@@ -0,0 +1,48 @@
+# 流式解析测试：边读边提取、缓冲上限和未安装 ijson 时的退化
+
+import json
+import logging
+
+import pytest
+
+from core import stream
+from core.stream import ResponseTooLarge, StreamExtractor, check_streaming
+
+RESPONSE = json.dumps({'data': {'items': [{'id': 1}, {'id': 2}], 'token': 'x' * 1000}}).encode('utf-8')
+
+
+def feed(extractor, data, chunk_size=7):
+    for start in range(0, len(data), chunk_size):
+        extractor.feed(data[start:start + chunk_size])
+        if extractor.done:
+            break
+    return extractor.close()
+
+
+def test_simple_paths_streamed():
+    pytest.importorskip('ijson')
+    extractor = StreamExtractor(['$.data.items[1].id', '$.data.items'], buffer_max_bytes=10)
+    assert extractor.streaming
+    assert feed(extractor, RESPONSE) == {'$.data.items[1].id': 2, '$.data.items': [{'id': 1}, {'id': 2}]}
+
+
+def test_complex_path_limited_by_buffer():
+    extractor = StreamExtractor(['$.data.items[*].id'], max_bytes=10 * 1024, buffer_max_bytes=100)
+    assert not extractor.streaming
+    with pytest.raises(ResponseTooLarge):
+        feed(extractor, RESPONSE)
+
+    extractor = StreamExtractor(['$.data.items[*].id'], buffer_max_bytes=len(RESPONSE))
+    assert feed(extractor, RESPONSE) == {'$.data.items[*].id': 1}
+
+
+def test_fallback_without_ijson(monkeypatch, caplog):
+    monkeypatch.setattr(stream, 'ijson', None)
+    extractor = StreamExtractor(['$.data.token'], max_bytes=0, buffer_max_bytes=100)
+    assert not extractor.streaming
+    with pytest.raises(ResponseTooLarge):
+        feed(extractor, RESPONSE)
+
+    with caplog.at_level(logging.WARNING):
+        assert check_streaming(100) is False
+    assert any('ijson' in record.getMessage() for record in caplog.records)
@@ -0,0 +1,31 @@
+# 模板编译测试：JSON路径编译缓存在任务之间共用
+
+from core.template import CompiledStep, JsonPathCache, compile_steps, jsonpath_cache
+
+
+def test_shared_path_survives_other_task_update():
+    first = compile_steps([{'url': 'http://a', 'extract_params': [{'name': 'token', 'path': '$.data.token'}]}])
+    second = compile_steps([{'url': 'http://b', 'extract_params': [{'name': 'token', 'path': '$.data.token'}]}])
+
+    # 第一个任务被更新后丢弃编译结果，第二个任务仍然使用同一个编译好的表达式
+    del first
+    expr = second[0].extract_exprs['$.data.token']
+    assert jsonpath_cache.get('$.data.token') is expr
+    assert [match.value for match in expr.find({'data': {'token': 'x'}})] == ['x']
+
+
+def test_cache_bounded_by_lru():
+    cache = JsonPathCache(maxsize=2)
+    a = cache.get('$.a')
+    cache.get('$.b')
+    cache.get('$.a')
+    cache.get('$.c')
+    assert list(cache.expressions) == ['$.a', '$.c']
+    assert cache.get('$.a') is a
+
+
+def test_compiled_step_keeps_expression_after_eviction():
+    step = CompiledStep({'url': 'http://a', 'extract_params': [{'name': 'id', 'path': '$.evicted.id'}]})
+    jsonpath_cache.clear()
+    expr = step.extract_exprs['$.evicted.id']
+    assert [match.value for match in expr.find({'evicted': {'id': 1}})] == [1]
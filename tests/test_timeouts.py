@@ -0,0 +1,136 @@
+# 超时测试：连接、读取和总超时，调用链截止时间，以及步骤的 timeout 字段覆盖任务设置
+
+import socket
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from core import timeouts
+from core.api_client import ApiClient
+
+
+@pytest.fixture
+def api_client():
+    client = ApiClient()
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def stalled_url():
+    """只监听不接受连接、等待队列已占满的端口，新的连接请求得不到响应"""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(0)
+    port = server.getsockname()[1]
+    clients = []
+    for _ in range(4):
+        client = socket.socket()
+        client.setblocking(False)
+        client.connect_ex(('127.0.0.1', port))
+        clients.append(client)
+    yield f'http://127.0.0.1:{port}/'
+    for sock in clients + [server]:
+        sock.close()
+
+
+def run_step(api_client, url, timeout):
+    """执行单个步骤，返回 (步骤结果, 耗时)"""
+    started = time.monotonic()
+    result = api_client.execute_step({'name': 'step', 'url': url, 'method': 'GET', 'timeout': timeout})
+    return result, time.monotonic() - started
+
+
+def test_connect_timeout(api_client, stalled_url):
+    result, elapsed = run_step(api_client, stalled_url, {'connect': 0.2, 'read': 5})
+    assert result['error_type'] == 'timeout' and result['error'] == '请求超时(连接)'
+    assert 0.15 < elapsed < 1
+
+
+def test_read_timeout(api_client, api_server):
+    result, elapsed = run_step(api_client, f'{api_server.url}/slow?delay=0.5', {'connect': 1, 'read': 0.1})
+    assert result['error_type'] == 'timeout' and result['error'] == '请求超时(读取)'
+    assert result['timeouts'] == {'connect': 1, 'read': 0.1, 'total': 0}
+    assert elapsed < 0.4
+
+
+def test_total_timeout_cuts_trickling_response(api_client, api_server):
+    # 每 0.05 秒收到一个字节，读取超时不会触发，总超时到期后中断
+    url = f'{api_server.url}/drip?interval=0.05&size=20'
+    result, elapsed = run_step(api_client, url, {'read': 0.5, 'total': 0.3})
+    assert result['error_type'] == 'timeout' and result['error'] == '请求超时(总时间超过 0.3 秒)'
+    assert 0.25 < elapsed < 0.7
+
+    result, _ = run_step(api_client, url, {'read': 0.5})
+    assert result['success'] and result['response'] == 'x' * 20
+
+
+def test_step_timeout_overrides_task(api_client, api_server):
+    steps = [
+        {'name': 'patient', 'url': f'{api_server.url}/slow?delay=0.3', 'method': 'GET', 'timeout': {'read': 2}},
+        {'name': 'default', 'url': f'{api_server.url}/slow?delay=0.3', 'method': 'GET'}
+    ]
+    result = api_client.execute_chain(steps, retry_times=0, timeout={'read': 0.1})
+    patient, default = [entry['result'] for entry in result['steps']]
+    assert patient['success'] and patient['timeouts']['read'] == 2
+    assert not default['success'] and default['error'] == '请求超时(读取)'
+    assert default['timeouts']['read'] == 0.1
+    assert result['error'] == '步骤2失败: 请求超时(读取)'
+
+
+def test_chain_deadline_caps_request(api_client, api_server):
+    steps = [{'name': 'slow', 'url': f'{api_server.url}/slow?delay=1', 'method': 'GET', 'timeout': {'read': 5}}]
+    started = time.monotonic()
+    result = api_client.execute_chain(steps, retry_times=0, timeout={'chain': 0.3})
+    elapsed = time.monotonic() - started
+
+    step_result = result['steps'][0]['result']
+    assert not result['success'] and step_result['error_type'] == 'timeout'
+    assert 0 < step_result['timeouts']['total'] <= 0.3
+    assert elapsed < 0.7
+
+
+def test_chain_deadline_skips_retry(api_client, api_server):
+    steps = [
+        {'name': 'flaky', 'url': f'{api_server.url}/flaky/deadline/1', 'method': 'GET',
+         'retry': {'max_retries': 3, 'base_delay': 0.5, 'jitter': False}},
+        {'name': 'next', 'url': f'{api_server.url}/ok', 'method': 'GET'}
+    ]
+    # 退避后会超过截止时间，不再重试
+    started = time.monotonic()
+    result = api_client.execute_chain(steps, timeout={'chain': 0.3})
+    assert time.monotonic() - started < 0.3
+    assert result['steps'][0]['attempts'] == 1 and result['error'].startswith('步骤1失败')
+    assert api_server.hits['/ok'] == 0
+
+
+def test_chain_deadline_cancels_remaining_steps(api_client, api_server, monkeypatch):
+    clock = SimpleNamespace(offset=0)
+    clock.monotonic = lambda: time.monotonic() + clock.offset
+    monkeypatch.setattr(timeouts, 'time', clock)
+
+    execute_step = api_client.execute_step
+
+    def late_step(*args, **kwargs):
+        result = execute_step(*args, **kwargs)
+        clock.offset += 1  # 步骤结束时已超过调用链截止时间
+        return result
+
+    monkeypatch.setattr(api_client, 'execute_step', late_step)
+    steps = [{'name': name, 'url': f'{api_server.url}/ok', 'method': 'GET'} for name in ('first', 'second', 'third')]
+    result = api_client.execute_chain(steps, timeout={'chain': 0.5})
+    assert not result['success'] and len(result['steps']) == 1
+    assert result['error'] == '调用链执行超过 0.5 秒，剩余 2 个步骤已取消'
+    assert api_server.hits['/ok'] == 1
+
+
+def test_new_connection_records_dns_and_connect(api_client, api_server):
+    # 单独计时域名解析依赖 urllib3 的私有实现，升级 urllib3 后应仍能记录
+    url = api_server.url.replace('127.0.0.1', 'localhost')
+    first, _ = run_step(api_client, f'{url}/ok', None)
+    assert first['success'] and {'dns', 'connect'} <= set(first['timings'])
+
+    # 复用长连接时不再记录
+    second, _ = run_step(api_client, f'{url}/ok', None)
+    assert second['success'] and 'dns' not in second['timings']
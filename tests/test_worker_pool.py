@@ -0,0 +1,77 @@
+# 多进程执行引擎测试：调用链在工作进程中执行，结果和日志回到主进程，重试等待不占用工作进程
+
+import multiprocessing
+import time
+
+import pytest
+
+from core import retry
+from core.api_client import ApiClient
+from core.logger import TaskLogger
+from core.scheduler import TaskScheduler
+from core.worker_pool import WorkerPool
+from conftest import wait_for
+
+pytestmark = pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='需要 fork')
+
+
+@pytest.fixture
+def worker_pool(monkeypatch):
+    """单个工作进程，fork 前关闭重试预算，工作进程中同样不限制"""
+    monkeypatch.setattr(retry.retry_budget, 'capacity', 0)
+    pool = WorkerPool(1)
+    yield pool
+    pool.close()
+
+
+def test_task_runs_on_pool_and_logs_in_parent(open_storage, worker_pool, api_server):
+    storage = open_storage()
+    api_client = ApiClient()
+    scheduler = TaskScheduler(storage, api_client, TaskLogger(storage), worker_pool=worker_pool)
+    try:
+        task_id = scheduler.add_task({
+            'name': 'pool', 'type': 'cron', 'cron_expression': '0 0 1 1 *', 'status': 'paused',
+            'steps': [
+                {'name': 'login', 'url': f'{api_server.url}/ok?token=abc', 'method': 'GET',
+                 'extract_params': [{'name': 'token', 'path': '$.query.token'}]},
+                {'name': 'user', 'url': f'{api_server.url}/ok?t=${{token}}', 'method': 'GET'}
+            ]
+        })
+        assert scheduler.run_task_now(task_id)
+        wait_for(lambda: any(log['event'] == 'complete' for log in storage.load_logs(task_id=task_id)))
+    finally:
+        scheduler.shutdown()
+        api_client.close()
+
+    logs = storage.load_logs(task_id=task_id)
+    assert [log['status'] for log in logs if log['event'] == 'complete'] == ['success']
+    steps = sorted((log['details'] for log in logs if log['event'] == 'step'), key=lambda step: step['step_index'])
+    assert [step['step_name'] for step in steps] == ['login', 'user']
+    assert steps[1]['extracted_params'] == {} and steps[1]['response']['query'] == {'t': 'abc'}
+    assert api_server.hits['/ok'] == 2
+
+
+def test_retry_wait_does_not_hold_worker(worker_pool, api_server):
+    retry_step = {
+        'name': 'flaky', 'url': f'{api_server.url}/flaky/pool/1', 'method': 'GET',
+        'retry': {'max_retries': 1, 'base_delay': 0.5, 'jitter': False}
+    }
+    started = time.monotonic()
+    flaky = worker_pool.submit_chain([retry_step])
+    time.sleep(0.1)
+    quick = worker_pool.submit_chain([{'name': 'ok', 'url': f'{api_server.url}/ok', 'method': 'GET'}])
+
+    # 唯一的工作进程在前一个调用链退避期间执行了后投递的调用链
+    assert quick.result(timeout=5)['success']
+    assert time.monotonic() - started < 0.4
+    assert not flaky.done()
+
+    result = flaky.result(timeout=5)
+    assert result['success'] and result['steps'][0]['attempts'] == 2
+    assert time.monotonic() - started >= 0.5
+
+
+def test_worker_errors_come_back_as_exceptions(worker_pool):
+    future = worker_pool.submit_chain(None)
+    with pytest.raises(TypeError):
+        future.result(timeout=5)